@@ -0,0 +1,192 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from constants import BASE_K_VALUES, CREATED_DATA_DIR, K_VALUE_BONUSES, MAJOR_REGION_MODIFIERS, REGION_ELO_MODIFIERS
+from elo import get_weighted_k_value, reference_data
+from game_stream import get_sorted_tournaments, get_tournament_k_features, read_tournament_games
+from rating_engine import RatingEngine
+from rating_history import to_days
+
+BACKTEST_RESULTS_PATH = f"{CREATED_DATA_DIR}/backtest_results.csv"
+
+BASE_K_VALUE_NAMES = list(BASE_K_VALUES)
+K_FEATURE_NAMES = list(K_VALUE_BONUSES)
+REGION_NAMES = list(REGION_ELO_MODIFIERS)
+
+
+def get_default_parameters() -> Dict[str, float]:
+    """Current model constants, flattened as `<CONSTANT>.<key>` so a parameter set can override any of them."""
+    parameters = {}
+    for constant_name, values in [
+        ("BASE_K_VALUES", BASE_K_VALUES),
+        ("MAJOR_REGION_MODIFIERS", MAJOR_REGION_MODIFIERS),
+        ("REGION_ELO_MODIFIERS", REGION_ELO_MODIFIERS),
+        ("K_VALUE_BONUSES", K_VALUE_BONUSES),
+    ]:
+        for key, value in values.items():
+            parameters[f"{constant_name}.{key}"] = value
+    return parameters
+
+
+def build_game_table(by_date: Optional[str] = None) -> pd.DataFrame:
+    """Every rated game in global game order (see `game_stream.merge_tournament_games`) with the
+    inputs of its weighted K value: base K name, loser's region and K features."""
+    tournament_tables = []
+    rated_teams = set()
+    for tournament_order, (league_id, tournament_slug, _) in enumerate(get_sorted_tournaments(by_date)):
+        tournament_df = read_tournament_games(league_id, tournament_slug)
+        tournament_tables.append(
+            pd.concat(
+                [
+                    pd.DataFrame(
+                        {
+                            "game_date": tournament_df["game_date"],
+                            "game_number": tournament_df["game_number"],
+                            "tournament_order": tournament_order,
+                            "position": np.arange(tournament_df.shape[0]),
+                            "league_id": league_id,
+                            "tournament_slug": tournament_slug,
+                            "winner": tournament_df["winning_team"],
+                            "loser": tournament_df["losing_team"],
+                        }
+                    ),
+                    get_tournament_k_features(tournament_df, rated_teams),
+                ],
+                axis=1,
+            )
+        )
+
+    game_table = pd.concat(tournament_tables, ignore_index=True)
+    if by_date:
+        game_table = game_table[game_table["game_date"] < by_date]
+    game_table = game_table.sort_values(
+        by=["game_date", "game_number", "tournament_order", "position"], kind="stable", ignore_index=True
+    )
+    game_table["loser_league"] = game_table["loser"].map(reference_data.get_team_league)
+    return game_table
+
+
+def get_game_table_arrays(game_table: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Dense numeric encoding of the game table, everything `replay_game_table` needs."""
+    teams = sorted(set(game_table["winner"]) | set(game_table["loser"]))
+    team_to_id = {team: team_id for team_id, team in enumerate(teams)}
+    region_to_id = {region: region_id for region_id, region in enumerate(REGION_NAMES)}
+    base_k_to_id = {name: base_k_id for base_k_id, name in enumerate(BASE_K_VALUE_NAMES)}
+
+    return {
+        "winner_ids": game_table["winner"].map(team_to_id).to_numpy(dtype=np.int64),
+        "loser_ids": game_table["loser"].map(team_to_id).to_numpy(dtype=np.int64),
+        "team_region_ids": np.array(
+            [region_to_id[reference_data.get_team_league(team)] for team in teams], dtype=np.int64
+        ),
+        "loser_region_ids": game_table["loser_league"].map(region_to_id).to_numpy(dtype=np.int64),
+        "base_k_ids": game_table["base_k_value_name"].map(base_k_to_id).to_numpy(dtype=np.int64),
+        "k_features": game_table[K_FEATURE_NAMES].to_numpy(dtype=np.float64),
+        "days": to_days(game_table["game_date"]),
+    }
+
+
+def replay_game_table(
+    arrays: Dict[str, np.ndarray], parameter_overrides: Optional[Dict[str, float]] = None
+) -> np.ndarray:
+    """Rates every game of the table in order and returns the pre-game expected win probability of each
+    game's winner. Every team starts at its region's ELO. With no overrides the ratings are the same as
+    `game_stream.process_global_ratings`."""
+    parameters = dict(get_default_parameters(), **(parameter_overrides or {}))
+
+    base_k_values = np.array([parameters[f"BASE_K_VALUES.{name}"] for name in BASE_K_VALUE_NAMES])
+    region_modifiers = np.array([parameters[f"MAJOR_REGION_MODIFIERS.{region}"] for region in REGION_NAMES])
+    region_elos = np.array([parameters[f"REGION_ELO_MODIFIERS.{region}"] for region in REGION_NAMES])
+    k_value_bonuses = {name: parameters[f"K_VALUE_BONUSES.{name}"] for name in K_FEATURE_NAMES}
+    k_features = {name: arrays["k_features"][:, index] for index, name in enumerate(K_FEATURE_NAMES)}
+
+    k_values = get_weighted_k_value(
+        base_k_values[arrays["base_k_ids"]], region_modifiers[arrays["loser_region_ids"]], k_features, k_value_bonuses
+    )
+
+    # ratings only move once a team plays, so every team can be registered up front
+    engine = RatingEngine(initial_capacity=arrays["team_region_ids"].shape[0])
+    for team_id, initial_elo in enumerate(region_elos[arrays["team_region_ids"]].tolist()):
+        engine.add_team(str(team_id), initial_elo)
+    return engine.replay(arrays["winner_ids"], arrays["loser_ids"], k_values, return_expected=True)
+
+
+def get_prediction_metrics(
+    expected_wins: np.ndarray, group_ids: Optional[np.ndarray] = None, num_groups: int = 1
+) -> Dict[str, np.ndarray]:
+    """Scores pre-game predictions, per group when `group_ids` (0..num_groups-1, one per game) is given.
+
+    `expected_wins` is the probability the model gave the team that actually won, so a game counts as
+    correctly predicted when it is above 0.5 (an even 0.5, e.g. two new teams, is not a correct pick).
+    """
+    if group_ids is None:
+        group_ids = np.zeros(expected_wins.shape[0], dtype=np.int64)
+
+    num_games = np.bincount(group_ids, minlength=num_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "num_games": num_games,
+            "accuracy": np.bincount(group_ids, weights=expected_wins > 0.5, minlength=num_groups) / num_games,
+            "log_loss": np.bincount(group_ids, weights=-np.log(expected_wins), minlength=num_groups) / num_games,
+            "brier_score": np.bincount(group_ids, weights=(1 - expected_wins) ** 2, minlength=num_groups) / num_games,
+        }
+
+
+def get_grouped_metrics(expected_wins: np.ndarray, groups: pd.Series, group_type: str) -> pd.DataFrame:
+    group_ids, group_names = pd.factorize(groups, sort=True)
+    return pd.DataFrame(
+        {
+            "group_type": group_type,
+            "group": group_names,
+            **get_prediction_metrics(expected_wins, group_ids, len(group_names)),
+        }
+    )
+
+
+def run_backtest(
+    by_date: Optional[str] = None,
+    from_date: Optional[str] = None,
+    window: str = "M",
+    parameter_overrides: Optional[Dict[str, float]] = None,
+    output_file: Optional[str] = BACKTEST_RESULTS_PATH,
+) -> pd.DataFrame:
+    """Replays every game, recording the expected win probability before each one, and scores the
+    predictions overall, by league, by tournament and by time window.
+
+    Args:
+        by_date (str, optional): only replay games played before this date.
+        from_date (str, optional): only score games played on or after this date, earlier games still
+            update the ratings. Useful to skip the warm up period where most teams sit at their region ELO.
+        window (str): numpy datetime unit of the time windows, "Y", "M" or "D".
+        parameter_overrides (dict, optional): `<CONSTANT>.<key>` -> value, see `get_default_parameters`.
+    """
+    game_table = build_game_table(by_date)
+    expected_wins = replay_game_table(get_game_table_arrays(game_table), parameter_overrides)
+
+    if from_date:
+        is_scored = (game_table["game_date"] >= from_date).to_numpy()
+        game_table, expected_wins = game_table[is_scored], expected_wins[is_scored]
+
+    windows = to_days(game_table["game_date"]).astype("datetime64[D]").astype(f"datetime64[{window}]").astype(str)
+    results_df = pd.concat(
+        [
+            get_grouped_metrics(expected_wins, pd.Series("all", index=game_table.index), "overall"),
+            get_grouped_metrics(
+                expected_wins, game_table["league_id"].astype(int).map(reference_data.get_league_name), "league"
+            ),
+            get_grouped_metrics(
+                expected_wins, game_table["league_id"] + "/" + game_table["tournament_slug"], "tournament"
+            ),
+            get_grouped_metrics(expected_wins, pd.Series(windows), "window"),
+        ],
+        ignore_index=True,
+    )
+    if output_file:
+        results_df.to_csv(output_file, index=False)
+    return results_df
+
+
+if __name__ == "__main__":
+    results = run_backtest()
+    print(results[results["group_type"].isin(["overall", "league"])])
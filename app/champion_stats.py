@@ -0,0 +1,131 @@
+import json
+import os
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+from constants import BLUE_CHAMPION_COLUMNS, CHAMPION_STATS_PATH, MAPPED_GAMES_DIR, RED_CHAMPION_COLUMNS
+from mapped_games import get_stored_tournaments, read_mapped_games
+
+CHAMPION_STATS_COLUMNS = ["league_id", "tournament_slug", "side", "role", "champion", "games", "wins"]
+CHAMPION_STATS_DTYPES = {
+    "league_id": str,
+    "tournament_slug": str,
+    "side": "int16",
+    "role": str,
+    "champion": str,
+    "games": "int64",
+    "wins": "int64",
+}
+# "1_100_top_championName" -> 100 and "top"
+CHAMPION_COLUMN_SIDES = {
+    column: int(column.split("_")[1]) for column in [*BLUE_CHAMPION_COLUMNS, *RED_CHAMPION_COLUMNS]
+}
+CHAMPION_COLUMN_ROLES = {column: column.split("_")[2] for column in [*BLUE_CHAMPION_COLUMNS, *RED_CHAMPION_COLUMNS]}
+
+
+def get_champion_stats(tournaments: Optional[Iterable[Tuple[str, str]]] = None) -> pd.DataFrame:
+    """Games played and won by every champion, per tournament, side and role.
+
+    The champion columns of every tournament are melted into one long (tournament, column, champion) frame and
+    counted with a single groupby. Rows of a role are in the order champions were first picked in it.
+
+    Args:
+        tournaments (iterable, optional): (league_id, tournament_slug) pairs, every stored tournament when None.
+    """
+    if tournaments is None:
+        tournaments = get_stored_tournaments()
+    tournament_dfs = {
+        (league_id, tournament_slug): read_mapped_games(
+            league_id, tournament_slug, columns=["game_winner", *CHAMPION_COLUMN_SIDES]
+        )
+        for league_id, tournament_slug in tournaments
+    }
+    if not tournament_dfs:
+        return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in CHAMPION_STATS_DTYPES.items()})
+
+    games_df = pd.concat(tournament_dfs, names=["league_id", "tournament_slug", None]).reset_index(level=[0, 1])
+    picks_df = games_df.melt(
+        id_vars=["league_id", "tournament_slug", "game_winner"],
+        value_vars=list(CHAMPION_COLUMN_SIDES),
+        var_name="column",
+        value_name="champion",
+    )
+    picks_df["side"] = picks_df["column"].map(CHAMPION_COLUMN_SIDES)
+    picks_df["role"] = picks_df["column"].map(CHAMPION_COLUMN_ROLES)
+    picks_df["win"] = picks_df["game_winner"] == picks_df["side"]
+
+    champion_stats_df = (
+        picks_df.groupby(["league_id", "tournament_slug", "column", "champion"], sort=False)
+        .agg(side=("side", "first"), role=("role", "first"), games=("win", "size"), wins=("win", "sum"))
+        .reset_index()
+    )
+    # melting goes column by column, the table is kept grouped by tournament instead
+    champion_stats_df.sort_values(by=["league_id", "tournament_slug"], kind="stable", inplace=True, ignore_index=True)
+    return champion_stats_df[CHAMPION_STATS_COLUMNS].astype(CHAMPION_STATS_DTYPES)
+
+
+def write_champion_stats(champion_stats_df: pd.DataFrame, path: str = CHAMPION_STATS_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    champion_stats_df.to_parquet(f"{path}.tmp", engine="pyarrow", index=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_champion_stats(
+    league_id: Optional[str] = None, tournament_slug: Optional[str] = None, path: str = CHAMPION_STATS_PATH
+) -> pd.DataFrame:
+    """Stored champion statistics, of a single tournament when given."""
+    filters = None
+    if league_id is not None and tournament_slug is not None:
+        filters = [("league_id", "==", league_id), ("tournament_slug", "==", tournament_slug)]
+    return pd.read_parquet(path, engine="pyarrow", filters=filters)
+
+
+def get_champion_mapping(champion_stats_df: pd.DataFrame) -> dict:
+    """Statistics of a single tournament in the `_champion_mapping.json` format: side -> role -> list of
+    {champion: games played, "winRate": percentage of them won}, most played first."""
+    champion_mapping = {"100": {}, "200": {}}
+    for column, side in CHAMPION_COLUMN_SIDES.items():
+        champion_mapping[str(side)][CHAMPION_COLUMN_ROLES[column]] = []
+    for (side, role), role_df in champion_stats_df.groupby(["side", "role"], sort=False):
+        role_df = role_df.sort_values(by="games", ascending=False, kind="stable")
+        champion_mapping[str(side)][role] = [
+            {champion: games, "winRate": (wins / games) * 100}
+            for champion, games, wins in zip(
+                role_df["champion"].tolist(), role_df["games"].tolist(), role_df["wins"].tolist()
+            )
+        ]
+    return champion_mapping
+
+
+def write_champion_mappings(champion_stats_df: pd.DataFrame) -> List[Tuple[str, str]]:
+    """Writes `mapped-games/<league_id>/<tournament_slug>_champion_mapping.json` for every tournament of the
+    statistics, as read by `feature_utils.get_op_champions`. Returns the tournaments written."""
+    written_tournaments = []
+    for (league_id, tournament_slug), tournament_stats_df in champion_stats_df.groupby(
+        ["league_id", "tournament_slug"], sort=False
+    ):
+        os.makedirs(f"{MAPPED_GAMES_DIR}/{league_id}", exist_ok=True)
+        with open(f"{MAPPED_GAMES_DIR}/{league_id}/{tournament_slug}_champion_mapping.json", "w") as file:
+            json.dump(get_champion_mapping(tournament_stats_df), file)
+        written_tournaments.append((league_id, tournament_slug))
+    return written_tournaments
+
+
+def update_champion_stats(tournaments: Optional[Iterable[Tuple[str, str]]] = None) -> pd.DataFrame:
+    """Recomputes the statistics of the given tournaments (every stored one when None), merges them into the stored
+    table and rewrites their champion mappings."""
+    tournaments = None if tournaments is None else list(tournaments)
+    updated_stats_df = get_champion_stats(tournaments)
+    champion_stats_df = updated_stats_df
+    if tournaments is not None and os.path.isfile(CHAMPION_STATS_PATH):
+        stored_stats_df = read_champion_stats()
+        is_updated = pd.MultiIndex.from_frame(stored_stats_df[["league_id", "tournament_slug"]]).isin(tournaments)
+        champion_stats_df = pd.concat([stored_stats_df[~is_updated], updated_stats_df], ignore_index=True)
+    write_champion_stats(champion_stats_df)
+    written_tournaments = write_champion_mappings(updated_stats_df)
+    print(f"Updated the champion statistics of {len(written_tournaments)} tournaments")
+    return champion_stats_df
+
+
+if __name__ == "__main__":
+    update_champion_stats()
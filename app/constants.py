@@ -3,8 +3,26 @@ from enum import Enum
 ####### Directory consts
 CREATED_DATA_DIR = "esports-data/created"
 MAPPED_GAMES_DIR = f"{CREATED_DATA_DIR}/mapped-games"
+# the same tables as Parquet, <league_id>/<tournament_slug>.parquet, see mapped_games.py
+MAPPED_GAMES_DATASET_DIR = f"{CREATED_DATA_DIR}/mapped-games-parquet"
+MAPPED_GAMES_ROW_GROUP_SIZE = 64
 LOL_ESPORTS_DATA_DIR = "esports-data/lol-esports-data"
+METADATA_CATALOG_DIR = f"{CREATED_DATA_DIR}/metadata-catalog"
 GAMES_DIR = "games"
+GAME_CACHE_INDEX_FILE = "index.json"
+# disk budget of the compressed game cache in GAMES_DIR, least recently used games are evicted past it
+GAME_CACHE_MAX_BYTES = 20 * 1024**3
+EXTRACTED_GAMES_DIR = f"{CREATED_DATA_DIR}/extracted-games"
+# raw game events flattened into one table per event type, <table>.parquet once compacted and
+# <table>/<platform_game_id>.parquet for games converted since, see event_store.py
+EVENT_STORE_DIR = f"{CREATED_DATA_DIR}/event-store"
+# rows per row group of the compacted event store tables, which are sorted by game
+EVENT_STORE_ROW_GROUP_SIZE = 128 * 1024
+# champion picks and wins of every tournament, see champion_stats.py
+CHAMPION_STATS_PATH = f"{CREATED_DATA_DIR}/champion-stats.parquet"
+# bump whenever the columns `utils.get_game_event_data` extracts change,
+# cached games of an older version are re-extracted
+GAME_EXTRACTOR_VERSION = 1
 TOURNAMENT_TO_SLUGS_MAPPING_PATH = f"{CREATED_DATA_DIR}/tournament_to_stage_slugs_mapping.json"
 TEAM_ID_TO_INFO_MAPPING_PATH = f"{CREATED_DATA_DIR}/team_id_to_info_mapping.json"
 
@@ -22,6 +40,7 @@ CHAMPION_KILL = "champion_kill"
 EPIC_MONSTER_KILL = "epic_monster_kill"
 STATS_UPDATE = "stats_update"
 GAME_INFO = "game_info"
+GAME_END = "game_end"
 
 # Kill stats
 FIRST_BLOOD = "firstBlood"
@@ -112,6 +131,11 @@ TEAM_STATS = [
 # plate gold is removed at 14mins so herlad into plate gold secure is common before 13:13mins
 # since it takes 23 seconds to clear herald (longer if no help), and then walk into lane + herald animations
 # Honey fruit spawns -> 6 mins
+# stats sampled every `timeline_step` seconds into per game time series, see `utils.get_game_timeline_data`
+TIMELINE_GENERAL_STATS = ["totalGold", "XP"]
+TIMELINE_GAME_STATS = ["CHAMPIONS_KILLED", "NUM_DEATHS", "ASSISTS"]
+
+
 class ExperienceTimers(Enum):
     FIVE_MINS = 300  # rough FB time + first dragon spawn + blast cones spawn (gank paths)
     TEN_MINS = 600  # rough herald contest time + first dragon has been taken + unleashed teleport
@@ -149,6 +173,45 @@ GOLD_DIFF_RED = [
     "200_red_totalGold_game_end",
 ]
 
+# the team of each side, swapped when the mapping data put the teams on the wrong sides
+BLUE_TEAM_COLUMNS = ["team_100_blue_id", "team_100_blue_name"]
+RED_TEAM_COLUMNS = ["team_200_red_id", "team_200_red_name"]
+# players whose summoner names should start with the code of their side's team
+BLUE_SIDE_CHECK_COLUMNS = ["1_100_top_summonerName", "2_100_jng_summonerName"]
+RED_SIDE_CHECK_COLUMNS = ["6_200_top_summonerName", "7_200_jng_summonerName"]
+
+# columns needed to compute the weighted K value and replay a game's ELO update
+GAME_RATING_COLUMNS = [
+    "league_id",
+    "tournament_id",
+    "tournament_slug",
+    "game_id",
+    "game_number",
+    "stage_name",
+    "game_date",
+    "game_duration",
+    "game_winner",
+    "team_100_blue_name",
+    "team_200_red_name",
+    "team_first_blood",
+    "team_first_turret_destroyed",
+    "team_first_dragon_kill",
+    "team_first_herald_kill",
+    "team_first_baron_kill",
+    "100_blue_totalGold_game_end",
+    "200_red_totalGold_game_end",
+    "100_blue_championsKills_game_end",
+    "100_blue_deaths_game_end",
+    "200_red_championsKills_game_end",
+    "200_red_deaths_game_end",
+    "100_total_VISION_SCORE_game_end",
+    "200_total_VISION_SCORE_game_end",
+    "100_total_TOTAL_DAMAGE_DEALT_TO_CHAMPIONS_game_end",
+    "200_total_TOTAL_DAMAGE_DEALT_TO_CHAMPIONS_game_end",
+    *BLUE_CHAMPION_COLUMNS,
+    *RED_CHAMPION_COLUMNS,
+]
+
 CLASSIFICATION_CODES = {"Dominant": 1, "Intermediate": 0, "Weaker/Passive": -1}
 
 # modifiers extrapolated from https://www.gosugamers.net/lol/rankings
@@ -187,3 +250,35 @@ BASE_K_VALUE_PRE_WORLDS_2022 = 34
 BASE_K_VALUE_WORLDS_2022 = 150
 BASE_K_VALUE_MSI_2023 = 100
 BASE_K_VALUE_2023 = 30
+
+BASE_K_VALUES = {
+    "BASE_K_VALUE_PRE_MSI_2022": BASE_K_VALUE_PRE_MSI_2022,
+    "BASE_K_VALUE_MSI_2022": BASE_K_VALUE_MSI_2022,
+    "BASE_K_VALUE_PRE_WORLDS_2022": BASE_K_VALUE_PRE_WORLDS_2022,
+    "BASE_K_VALUE_WORLDS_2022": BASE_K_VALUE_WORLDS_2022,
+    "BASE_K_VALUE_MSI_2023": BASE_K_VALUE_MSI_2023,
+    "BASE_K_VALUE_2023": BASE_K_VALUE_2023,
+}
+
+# K value bonuses for the winning team, applied in this order by elo.get_weighted_k_value
+K_VALUE_BONUSES = {
+    "gold_diff_10k": 8,  # end of game gold diff > 10k
+    "gold_diff_5k": 4,  # end of game gold diff > 5k
+    "red_side_win": 4,  # winning from red side is harder (draft and gameplay wise)
+    "op_champion": 2,  # per OP champion drafted
+    "first_blood": 2,
+    "first_turret": 2,
+    "first_dragon": 3,  # first dragon early adv maintained reward
+    "first_herald": 2,  # first herald early adv maintained reward
+    "first_baron": 4,  # first baron early adv maintained reward
+    "kd_ratio": 5,  # KD ratio > 1.5, reward for dominance
+    "vision_score": 1,  # per 10 vision score diff
+    "damage_to_champions": 1,  # per 10k total damage to champions diff
+    "game_under_30_mins": 3,  # 25-30 mins
+    "game_under_25_mins": 6,
+}
+
+## Global Event Dates
+MSI_2022_DATE = "2022-05-10"
+WORLDS_2022_DATE = "2022-09-29"
+MSI_2023_DATE = "2023-05-02"
@@ -1,23 +1,25 @@
 import json
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 from constants import (
-    BASE_K_VALUE_2023,
-    BASE_K_VALUE_MSI_2022,
-    BASE_K_VALUE_MSI_2023,
-    BASE_K_VALUE_PRE_MSI_2022,
-    BASE_K_VALUE_PRE_WORLDS_2022,
-    BASE_K_VALUE_WORLDS_2022,
+    BASE_K_VALUES,
     BLUE_CHAMPION_COLUMNS,
     CREATED_DATA_DIR,
+    GAME_RATING_COLUMNS,
+    K_VALUE_BONUSES,
     MAJOR_REGION_MODIFIERS,
     MAPPED_GAMES_DIR,
+    MSI_2022_DATE,
     RED_CHAMPION_COLUMNS,
     REGION_ELO_MODIFIERS,
+    WORLDS_2022_DATE,
 )
-from feature_utils import get_op_champions
+from feature_utils import champion_stats_cache, get_op_champions
+from mapped_games import get_league_tournament_slugs, read_mapped_games
+from rating_engine import RatingEngine
 
 from utils import get_league_tournaments
 
@@ -58,14 +60,11 @@ def get_league_to_teams_mapping():
     league_id_to_name_mapping = league_id_to_name()
     league_name_to_teams_mapping = dict()
     for league_id, league_name in league_id_to_name_mapping.items():
-        csv_files = [
-            (league_id, f)
-            for f in os.listdir(f"{MAPPED_GAMES_DIR}/{league_id}")
-            if f.endswith(".csv") and "elo" not in f
-        ]
         all_unique_teams = set()
-        for _, tournament_file in csv_files:
-            tournament_df = pd.read_csv(f"{MAPPED_GAMES_DIR}/{league_id}/{tournament_file}")
+        for tournament_slug in get_league_tournament_slugs(league_id):
+            tournament_df = read_mapped_games(
+                league_id, tournament_slug, columns=["team_100_blue_name", "team_200_red_name"]
+            )
             all_unique_teams = all_unique_teams | get_unique_team_names(tournament_df)
         league_name_to_teams_mapping[league_name] = list(all_unique_teams)
     with open(f"{CREATED_DATA_DIR}/league_id_to_teams_mapping.json", "w") as f:
@@ -73,27 +72,40 @@ def get_league_to_teams_mapping():
     return league_name_to_teams_mapping
 
 
-def process_league_ratings(by_date: Optional[str] = None):
+def process_league_ratings(by_date: Optional[str] = None, streaming: bool = True, write_snapshots: bool = True):
+    """Runs the ELO ratings over every tournament in `sorted-tournaments.csv`, oldest first.
+
+    Args:
+        by_date (str, optional): only tournaments that started before this date are processed.
+        streaming (bool): carry the ratings in memory from tournament to tournament. When False, each
+            tournament is seeded from the previous tournament's last `_elo.csv` snapshot on disk.
+        write_snapshots (bool): write the per stage `_elo.csv` snapshots. Only optional when streaming,
+            the disk seeded mode needs them to chain tournaments.
+    """
     sorted_league_tournaments = pd.read_csv(SORTED_LEAGUE_TOURNAMENTS)
     if by_date:
         sorted_league_tournaments = sorted_league_tournaments[sorted_league_tournaments["game_date"] < by_date]
     sorted_league_tournaments.reset_index(inplace=True, drop=True)
+    write_snapshots = write_snapshots or not streaming
 
+    elo_df = None
     for index, row in sorted_league_tournaments.iterrows():
         league_id = row["league_id"]
-        league_name = league_id_to_name()[league_id]
+        league_name = reference_data.get_league_name(league_id)
         print(f"Processing {league_name} - {row['tournament_slug']}...")
-        df = pd.read_csv(f"{MAPPED_GAMES_DIR}/{league_id}/{row['tournament_slug']}.csv")
-        if index == 0:
-            get_tournament_elo(df)
+        df = read_mapped_games(league_id, row["tournament_slug"], columns=GAME_RATING_COLUMNS)
+        if index == 0 or streaming:
+            elo_df = get_tournament_elo(df, elo_df, write_snapshots=write_snapshots)
         else:
             prev_tournament = sorted_league_tournaments.iloc[index - 1]["tournament_slug"]
             prev_league_id = sorted_league_tournaments.iloc[index - 1]["league_id"]
-            prev_tournament_df = pd.read_csv(f"{MAPPED_GAMES_DIR}/{prev_league_id}/{prev_tournament}.csv")
+            prev_tournament_df = read_mapped_games(prev_league_id, prev_tournament, columns=["stage_name"])
             last_stage = get_unique_stage_names(prev_tournament_df)[-1]
             existing_elo_df = pd.read_csv(f"{MAPPED_GAMES_DIR}/{prev_league_id}/{prev_tournament}_{last_stage}_elo.csv")
-            get_tournament_elo(df, existing_elo_df)
+            elo_df = get_tournament_elo(df, existing_elo_df, write_snapshots=write_snapshots)
         print(f"{league_name} - {row['tournament_slug']} processed!")
+    print(f"Champion stats cache: {champion_stats_cache.info()}")
+    return elo_df
 
 
 def get_unique_stage_names(tournament_df: pd.DataFrame) -> list:
@@ -119,34 +131,91 @@ def get_team_name_to_id_mapping():
     }
     with open(f"{CREATED_DATA_DIR}/team_name_to_id_mapping.json", "w") as f:
         json.dump(reverse_mapping, f)
+    return reverse_mapping
+
+
+class ReferenceData:
+    """Process wide registry of the league/team reference mappings.
+
+    Each mapping is loaded lazily on first use through the loader functions above and then
+    served from memory, so a full ratings run opens every reference file once. Call `invalidate`
+    (or `reload`) after regenerating any of the files in `CREATED_DATA_DIR`.
+    """
+
+    def __init__(self):
+        self._league_id_to_name = None
+        self._team_to_league = None
+        self._team_name_to_id = None
+
+    @property
+    def league_id_to_name(self) -> dict:
+        if self._league_id_to_name is None:
+            self._league_id_to_name = league_id_to_name()
+        return self._league_id_to_name
+
+    @property
+    def team_to_league(self) -> dict:
+        if self._team_to_league is None:
+            self._team_to_league = get_team_to_league_mapping()
+        return self._team_to_league
+
+    @property
+    def team_name_to_id(self) -> dict:
+        if self._team_name_to_id is None:
+            self._team_name_to_id = get_team_name_to_id_mapping()
+        return self._team_name_to_id
 
+    def get_league_name(self, league_id) -> str:
+        # ids read from the mapped games are strings, the league names are keyed by int ids
+        return self.league_id_to_name[int(league_id)]
 
-def get_tournament_elo(tournament_df: pd.DataFrame, existing_elo_df: Optional[pd.DataFrame] = None):
+    def get_team_league(self, team_name: str) -> str:
+        return self.team_to_league[team_name]
+
+    def get_team_info(self, team_name: str) -> dict:
+        return self.team_name_to_id[team_name]
+
+    def invalidate(self):
+        self._league_id_to_name = None
+        self._team_to_league = None
+        self._team_name_to_id = None
+
+    def reload(self):
+        self.invalidate()
+        return self.league_id_to_name, self.team_to_league, self.team_name_to_id
+
+
+reference_data = ReferenceData()
+
+
+def get_tournament_elo(
+    tournament_df: pd.DataFrame, existing_elo_df: Optional[pd.DataFrame] = None, write_snapshots: bool = True
+) -> pd.DataFrame:
+    """Processes every stage of a tournament in order. The ratings are carried in memory from one
+    stage to the next, `_elo.csv` snapshots are only written as checkpoints.
+
+    Returns the ratings after the last stage, sorted by ELO.
+    """
     available_stages = get_unique_stage_names(tournament_df)
+    elo_df = existing_elo_df
 
-    for idx, stage_name in enumerate(available_stages):
+    for stage_name in available_stages:
         stage_df = tournament_df[tournament_df["stage_name"] == stage_name].copy()
         stage_teams = set(stage_df["team_100_blue_name"].unique()) | set(stage_df["team_200_red_name"].unique())
-        if idx == 0 and existing_elo_df is None:
+        if elo_df is None:
             elo_df = pd.DataFrame(
                 {
                     "Team": list(stage_teams),
-                    "ELO": [REGION_ELO_MODIFIERS[league_id_to_name()[stage_df.iloc[0]["league_id"]]]]
+                    "ELO": [REGION_ELO_MODIFIERS[reference_data.get_league_name(stage_df.iloc[0]["league_id"])]]
                     * len(stage_teams),
                 }
             )
-        elif existing_elo_df is not None:
-            elo_df = existing_elo_df
-        else:
-            elo_df = pd.read_csv(
-                f"{MAPPED_GAMES_DIR}/{tournament_df['league_id'][0]}/{tournament_df['tournament_slug'][0]}_{available_stages[idx - 1]}_elo.csv"
-            )
 
         new_teams = stage_teams - set(elo_df["Team"].unique())
         for team in new_teams:
             elo_df.loc[len(elo_df)] = {
                 "Team": team,
-                "ELO": REGION_ELO_MODIFIERS[get_team_to_league_mapping()[team]],
+                "ELO": REGION_ELO_MODIFIERS[reference_data.get_team_league(team)],
             }
         stage_df.loc[:, "winning_team"] = stage_df.apply(
             lambda row: row["team_100_blue_name"] if row["game_winner"] == 100 else row["team_200_red_name"], axis=1
@@ -154,135 +223,163 @@ def get_tournament_elo(tournament_df: pd.DataFrame, existing_elo_df: Optional[pd
         process_tournament_elo(stage_df, elo_df)
         elo_df.sort_values(by=["ELO"], ascending=False, inplace=True)
         print(elo_df)
-        elo_df.to_csv(
-            f"{MAPPED_GAMES_DIR}/{tournament_df['league_id'][0]}/{tournament_df['tournament_slug'][0]}_{stage_name}_elo.csv",
-            index=False,
+        if write_snapshots:
+            elo_df.to_csv(
+                f"{MAPPED_GAMES_DIR}/{tournament_df['league_id'][0]}/{tournament_df['tournament_slug'][0]}_{stage_name}_elo.csv",
+                index=False,
+            )
+    return elo_df
+
+
+def get_stage_base_k_value_names(stage_df: pd.DataFrame) -> np.ndarray:
+    """Name of the `BASE_K_VALUES` entry that applies to every game in a stage, in row order: the tournament
+    specific value for MSI 2022, Worlds 2022 and MSI 2023, otherwise the value of the period the game was played in.
+    """
+    game_dates = stage_df["game_date"].to_numpy()
+    tournament_slugs = stage_df["tournament_slug"].to_numpy()
+    # first match wins, so tournament specific values come before the time specific ones
+    return np.select(
+        [
+            tournament_slugs == "msi_2023",
+            tournament_slugs == "worlds_2022",
+            tournament_slugs == "msi_2022",
+            game_dates > WORLDS_2022_DATE,
+            game_dates > MSI_2022_DATE,
+        ],
+        [
+            "BASE_K_VALUE_MSI_2023",
+            "BASE_K_VALUE_WORLDS_2022",
+            "BASE_K_VALUE_MSI_2022",
+            "BASE_K_VALUE_2023",
+            "BASE_K_VALUE_PRE_WORLDS_2022",
+        ],
+        default="BASE_K_VALUE_PRE_MSI_2022",
+    )
+
+
+def get_stage_k_features(stage_df: pd.DataFrame, op_champions: List[str]) -> Dict[str, np.ndarray]:
+    """What the winning team of every game gets K value bonuses for, keyed like `K_VALUE_BONUSES`,
+    computed column-wise over the whole stage. Needs the `winning_team` column."""
+    is_blue_win = (stage_df["winning_team"] == stage_df["team_100_blue_name"]).to_numpy()
+    side = np.where(is_blue_win, 100, 200)
+
+    def winner_column(blue_column: str, red_column: str) -> np.ndarray:
+        return np.where(is_blue_win, stage_df[blue_column].to_numpy(), stage_df[red_column].to_numpy())
+
+    # Feat 2: Gold diff end
+    gold_diff = np.abs(
+        stage_df["100_blue_totalGold_game_end"].to_numpy() - stage_df["200_red_totalGold_game_end"].to_numpy()
+    )
+
+    # KD ratio reward for dominance
+    deaths = winner_column("100_blue_deaths_game_end", "200_red_deaths_game_end")
+    kills = winner_column("100_blue_championsKills_game_end", "200_red_championsKills_game_end")
+    kd_ratio = kills / np.where(deaths == 0, 1, deaths)
+
+    # Feat 3: Vision score diff
+    total_vision_score = np.abs(
+        stage_df["100_total_VISION_SCORE_game_end"].to_numpy() - stage_df["200_total_VISION_SCORE_game_end"].to_numpy()
+    )
+
+    # Feat 4: Total damage to champions diff
+    total_dmg_to_champions = np.abs(
+        stage_df["100_total_TOTAL_DAMAGE_DEALT_TO_CHAMPIONS_game_end"].to_numpy()
+        - stage_df["200_total_TOTAL_DAMAGE_DEALT_TO_CHAMPIONS_game_end"].to_numpy()
+    )
+
+    # Feat 5: Game duration - reward shorter more dominant games
+    game_duration = stage_df["game_duration"].to_numpy()
+
+    # Feat 1: Increase weight for every OP champion drafted
+    op_picks = np.zeros(stage_df.shape[0], dtype=np.int64)
+    for blue_column, red_column in zip(BLUE_CHAMPION_COLUMNS, RED_CHAMPION_COLUMNS):
+        op_picks += np.where(
+            is_blue_win, stage_df[blue_column].isin(op_champions), stage_df[red_column].isin(op_champions)
         )
 
+    return {
+        "gold_diff_10k": (gold_diff > 10000).astype(np.int64),
+        "gold_diff_5k": ((gold_diff > 5000) & (gold_diff <= 10000)).astype(np.int64),
+        "red_side_win": (side == 200).astype(np.int64),
+        "op_champion": op_picks,
+        # Features: team FB, FT, FD, FH, FBaron
+        "first_blood": (stage_df["team_first_blood"].to_numpy() == side).astype(np.int64),
+        "first_turret": (stage_df["team_first_turret_destroyed"].to_numpy() == side).astype(np.int64),
+        "first_dragon": (stage_df["team_first_dragon_kill"].to_numpy() == side).astype(np.int64),
+        "first_herald": (stage_df["team_first_herald_kill"].to_numpy() == side).astype(np.int64),
+        "first_baron": (stage_df["team_first_baron_kill"].to_numpy() == side).astype(np.int64),
+        "kd_ratio": (kd_ratio > 1.5).astype(np.int64),
+        "vision_score": total_vision_score // 10,
+        "damage_to_champions": total_dmg_to_champions // 10000,
+        "game_under_30_mins": ((game_duration > 1500) & (game_duration < 1800)).astype(np.int64),
+        "game_under_25_mins": (game_duration < 1500).astype(np.int64),
+    }
 
-def get_k_value(game_row: pd.Series):
-    # Time specific Base K Values
-    BASE_K_VALUE = BASE_K_VALUE_PRE_MSI_2022
 
-    if game_row["game_date"] > MSI_2022_DATE:
-        BASE_K_VALUE = BASE_K_VALUE_PRE_WORLDS_2022
+def get_weighted_k_value(base_k_value, region_modifier, k_features: dict, k_value_bonuses: dict = K_VALUE_BONUSES):
+    """Weighted K value from the game's base K, the loser's region modifier and its K features.
 
-    if game_row["game_date"] > WORLDS_2022_DATE:
-        BASE_K_VALUE = BASE_K_VALUE_2023
+    Works on scalars or on numpy arrays of a whole stage. Bonuses are added one at a time in a
+    fixed order (OP champions one pick at a time) so float rounding is the same either way.
+    """
+    # Weighted K value based on when game was played
+    # early 2022 = high K to get initial standings
+    # as time goes, lower K values + region modifier to add effect
+    # where a team from a weaker region wins against a stronger region, rewarding them better
+    k_value = base_k_value * region_modifier
+
+    for feature_name, bonus in k_value_bonuses.items():
+        if feature_name == "op_champion":
+            for num_picks in range(len(BLUE_CHAMPION_COLUMNS)):
+                k_value = k_value + bonus * (k_features[feature_name] > num_picks)
+        else:
+            k_value = k_value + bonus * k_features[feature_name]
 
-    ### Tournament specific Base K values
-    if game_row["tournament_slug"] == "msi_2022":
-        BASE_K_VALUE = BASE_K_VALUE_MSI_2022
-    if game_row["tournament_slug"] == "worlds_2022":
-        BASE_K_VALUE = BASE_K_VALUE_WORLDS_2022
-    if game_row["tournament_slug"] == "msi_2023":
-        BASE_K_VALUE = BASE_K_VALUE_MSI_2023
+    return k_value
 
-    return BASE_K_VALUE
 
+def get_losing_teams(tournament_df: pd.DataFrame) -> pd.Series:
+    return tournament_df["team_100_blue_name"].where(
+        tournament_df["winning_team"] != tournament_df["team_100_blue_name"], tournament_df["team_200_red_name"]
+    )
 
-def process_tournament_elo(tournament_df: pd.DataFrame, elo_data: pd.DataFrame):
-    for _, row in tournament_df.iterrows():
-        winner = row["winning_team"]
-        loser = row["team_100_blue_name"] if winner != row["team_100_blue_name"] else row["team_200_red_name"]
-
-        # Weighted K value based on when game was played
-        # early 2022 = high K to get initial standings
-        # as time goes, lower K values + region modifier to add effect
-        # where a team from a weaker region wins against a stronger region, rewarding them better
-        k_value = get_k_value(row) * MAJOR_REGION_MODIFIERS[get_team_to_league_mapping()[loser]]
-
-        league_id, tournament_slug, total_games = (
-            tournament_df.iloc[0]["league_id"],
-            tournament_df.iloc[0]["tournament_slug"],
-            tournament_df.shape[0],
-        )
 
-        # Feat 1: Increase weight for every OP champion drafted
-        op_champions = get_op_champions(
-            f"{CREATED_DATA_DIR}/mapped-games/{league_id}/{tournament_slug}_champion_mapping.json",
-            total_games,
-            elo_data["Team"].unique().tolist(),
-        )
+def get_stage_op_champions(stage_df: pd.DataFrame, unique_teams: List[str]) -> List[str]:
+    league_id, tournament_slug, total_games = (
+        stage_df.iloc[0]["league_id"],
+        stage_df.iloc[0]["tournament_slug"],
+        stage_df.shape[0],
+    )
+    return get_op_champions(
+        f"{CREATED_DATA_DIR}/mapped-games/{league_id}/{tournament_slug}_champion_mapping.json",
+        total_games,
+        unique_teams,
+    )
 
-        # Feat 2: Gold diff end
-        gold_diff = abs(row["100_blue_totalGold_game_end"] - row["200_red_totalGold_game_end"])
-        if gold_diff > 10000:
-            k_value += 8  # gold diff reward
-        elif gold_diff > 5000:
-            k_value += 4
-
-        if winner == row["team_100_blue_name"]:
-            for role in BLUE_CHAMPION_COLUMNS:
-                if row[role] in op_champions:
-                    k_value += 2
-
-            # Features: team FB, FT, FD, FH, FBaron
-            if row["team_first_blood"] == 100:
-                k_value += 2
-            if row["team_first_turret_destroyed"] == 100:
-                k_value += 2
-            if row["team_first_dragon_kill"] == 100:
-                k_value += 3  # first dragon early adv maintained reward
-            if row["team_first_herald_kill"] == 100:
-                k_value += 2  # first herald early adv maintained reward
-            if row["team_first_baron_kill"] == 100:
-                k_value += 4  # first baron early adv maintained reward
-
-            # KD ratio reward for dominance
-            total_deaths = 1 if row["100_blue_deaths_game_end"] == 0 else row["100_blue_deaths_game_end"]
-            kd_ratio = row["100_blue_championsKills_game_end"] / total_deaths
-            if kd_ratio > 1.5:
-                k_value += 5
-        else:
-            k_value += 4  # winning from red side is harder (draft and gameplay wise)
-            # bigger reward for winning from red side
-            for role in RED_CHAMPION_COLUMNS:
-                if row[role] in op_champions:
-                    k_value += 2
-
-            if row["team_first_blood"] == 200:
-                k_value += 2
-            if row["team_first_turret_destroyed"] == 200:
-                k_value += 2
-            if row["team_first_dragon_kill"] == 200:
-                k_value += 3  # first dragon early adv maintained reward
-            if row["team_first_herald_kill"] == 200:
-                k_value += 2  # first herald early adv maintained reward
-            if row["team_first_baron_kill"] == 200:
-                k_value += 4  # first baron early adv maintained reward
-
-            total_deaths = 1 if row["200_red_deaths_game_end"] == 0 else row["200_red_deaths_game_end"]
-            kd_ratio = row["200_red_championsKills_game_end"] / total_deaths
-            if kd_ratio > 1.5:
-                k_value += 5
-
-        # Feat 3: Vision score diff
-        total_vision_score = abs(row["100_total_VISION_SCORE_game_end"] - row["200_total_VISION_SCORE_game_end"])
-        k_value += total_vision_score // 10
-
-        # Feat 4: Total damage to champions diff
-        total_dmg_to_champions = abs(
-            row["100_total_TOTAL_DAMAGE_DEALT_TO_CHAMPIONS_game_end"]
-            - row["200_total_TOTAL_DAMAGE_DEALT_TO_CHAMPIONS_game_end"]
-        )
-        k_value += total_dmg_to_champions // 10000
-
-        # Feat 5: Game duration - reward shorter more dominant games
-        game_duration = row["game_duration"]
-        if 1800 > game_duration > 1500:  # 30-25 min
-            k_value += 3
-        elif game_duration < 1500:  # under 25 min
-            k_value += 6
-
-        new_winner_elo, new_loser_elo = update_weighted_elo(
-            elo_data.loc[elo_data["Team"] == winner, "ELO"].values[0],
-            elo_data.loc[elo_data["Team"] == loser, "ELO"].values[0],
-            k_value,
-        )
 
-        elo_data.loc[elo_data["Team"] == winner, "ELO"] = new_winner_elo
-        elo_data.loc[elo_data["Team"] == loser, "ELO"] = new_loser_elo
+def get_stage_k_values(stage_df: pd.DataFrame, unique_teams: List[str]) -> np.ndarray:
+    """Weighted K value of every game in a stage, in row order, computed in one columnar pass.
+    Needs the `winning_team` column."""
+    # Feat 1: Increase weight for every OP champion drafted
+    op_champions = get_stage_op_champions(stage_df, unique_teams)
+
+    loser_leagues = get_losing_teams(stage_df).map(reference_data.get_team_league)
+    return get_weighted_k_value(
+        np.array([BASE_K_VALUES[name] for name in get_stage_base_k_value_names(stage_df)], dtype=np.float64),
+        loser_leagues.map(MAJOR_REGION_MODIFIERS).to_numpy(dtype=np.float64),
+        get_stage_k_features(stage_df, op_champions),
+    )
+
+
+def process_tournament_elo(tournament_df: pd.DataFrame, elo_data: pd.DataFrame):
+    k_values = get_stage_k_values(tournament_df, elo_data["Team"].unique().tolist())
+
+    # ratings are read and written through dense team ids instead of masking elo_data per game
+    engine = RatingEngine.from_elo_df(elo_data)
+    engine.replay(
+        engine.encode(tournament_df["winning_team"]), engine.encode(get_losing_teams(tournament_df)), k_values
+    )
+    elo_data["ELO"] = engine.get_ratings(elo_data["Team"])
 
 
 def update_weighted_elo(winner_elo: float, loser_elo: float, k_value: int = 30):
@@ -310,10 +407,5 @@ def update_weighted_elo(winner_elo: float, loser_elo: float, k_value: int = 30):
 
 
 if __name__ == "__main__":
-    ## Global Event Dates
-    MSI_2022_DATE = "2022-05-10"
-    WORLDS_2022_DATE = "2022-09-29"
-    MSI_2023_DATE = "2023-05-02"
-
     process_league_ratings()
     # get_team_name_to_id_mapping()
@@ -0,0 +1,454 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from constants import (
+    BUILDING_DESTROYED,
+    CHAMPION_KILL,
+    EPIC_MONSTER_KILL,
+    EVENT_STORE_DIR,
+    EVENT_STORE_ROW_GROUP_SIZE,
+    GAME_CACHE_INDEX_FILE,
+    GAME_END,
+    GAME_INFO,
+    GAMES_DIR,
+    PARTICIPANT_GAME_STATS,
+    PARTICIPANT_GENERAL_STATS,
+    STATS_UPDATE,
+    TEAM_STATS,
+    TIMELINE_GENERAL_STATS,
+    Monsters,
+)
+from game_cache import get_game_cache, init_worker_game_cache
+
+from utils import iter_json_array, open_game_data_stream
+
+
+def to_int(value: Any) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+def to_float(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def to_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def to_bool(value: Any) -> Optional[bool]:
+    return None if value is None else bool(value)
+
+
+def to_int_list(value: Any) -> Optional[List[int]]:
+    return None if value is None else [int(item) for item in value]
+
+
+# type and converter of the raw event values
+FIELD_TYPES: Dict[str, Tuple[pa.DataType, Callable[[Any], Any]]] = {
+    "int": (pa.int64(), to_int),
+    "float": (pa.float64(), to_float),
+    "str": (pa.string(), to_str),
+    "bool": (pa.bool_(), to_bool),
+    "int_list": (pa.list_(pa.int64()), to_int_list),
+}
+
+# every table starts with the game and the position of the event in the game file, which orders events
+# sharing a game time. `game_time` is kept in milliseconds as in the raw events
+EVENT_KEY_FIELDS = [("platform_game_id", "str"), ("event_index", "int"), ("game_time", "int")]
+
+# table -> (event type, [(column, raw key path, field type)]), one row per event
+EVENT_TABLES = {
+    "kills": (
+        CHAMPION_KILL,
+        [
+            ("killer", ("killer",), "int"),
+            ("killer_team_id", ("killerTeamID",), "int"),
+            ("victim", ("victim",), "int"),
+            ("victim_team_id", ("victimTeamID",), "int"),
+            ("assistants", ("assistants",), "int_list"),
+            ("bounty", ("bounty",), "float"),
+            ("position_x", ("position", "x"), "float"),
+            ("position_z", ("position", "z"), "float"),
+        ],
+    ),
+    "buildings": (
+        BUILDING_DESTROYED,
+        [
+            ("building_type", ("buildingType",), "str"),
+            ("team_id", ("teamID",), "int"),
+            ("lane", ("lane",), "str"),
+            ("turret_tier", ("turretTier",), "str"),
+            ("last_hitter", ("lastHitter",), "int"),
+            ("assistants", ("assistants",), "int_list"),
+        ],
+    ),
+    "epic_monsters": (
+        EPIC_MONSTER_KILL,
+        [
+            ("monster_type", ("monsterType",), "str"),
+            ("dragon_type", ("dragonType",), "str"),
+            ("killer", ("killer",), "int"),
+            ("killer_team_id", ("killerTeamID",), "int"),
+            ("assistants", ("assistants",), "int_list"),
+            ("in_enemy_jungle", ("inEnemyJungle",), "bool"),
+        ],
+    ),
+}
+
+# stats_update snapshots in long format, one row per participant (or team) per snapshot. Stat columns keep
+# their raw names, the same as in the mapped games columns. The nested participant stats are floats, some
+# (e.g. VISION_SCORE) are fractional
+PARTICIPANT_STATS_FIELDS = [("participant_id", ("participantID",), "int"), ("team_id", ("teamID",), "int")] + [
+    (stat, (stat,), "int") for stat in dict.fromkeys(PARTICIPANT_GENERAL_STATS + TIMELINE_GENERAL_STATS)
+]
+TEAM_STATS_FIELDS = [("team_id", ("teamID",), "int")] + [(stat, (stat,), "int") for stat in TEAM_STATS]
+
+# one row per game
+GAME_FIELDS = [
+    ("platform_game_id", "str"),
+    ("game_date", "str"),
+    ("game_patch", "str"),
+    ("game_end_time", "int"),
+    ("winning_team", "int"),
+]
+
+
+def get_table_schema(table_name: str) -> pa.Schema:
+    if table_name == "games":
+        fields = GAME_FIELDS
+    elif table_name == "participant_stats":
+        fields = (
+            EVENT_KEY_FIELDS
+            + [(column, field_type) for column, _, field_type in PARTICIPANT_STATS_FIELDS]
+            + [(stat, "float") for stat in PARTICIPANT_GAME_STATS]
+        )
+    elif table_name == "team_stats":
+        fields = EVENT_KEY_FIELDS + [(column, field_type) for column, _, field_type in TEAM_STATS_FIELDS]
+    else:
+        fields = EVENT_KEY_FIELDS + [(column, field_type) for column, _, field_type in EVENT_TABLES[table_name][1]]
+    return pa.schema([(column, FIELD_TYPES[field_type][0]) for column, field_type in fields])
+
+
+EVENT_STORE_TABLES = [*EVENT_TABLES, "participant_stats", "team_stats", "games"]
+EVENT_STORE_SCHEMAS = {table_name: get_table_schema(table_name) for table_name in EVENT_STORE_TABLES}
+
+
+def get_raw_value(data: Dict[str, Any], key_path: Tuple[str, ...]) -> Any:
+    for key in key_path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+class GameEventTables:
+    """Rows of every event store table for one game, built column by column as the game's events are read."""
+
+    def __init__(self, platform_game_id: str):
+        self.platform_game_id = platform_game_id
+        self.columns: Dict[str, Dict[str, list]] = {
+            table_name: {column: [] for column in schema.names} for table_name, schema in EVENT_STORE_SCHEMAS.items()
+        }
+        self.event_tables = {event_type: table_name for table_name, (event_type, _) in EVENT_TABLES.items()}
+        self.game_info: Dict[str, Any] = {}
+        self.game_end: Dict[str, Any] = {}
+
+    def add_row(self, table_name: str, event_index: int, game_time: Any, data: Dict[str, Any], fields: list) -> None:
+        columns = self.columns[table_name]
+        columns["platform_game_id"].append(self.platform_game_id)
+        columns["event_index"].append(event_index)
+        columns["game_time"].append(to_int(game_time))
+        for column, key_path, field_type in fields:
+            columns[column].append(FIELD_TYPES[field_type][1](get_raw_value(data, key_path)))
+
+    def add(self, event_index: int, event: Dict[str, Any]) -> None:
+        event_type = event.get("eventType")
+        if event_type in self.event_tables:
+            table_name = self.event_tables[event_type]
+            self.add_row(table_name, event_index, event.get("gameTime"), event, EVENT_TABLES[table_name][1])
+        elif event_type == STATS_UPDATE:
+            for player_info in event.get("participants", []):
+                self.add_row(
+                    "participant_stats", event_index, event.get("gameTime"), player_info, PARTICIPANT_STATS_FIELDS
+                )
+                stat_values = {stat["name"]: stat["value"] for stat in player_info.get("stats", [])}
+                for stat in PARTICIPANT_GAME_STATS:
+                    self.columns["participant_stats"][stat].append(to_float(stat_values.get(stat)))
+            for team_info in event.get("teams", []):
+                self.add_row("team_stats", event_index, event.get("gameTime"), team_info, TEAM_STATS_FIELDS)
+        elif event_type == GAME_INFO:
+            self.game_info = event
+        elif event_type == GAME_END:
+            self.game_end = event
+
+    def get_game_row(self) -> Dict[str, Any]:
+        event_time = self.game_info.get("eventTime")
+        return {
+            "platform_game_id": self.platform_game_id,
+            "game_date": event_time.split("T")[0] if event_time else None,
+            "game_patch": self.game_info.get("gameVersion"),
+            "game_end_time": to_int(self.game_end.get("gameTime")),
+            "winning_team": to_int(self.game_end.get("winningTeam")),
+        }
+
+    def to_tables(self) -> Dict[str, pa.Table]:
+        for column, value in self.get_game_row().items():
+            self.columns["games"][column] = [value]
+        return {
+            table_name: pa.table(self.columns[table_name], schema=schema)
+            for table_name, schema in EVENT_STORE_SCHEMAS.items()
+        }
+
+
+def get_table_path(table_name: str, event_store_dir: str = EVENT_STORE_DIR) -> str:
+    """Compacted table, see `compact_event_store`."""
+    return f"{event_store_dir}/{table_name}.parquet"
+
+
+def get_part_path(table_name: str, platform_game_id: str, event_store_dir: str = EVENT_STORE_DIR) -> str:
+    """Rows of one game converted since the last compaction."""
+    return f"{event_store_dir}/{table_name}/{platform_game_id}.parquet"
+
+
+def get_part_platform_game_ids(table_name: str, event_store_dir: str = EVENT_STORE_DIR) -> List[str]:
+    parts_dir = os.path.dirname(get_part_path(table_name, "", event_store_dir))
+    if not os.path.isdir(parts_dir):
+        return []
+    return sorted(
+        file_name[: -len(".parquet")] for file_name in os.listdir(parts_dir) if file_name.endswith(".parquet")
+    )
+
+
+def get_converted_platform_game_ids(event_store_dir: str = EVENT_STORE_DIR) -> Set[str]:
+    # the games table is written last, so a game only counts as converted once all of its tables are
+    platform_game_ids = set(get_part_platform_game_ids("games", event_store_dir))
+    if os.path.isfile(get_table_path("games", event_store_dir)):
+        games_table = pq.read_table(get_table_path("games", event_store_dir), columns=["platform_game_id"])
+        platform_game_ids |= set(games_table["platform_game_id"].to_pylist())
+    return platform_game_ids
+
+
+def convert_game(platform_game_id: str, event_store_dir: str = EVENT_STORE_DIR) -> bool:
+    """Flattens one game into its rows of every event store table. Returns whether the game could be read."""
+    game_event_tables = GameEventTables(platform_game_id)
+    try:
+        with open_game_data_stream(platform_game_id) as game_stream:
+            if game_stream is None:
+                return False
+            for event_index, event in enumerate(iter_json_array(game_stream)):
+                game_event_tables.add(event_index, event)
+    except Exception as e:
+        print(f"{platform_game_id} - Error: {e}")
+        return False
+
+    # games is last, see `get_converted_platform_game_ids`
+    for table_name, table in game_event_tables.to_tables().items():
+        part_path = get_part_path(table_name, platform_game_id, event_store_dir)
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+        pq.write_table(table, f"{part_path}.{os.getpid()}.tmp")
+        os.replace(f"{part_path}.{os.getpid()}.tmp", part_path)
+    return True
+
+
+def compact_event_table(table_name: str, event_store_dir: str = EVENT_STORE_DIR) -> int:
+    """Merges the parts of a table into its compacted file, sorted by game and event so row group statistics
+    skip other games. Rows of a game converted again replace its compacted ones. Returns the number of parts
+    merged."""
+    part_platform_game_ids = get_part_platform_game_ids(table_name, event_store_dir)
+    if not part_platform_game_ids:
+        return 0
+    schema = EVENT_STORE_SCHEMAS[table_name]
+    tables = [
+        pq.read_table(get_part_path(table_name, platform_game_id, event_store_dir), schema=schema)
+        for platform_game_id in part_platform_game_ids
+    ]
+    table_path = get_table_path(table_name, event_store_dir)
+    if os.path.isfile(table_path):
+        compacted_table = pq.read_table(table_path, schema=schema)
+        is_replaced = pc.is_in(compacted_table["platform_game_id"], value_set=pa.array(part_platform_game_ids))
+        tables.append(compacted_table.filter(pc.invert(is_replaced)))
+    sort_keys = [("platform_game_id", "ascending")] + (
+        [("event_index", "ascending")] if "event_index" in schema.names else []
+    )
+    table = pa.concat_tables(tables).sort_by(sort_keys)
+    pq.write_table(table, f"{table_path}.{os.getpid()}.tmp", row_group_size=EVENT_STORE_ROW_GROUP_SIZE)
+    os.replace(f"{table_path}.{os.getpid()}.tmp", table_path)
+
+    for platform_game_id in part_platform_game_ids:
+        os.remove(get_part_path(table_name, platform_game_id, event_store_dir))
+    return len(part_platform_game_ids)
+
+
+def compact_event_store(event_store_dir: str = EVENT_STORE_DIR) -> int:
+    """Merges the per game parts of every table into one file per table. Returns the number of games merged."""
+    # games is last, so an interrupted compaction leaves the games it didn't get to in the parts
+    for table_name in EVENT_STORE_TABLES[:-1]:
+        compact_event_table(table_name, event_store_dir)
+    num_compacted = compact_event_table("games", event_store_dir)
+    print(f"Compacted {num_compacted} games into {event_store_dir}")
+    return num_compacted
+
+
+def get_local_platform_game_ids() -> List[str]:
+    """Every game on disk: in the game cache, or uncompressed in `GAMES_DIR` from before the cache existed."""
+    game_cache = get_game_cache()
+    platform_game_ids = {
+        file_name[: -len(".json.gz")]
+        for file_name in os.listdir(game_cache.cache_dir)
+        if file_name.endswith(".json.gz")
+    }
+    if os.path.isdir(GAMES_DIR):
+        platform_game_ids |= {
+            file_name[: -len(".json")]
+            for file_name in os.listdir(GAMES_DIR)
+            if file_name.endswith(".json") and file_name != GAME_CACHE_INDEX_FILE
+        }
+    return sorted(platform_game_ids)
+
+
+def convert_games(
+    platform_game_ids: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    overwrite: bool = False,
+    event_store_dir: str = EVENT_STORE_DIR,
+    compact: bool = True,
+) -> int:
+    """Converts games into the event store across a process pool. Returns the number of games converted.
+
+    Args:
+        platform_game_ids (list, optional): games to convert, defaults to every game on disk. Games are read
+            through `utils.open_game_data_stream`, so missing ones are downloaded first.
+        max_workers (int, optional): size of the process pool. None or 1 converts the games one at a time.
+        overwrite (bool): convert games already in the event store again, e.g. after the tables changed.
+        compact (bool): merge the converted games into the compacted tables afterwards, see `compact_event_store`.
+    """
+    if platform_game_ids is None:
+        platform_game_ids = get_local_platform_game_ids()
+    if not overwrite:
+        converted_platform_game_ids = get_converted_platform_game_ids(event_store_dir)
+        platform_game_ids = [
+            platform_game_id
+            for platform_game_id in platform_game_ids
+            if platform_game_id not in converted_platform_game_ids
+        ]
+    print(f"Converting {len(platform_game_ids)} games into {event_store_dir}")
+
+    num_converted = 0
+    if max_workers and max_workers > 1:
+        # workers leave game cache eviction to this process, see `game_cache.GameCache`
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker_game_cache,
+        ) as executor:
+            results = executor.map(
+                convert_game, platform_game_ids, [event_store_dir] * len(platform_game_ids), chunksize=4
+            )
+            for platform_game_id, is_converted in zip(platform_game_ids, results):
+                num_converted += is_converted
+                if num_converted and num_converted % 100 == 0:
+                    print(f"----- Converted {num_converted} games/{len(platform_game_ids)}")
+        get_game_cache().evict()
+    else:
+        for platform_game_id in platform_game_ids:
+            num_converted += convert_game(platform_game_id, event_store_dir)
+    print(f"Converted {num_converted} games, {len(platform_game_ids) - num_converted} could not be read")
+    if compact:
+        compact_event_store(event_store_dir)
+    return num_converted
+
+
+def read_event_table(
+    table_name: str,
+    columns: Optional[List[str]] = None,
+    platform_game_ids: Optional[List[str]] = None,
+    row_filter: Optional[ds.Expression] = None,
+    event_store_dir: str = EVENT_STORE_DIR,
+) -> pd.DataFrame:
+    """Rows of one table across every converted game, only reading the given columns.
+
+    Args:
+        platform_game_ids (list, optional): only rows of these games.
+        row_filter (Expression, optional): pyarrow dataset filter, e.g. `ds.field("game_time") < 600_000`. It is
+            applied while reading, row groups its statistics rule out are skipped.
+    """
+    schema = EVENT_STORE_SCHEMAS[table_name]
+    if platform_game_ids is not None:
+        game_filter = ds.field("platform_game_id").isin(platform_game_ids)
+        row_filter = game_filter if row_filter is None else row_filter & game_filter
+
+    tables = []
+    part_platform_game_ids = get_part_platform_game_ids(table_name, event_store_dir)
+    if os.path.isfile(get_table_path(table_name, event_store_dir)):
+        compacted_filter = row_filter
+        if part_platform_game_ids:
+            # games converted again since the last compaction
+            is_replaced = ds.field("platform_game_id").isin(part_platform_game_ids)
+            compacted_filter = ~is_replaced if row_filter is None else row_filter & ~is_replaced
+        dataset = ds.dataset(get_table_path(table_name, event_store_dir), schema=schema, format="parquet")
+        tables.append(dataset.to_table(columns=columns, filter=compacted_filter))
+    if part_platform_game_ids:
+        part_paths = [
+            get_part_path(table_name, platform_game_id, event_store_dir) for platform_game_id in part_platform_game_ids
+        ]
+        tables.append(
+            ds.dataset(part_paths, schema=schema, format="parquet").to_table(columns=columns, filter=row_filter)
+        )
+    if not tables:
+        tables.append(schema.empty_table().select(columns) if columns else schema.empty_table())
+    return pa.concat_tables(tables).to_pandas()
+
+
+def get_first_kill_teams(
+    platform_game_ids: Optional[List[str]] = None, event_store_dir: str = EVENT_STORE_DIR
+) -> pd.Series:
+    """platform_game_id -> team that drew first blood."""
+    kills_df = read_event_table(
+        "kills",
+        ["platform_game_id", "event_index", "killer_team_id"],
+        platform_game_ids=platform_game_ids,
+        event_store_dir=event_store_dir,
+    )
+    first_kills_df = kills_df.sort_values("event_index").drop_duplicates("platform_game_id")
+    return first_kills_df.set_index("platform_game_id")["killer_team_id"]
+
+
+def get_epic_monster_counts(
+    platform_game_ids: Optional[List[str]] = None, event_store_dir: str = EVENT_STORE_DIR
+) -> pd.DataFrame:
+    """(platform_game_id, team) -> number of dragons, barons and heralds the team took."""
+    monsters_df = read_event_table(
+        "epic_monsters",
+        ["platform_game_id", "monster_type", "killer_team_id"],
+        platform_game_ids=platform_game_ids,
+        event_store_dir=event_store_dir,
+    )
+    monster_counts_df = monsters_df.pivot_table(
+        index=["platform_game_id", "killer_team_id"], columns="monster_type", aggfunc="size", fill_value=0
+    )
+    return monster_counts_df.reindex(columns=[monster.value for monster in Monsters], fill_value=0)
+
+
+def get_team_stats_at(
+    game_time: int, platform_game_ids: Optional[List[str]] = None, event_store_dir: str = EVENT_STORE_DIR
+) -> pd.DataFrame:
+    """(platform_game_id, team_id) -> the team's stats in the last snapshot at or before `game_time` seconds."""
+    team_stats_df = read_event_table(
+        "team_stats",
+        ["platform_game_id", "event_index", "team_id", *TEAM_STATS],
+        platform_game_ids=platform_game_ids,
+        # snapshot times are in milliseconds, any time within the `game_time` second counts
+        row_filter=ds.field("game_time") < (game_time + 1) * 1000,
+        event_store_dir=event_store_dir,
+    )
+    last_snapshot_df = team_stats_df.sort_values("event_index").drop_duplicates(
+        ["platform_game_id", "team_id"], keep="last"
+    )
+    return last_snapshot_df.set_index(["platform_game_id", "team_id"])[TEAM_STATS]
@@ -0,0 +1,56 @@
+import os
+import threading
+from typing import Any, Dict, Optional, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from constants import EXTRACTED_GAMES_DIR, GAME_EXTRACTOR_VERSION
+
+# parquet schema metadata key the extractor version of a cached game is stored under
+EXTRACTOR_VERSION_KEY = b"extractor_version"
+
+
+class ExtractionCache:
+    """Extracted game rows (base game info plus `utils.get_game_event_data`), one single row parquet file per game.
+
+    A cached row is only used while it was extracted by the current `version`, so bumping
+    `GAME_EXTRACTOR_VERSION` after changing the extraction re-extracts every game on the next run
+    while tournaments can otherwise be rebuilt without touching the raw game files.
+    """
+
+    def __init__(self, cache_dir: str = EXTRACTED_GAMES_DIR, version: Union[int, str] = GAME_EXTRACTOR_VERSION):
+        self.cache_dir = cache_dir
+        self.version = str(version)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_path(self, platform_game_id: str) -> str:
+        return f"{self.cache_dir}/{platform_game_id}.parquet"
+
+    def get_version(self, platform_game_id: str) -> Optional[str]:
+        """Extractor version of the cached row, None if the game was never extracted. Only reads the file footer."""
+        try:
+            metadata = pq.read_schema(self.get_path(platform_game_id)).metadata or {}
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        return metadata[EXTRACTOR_VERSION_KEY].decode() if EXTRACTOR_VERSION_KEY in metadata else None
+
+    def __contains__(self, platform_game_id: str) -> bool:
+        """Whether the game has a row extracted by the current version."""
+        return self.get_version(platform_game_id) == self.version
+
+    def load(self, platform_game_id: str) -> Optional[Dict[str, Any]]:
+        """Cached row of a game, None if it is missing or was extracted by another version."""
+        if platform_game_id not in self:
+            return None
+        return pq.read_table(self.get_path(platform_game_id)).to_pylist()[0]
+
+    def put(self, platform_game_id: str, game_data: Dict[str, Any]) -> None:
+        table = pa.Table.from_pylist([game_data])
+        table = table.replace_schema_metadata({EXTRACTOR_VERSION_KEY: self.version.encode()})
+        temporary_path = f"{self.get_path(platform_game_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            pq.write_table(table, temporary_path)
+            os.replace(temporary_path, self.get_path(platform_game_id))
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
@@ -1,10 +1,11 @@
 import json
 import os
-from collections import deque
+from collections import OrderedDict, deque
 from typing import List, Tuple
 
 import pandas as pd
 from constants import BLUE_CHAMPION_COLUMNS, CLASSIFICATION_CODES, CREATED_DATA_DIR, RED_CHAMPION_COLUMNS
+from mapped_games import get_league_tournament_slugs, read_mapped_games
 
 
 def gather_tournament_features_per_team(directory_path: str, output_file: str):
@@ -29,16 +30,16 @@ def gather_tournament_features_per_team(directory_path: str, output_file: str):
         if f.endswith(".csv")
     ]
 
-    worlds_2022 = ("98767975604431411", "worlds_2022.csv")
+    worlds_2022 = ("98767975604431411", "worlds_2022")
 
     # for league_id, csv_file in csv_files:
-    df = pd.read_csv(os.path.join(directory_path, worlds_2022[0], worlds_2022[1]))
+    df = read_mapped_games(*worlds_2022)
     team_feature_extracted_df = extract_team_features(df)
     # team_feature_extracted_df.to_csv(os.path.join(directory_path, league_id, f"TEAM_FE_{csv_file}"), index=False)
     # print(f"Extracted team features for {league_id} - {csv_file}")
 
 
-def get_sorted_tournaments_by_date(directory_path: str, output_file: str):
+def get_sorted_tournaments_by_date(output_file: str):
     specific_leagues = [
         "98767991299243165",  # LCS
         "98767991310872058",  # LCK
@@ -55,17 +56,18 @@ def get_sorted_tournaments_by_date(directory_path: str, output_file: str):
         "105709090213554609",  # LCO
     ]
 
-    csv_files = [
-        (league_id, f)
+    league_tournaments = [
+        (league_id, tournament_slug)
         for league_id in specific_leagues
-        for f in os.listdir(f"{directory_path}/{league_id}")
-        if f.endswith(".csv")
+        for tournament_slug in get_league_tournament_slugs(league_id)
     ]
 
     dfs = deque()
 
-    for league_id, csv_file in csv_files:
-        df = pd.read_csv(os.path.join(directory_path, league_id, csv_file))
+    for league_id, tournament_slug in league_tournaments:
+        df = read_mapped_games(
+            league_id, tournament_slug, columns=["league_id", "tournament_id", "tournament_slug", "game_date"]
+        )
         if not dfs:
             dfs.append(df.iloc[0][["league_id", "tournament_id", "tournament_slug", "game_date"]])
         oldest_game_date = df.iloc[0]["game_date"]
@@ -81,8 +83,58 @@ def get_sorted_tournaments_by_date(directory_path: str, output_file: str):
     concatenated.to_csv(output_file, index=False)
 
 
-def get_all_champion_stats(champion_mapping: dict, unique_teams: List[str]):
-    all_champion_stats = {}
+class ChampionStatsCache:
+    """LRU cache of parsed `<slug>_champion_mapping.json` files.
+
+    Entries are keyed by the mapping path (one per tournament) and validated against the file's
+    mtime and size, so a regenerated mapping is re-parsed on the next lookup. Every stage of a
+    tournament, `extract_team_features` and the ELO loop share the same parsed table.
+    """
+
+    def __init__(self, max_size: int = 64):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], dict, dict]]" = OrderedDict()
+
+    def get(self, path_to_champion_mapping: str) -> Tuple[dict, dict]:
+        """Returns the parsed champion mapping and its per champion totals
+        ({champion: {"games_played", "games_won"}})."""
+        file_stat = os.stat(path_to_champion_mapping)
+        file_version = (file_stat.st_mtime_ns, file_stat.st_size)
+
+        entry = self._entries.get(path_to_champion_mapping)
+        if entry is not None and entry[0] == file_version:
+            self.hits += 1
+            self._entries.move_to_end(path_to_champion_mapping)
+            return entry[1], entry[2]
+
+        self.misses += 1
+        with open(path_to_champion_mapping, "r") as f:
+            champion_mapping = json.load(f)
+        champion_totals = get_champion_totals(champion_mapping)
+
+        self._entries[path_to_champion_mapping] = (file_version, champion_mapping, champion_totals)
+        self._entries.move_to_end(path_to_champion_mapping)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return champion_mapping, champion_totals
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_size}
+
+
+champion_stats_cache = ChampionStatsCache()
+
+
+def get_champion_totals(champion_mapping: dict) -> dict:
+    """Games played and won per champion over every side/role of a champion mapping."""
+    champion_totals = {}
     all_cols = [*BLUE_CHAMPION_COLUMNS, *RED_CHAMPION_COLUMNS]
     for role_col in all_cols:
         side = role_col.split("_")[1]
@@ -90,17 +142,15 @@ def get_all_champion_stats(champion_mapping: dict, unique_teams: List[str]):
         role_data = champion_mapping[side][role]
         for champ_stats in role_data:
             champion_name = list(champ_stats.keys())[0]
-            if champion_name not in all_champion_stats:
-                all_champion_stats[champion_name] = {"games_played": 0, "games_won": 0, "teams": set()}
+            if champion_name not in champion_totals:
+                champion_totals[champion_name] = {"games_played": 0, "games_won": 0}
 
-            all_champion_stats[champion_name]["games_played"] += champ_stats[champion_name]
-            all_champion_stats[champion_name]["games_won"] += round(
+            champion_totals[champion_name]["games_played"] += champ_stats[champion_name]
+            champion_totals[champion_name]["games_won"] += round(
                 (champ_stats[champion_name] * champ_stats["winRate"]) / 100
             )
 
-            all_champion_stats[champion_name]["teams"] |= set(unique_teams)
-
-    return all_champion_stats
+    return champion_totals
 
 
 def get_op_champions(path_to_champion_mapping: str, total_games: int, unique_teams: List[str]):
@@ -112,27 +162,28 @@ def get_op_champions(path_to_champion_mapping: str, total_games: int, unique_tea
     Picked by Multiple Teams: The champion should be picked by more than a certain number of unique teams.
     Threshold to 25% of all unique teams for now.
 
+    The parsed mapping comes from `champion_stats_cache`, so the JSON is only read once per tournament.
+
     Args:
         path_to_champion_mapping (str): _description_
         total_games (int): _description_
     """
-    with open(path_to_champion_mapping, "r") as f:
-        champion_mapping = json.load(f)
+    _, champion_totals = champion_stats_cache.get(path_to_champion_mapping)
 
     op_pick_rate_threshold = 0.20 * total_games
     op_team_threshold = 0.25 * len(unique_teams)
     op_criteria_win_rate = 50
-
-    all_champion_stats = get_all_champion_stats(champion_mapping, unique_teams)
+    # every champion is credited to every team of the tournament, so each one was picked by all of them
+    num_teams = len(set(unique_teams))
 
     # Determine OP champions
     op_champions = []
-    for champ, stats in all_champion_stats.items():
+    for champ, stats in champion_totals.items():
         win_rate = (stats["games_won"] / stats["games_played"]) * 100
         if (
             stats["games_played"] > op_pick_rate_threshold
             and win_rate > op_criteria_win_rate
-            and len(stats["teams"]) > op_team_threshold
+            and num_teams > op_team_threshold
         ):
             op_champions.append(champ)
 
@@ -282,6 +333,5 @@ if __name__ == "__main__":
     #     output_file=f"{CREATED_DATA_DIR}/mapped-tournament-features-per-team.csv",
     # )
     get_sorted_tournaments_by_date(
-        directory_path=f"{CREATED_DATA_DIR}/mapped-games",
         output_file=f"{CREATED_DATA_DIR}/sorted-tournaments.csv",
     )
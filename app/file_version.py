@@ -0,0 +1,9 @@
+import os
+from typing import List
+
+
+def get_file_version(path: str) -> List[int]:
+    """[mtime in ns, size] of a file, changes whenever the file is rewritten. JSON serializable, so it can be
+    stored next to whatever was derived from the file."""
+    file_stat = os.stat(path)
+    return [file_stat.st_mtime_ns, file_stat.st_size]
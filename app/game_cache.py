@@ -0,0 +1,268 @@
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, TextIO
+
+from constants import GAME_CACHE_INDEX_FILE, GAME_CACHE_MAX_BYTES, GAMES_DIR
+
+
+class GameCache:
+    """Local copies of game files, stored gzip compressed as downloaded and decompressed on read.
+
+    The cache keeps its total size under `max_bytes` by evicting the least recently used games. Eviction
+    goes down to `evict_to_ratio` of the budget, so a full cache doesn't evict again on every write.
+    Sizes and access times are kept in memory and saved to an index file next to the games every
+    `flush_every` changes and on `flush`/`close`. Several processes can share a cache directory:
+    a saved index is merged with the one on disk, and the index is reconciled with the directory
+    listing when the cache is created and before games are evicted.
+
+    Within a process pool only the parent owns the index: workers get a cache with `owns_index=False`
+    (see `init_worker_game_cache`) that reads and commits games but never evicts or writes the index,
+    so workers can't evict each other's games. The parent picks up games its workers downloaded when it
+    next evicts, records their reads with `touch`, and never evicts `pinned` games.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = GAMES_DIR,
+        max_bytes: int = GAME_CACHE_MAX_BYTES,
+        flush_every: int = 100,
+        evict_to_ratio: float = 0.9,
+        owns_index: bool = True,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.evict_to_ratio = evict_to_ratio
+        self.flush_every = flush_every
+        self.owns_index = owns_index
+        self.index_path = f"{cache_dir}/{GAME_CACHE_INDEX_FILE}"
+        self._lock = threading.RLock()
+        self._num_unsaved_changes = 0
+        self._pinned: Dict[str, int] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index = self._read_index() if owns_index else {}
+        self._total_bytes = sum(entry["size"] for entry in self._index.values())
+
+    def get_path(self, platform_game_id: str) -> str:
+        return f"{self.cache_dir}/{platform_game_id}.json.gz"
+
+    def get_temporary_path(self, platform_game_id: str) -> str:
+        return f"{self.get_path(platform_game_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def __contains__(self, platform_game_id: str) -> bool:
+        return os.path.exists(self.get_path(platform_game_id))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _read_index_file(self) -> Dict[str, dict]:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            print(f"Game cache index {self.index_path} is corrupt, rebuilding it")
+            return {}
+
+    def _read_index(self) -> Dict[str, dict]:
+        """Index on disk, reconciled with the games actually in the cache directory."""
+        index = self._read_index_file()
+        cached_games = {}
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith(".json.gz"):
+                platform_game_id = file_name[: -len(".json.gz")]
+                if platform_game_id in index:
+                    cached_games[platform_game_id] = index[platform_game_id]
+                else:
+                    file_stat = os.stat(f"{self.cache_dir}/{file_name}")
+                    cached_games[platform_game_id] = {"size": file_stat.st_size, "last_access": file_stat.st_mtime}
+        return cached_games
+
+    def _merge_index(self, index: Dict[str, dict]) -> None:
+        """Adds games another process recorded and keeps the most recent access of each game."""
+        for platform_game_id, entry in index.items():
+            if platform_game_id in self._index:
+                self._index[platform_game_id]["last_access"] = max(
+                    self._index[platform_game_id]["last_access"], entry["last_access"]
+                )
+            else:
+                self._index[platform_game_id] = entry
+        self._total_bytes = sum(entry["size"] for entry in self._index.values())
+
+    def _write_index(self) -> None:
+        with open(f"{self.index_path}.{os.getpid()}.tmp", "w") as f:
+            json.dump(self._index, f)
+        os.replace(f"{self.index_path}.{os.getpid()}.tmp", self.index_path)
+        self._num_unsaved_changes = 0
+
+    def flush(self) -> None:
+        """Saves the index, merged with the one on disk."""
+        if not self.owns_index:
+            return
+        with self._lock:
+            self._merge_index(self._read_index_file())
+            self._write_index()
+
+    def close(self) -> None:
+        if self._num_unsaved_changes:
+            self.flush()
+
+    def __enter__(self) -> "GameCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _record_change(self) -> None:
+        self._num_unsaved_changes += 1
+        if self._num_unsaved_changes >= self.flush_every:
+            self.flush()
+
+    def touch(self, platform_game_id: str) -> None:
+        """Records an access to a cached game, e.g. one a pool worker read."""
+        if self.owns_index and platform_game_id in self:
+            self._touch(platform_game_id)
+
+    def _touch(self, platform_game_id: str) -> None:
+        if not self.owns_index:
+            return
+        with self._lock:
+            entry = self._index.get(platform_game_id)
+            if entry is None:
+                entry = self._index[platform_game_id] = {
+                    "size": os.path.getsize(self.get_path(platform_game_id)),
+                    "last_access": 0.0,
+                }
+                self._total_bytes += entry["size"]
+            entry["last_access"] = time.time()
+            self._record_change()
+
+    @contextmanager
+    def open(self, platform_game_id: str) -> Iterator[Optional[TextIO]]:
+        """Decompressing text stream over a cached game, None if the game is not cached."""
+        if platform_game_id not in self:
+            yield None
+            return
+        self._touch(platform_game_id)
+        with gzip.open(self.get_path(platform_game_id), "rt", encoding="utf-8") as f:
+            yield f
+
+    def load(self, platform_game_id: str) -> Optional[list]:
+        """Whole game events list, None if the game is not cached."""
+        with self.open(platform_game_id) as f:
+            return json.load(f) if f is not None else None
+
+    def commit(self, platform_game_id: str, temporary_path: str) -> None:
+        """Moves a completely written game file into the cache. Least recently used games are evicted
+        once the cache goes over budget."""
+        os.replace(temporary_path, self.get_path(platform_game_id))
+        if not self.owns_index:
+            return
+        with self._lock:
+            previous_entry = self._index.get(platform_game_id)
+            if previous_entry is not None:
+                self._total_bytes -= previous_entry["size"]
+            self._index[platform_game_id] = {
+                "size": os.path.getsize(self.get_path(platform_game_id)),
+                "last_access": time.time(),
+            }
+            self._total_bytes += self._index[platform_game_id]["size"]
+            if self._total_bytes > self.max_bytes:
+                self.evict(keep=platform_game_id)
+            else:
+                self._record_change()
+
+    @contextmanager
+    def pinned(self, platform_game_ids: Iterable[str]) -> Iterator[None]:
+        """Games that are not evicted inside the block, e.g. those a process pool is about to read."""
+        platform_game_ids = list(dict.fromkeys(platform_game_ids))
+        with self._lock:
+            for platform_game_id in platform_game_ids:
+                self._pinned[platform_game_id] = self._pinned.get(platform_game_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for platform_game_id in platform_game_ids:
+                    self._pinned[platform_game_id] -= 1
+                    if not self._pinned[platform_game_id]:
+                        del self._pinned[platform_game_id]
+
+    @contextmanager
+    def writer(self, platform_game_id: str) -> Iterator[BinaryIO]:
+        """Binary file to write a game's gzip bytes to. The game only becomes visible once the block
+        exits without an error, see `commit`."""
+        temporary_path = self.get_temporary_path(platform_game_id)
+        try:
+            with open(temporary_path, "wb") as f:
+                yield f
+            self.commit(platform_game_id, temporary_path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    def put(self, platform_game_id: str, gzip_bytes: bytes) -> None:
+        with self.writer(platform_game_id) as f:
+            f.write(gzip_bytes)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Removes least recently used games, never `keep` or pinned ones, until the cache is back to
+        `evict_to_ratio` of `max_bytes` if it went over. Returns the number of games removed. Does nothing in a
+        cache that doesn't own the index."""
+        if not self.owns_index:
+            return 0
+        with self._lock:
+            # games other processes added or evicted count too
+            index = self._read_index()
+            for platform_game_id in list(self._index):
+                if platform_game_id not in index:
+                    del self._index[platform_game_id]
+            self._merge_index(index)
+
+            num_evicted = 0
+            target_bytes = (
+                self.max_bytes * self.evict_to_ratio if self._total_bytes > self.max_bytes else self.max_bytes
+            )
+            for platform_game_id, entry in sorted(self._index.items(), key=lambda item: item[1]["last_access"]):
+                if self._total_bytes <= target_bytes:
+                    break
+                if platform_game_id == keep or platform_game_id in self._pinned:
+                    continue
+                if os.path.exists(self.get_path(platform_game_id)):
+                    os.remove(self.get_path(platform_game_id))
+                del self._index[platform_game_id]
+                self._total_bytes -= entry["size"]
+                num_evicted += 1
+            # just reconciled with the directory, merging the index file again would bring evicted games back
+            self._write_index()
+            if num_evicted:
+                print(f"Game cache evicted {num_evicted} games, {self._total_bytes / 1024 ** 2:.1f} MB in use")
+            return num_evicted
+
+
+_game_cache: Optional[GameCache] = None
+
+
+def get_game_cache() -> GameCache:
+    """Process wide cache over `GAMES_DIR`, created on first use."""
+    global _game_cache
+    if _game_cache is None:
+        _game_cache = GameCache()
+        # access times recorded since the last flush are saved when the process exits
+        atexit.register(_game_cache.close)
+    return _game_cache
+
+
+def init_worker_game_cache() -> None:
+    """Process pool initializer, the process wide cache of a worker leaves eviction and the index to the parent."""
+    global _game_cache
+    _game_cache = GameCache(owns_index=False)
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import threading
+import zlib
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional
+
+import aiohttp
+from constants import S3_BUCKET_URL
+from game_cache import GameCache, get_game_cache
+
+# responses worth retrying, anything else (e.g. 404 for a game that was never uploaded) fails right away
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def write_chunk(f: BinaryIO, decompressor, chunk: bytes) -> None:
+    f.write(chunk)
+    decompressor.decompress(chunk)
+
+
+def remove_temporary_file(f: BinaryIO, temporary_path: str) -> None:
+    """Cleans up after a download that didn't make it into the cache."""
+    f.close()
+    if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+
+
+class GameFetcher:
+    """Downloads gzipped game files into the game cache, which `utils.open_game_data_stream` reads
+    before falling back to S3.
+
+    All downloads share one pooled client session, at most `max_concurrency` run at once and failed
+    requests are retried with exponential backoff. Files are written compressed chunk by chunk as they
+    arrive, and decompressed on the way to check they are complete, so a game is never held in memory whole.
+    Disk work happens on worker threads, off the event loop.
+    """
+
+    def __init__(
+        self,
+        base_url: str = S3_BUCKET_URL,
+        game_cache: Optional[GameCache] = None,
+        max_concurrency: int = 16,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        timeout_seconds: float = 120,
+        chunk_size: int = 1 << 16,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.game_cache = game_cache if game_cache is not None else get_game_cache()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self.chunk_size = chunk_size
+
+    async def download_game(self, session: aiohttp.ClientSession, platform_game_id: str) -> bool:
+        """Downloads one game unless it is already on disk. Returns whether the game is available locally."""
+        if platform_game_id in self.game_cache:
+            return True
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+            try:
+                async with session.get(f"{self.base_url}/{platform_game_id}.json.gz") as response:
+                    if response.status in RETRY_STATUSES:
+                        print(f"{platform_game_id} - HTTP {response.status}, attempt {attempt + 1}")
+                        continue
+                    if response.status != 200:
+                        print(f"Failed to request {platform_game_id} from {self.base_url}: HTTP {response.status}")
+                        return False
+
+                    # 16 + MAX_WBITS: expect a gzip header. The decompressed data is only used to catch a
+                    # truncated download, which aborts the write before the game is added to the cache
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    temporary_path = self.game_cache.get_temporary_path(platform_game_id)
+                    # file writes and the cache commit run on worker threads, so a slow disk or an eviction
+                    # doesn't hold up the other downloads on the event loop
+                    f = await asyncio.to_thread(open, temporary_path, "wb")
+                    try:
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            await asyncio.to_thread(write_chunk, f, decompressor, chunk)
+                        await asyncio.to_thread(f.close)
+                        if not decompressor.eof:
+                            raise zlib.error("truncated gzip stream")
+                        await asyncio.to_thread(self.game_cache.commit, platform_game_id, temporary_path)
+                    finally:
+                        await asyncio.to_thread(remove_temporary_file, f, temporary_path)
+                return True
+            except (aiohttp.ClientError, asyncio.TimeoutError, zlib.error) as e:
+                print(f"{platform_game_id} - download failed, attempt {attempt + 1}: {e!r}")
+
+        print(f"Failed to download {platform_game_id} after {self.max_retries + 1} attempts")
+        return False
+
+    async def download_games(
+        self, platform_game_ids: Iterable[str], on_done: Optional[Callable[[str, bool], None]] = None
+    ) -> Dict[str, bool]:
+        """Downloads every game, started in the given order. `on_done(platform_game_id, is_available)` is
+        called as soon as each game finishes. Returns whether each game is available locally."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def download(session: aiohttp.ClientSession, platform_game_id: str) -> bool:
+            async with semaphore:
+                is_available = await self.download_game(session, platform_game_id)
+            if on_done:
+                on_done(platform_game_id, is_available)
+            return is_available
+
+        # the .gz files are decompressed here, so the session must not undo a gzip content encoding itself
+        async with aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds),
+            auto_decompress=False,
+        ) as session:
+            platform_game_ids = list(dict.fromkeys(platform_game_ids))
+            try:
+                results = await asyncio.gather(
+                    *(download(session, platform_game_id) for platform_game_id in platform_game_ids)
+                )
+            finally:
+                # the cache only saves its index every so many games
+                await asyncio.to_thread(self.game_cache.flush)
+        return dict(zip(platform_game_ids, results))
+
+    def fetch_games(self, platform_game_ids: Iterable[str]) -> Dict[str, bool]:
+        """Blocking `download_games`."""
+        return asyncio.run(self.download_games(platform_game_ids))
+
+
+class GamePrefetcher:
+    """Runs a `GameFetcher` on a background thread, so games are downloaded while earlier ones are
+    being extracted. `wait` blocks until a given game is done."""
+
+    def __init__(self, fetcher: Optional[GameFetcher] = None):
+        self.fetcher = fetcher or GameFetcher()
+        self._done_events: Dict[str, threading.Event] = {}
+        self._is_available: Dict[str, bool] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, platform_game_ids: Iterable[str]) -> "GamePrefetcher":
+        platform_game_ids = list(dict.fromkeys(platform_game_ids))
+        self._done_events = {platform_game_id: threading.Event() for platform_game_id in platform_game_ids}
+        self._thread = threading.Thread(target=self._run, args=(platform_game_ids,), daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self, platform_game_ids: List[str]) -> None:
+        try:
+            asyncio.run(self.fetcher.download_games(platform_game_ids, self._set_done))
+        finally:
+            # never leave a caller waiting on a game the fetcher gave up on
+            for done_event in self._done_events.values():
+                done_event.set()
+
+    def _set_done(self, platform_game_id: str, is_available: bool) -> None:
+        self._is_available[platform_game_id] = is_available
+        self._done_events[platform_game_id].set()
+
+    def wait(self, platform_game_id: str, timeout: Optional[float] = None) -> bool:
+        """Whether the game is available locally once its download has finished (False if it was
+        never requested or `timeout` runs out)."""
+        done_event = self._done_events.get(platform_game_id)
+        if done_event is None or not done_event.wait(timeout):
+            return False
+        return self._is_available.get(platform_game_id, False)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "GamePrefetcher":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,272 @@
+import heapq
+import os
+from typing import Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from constants import (
+    BASE_K_VALUES,
+    CREATED_DATA_DIR,
+    GAME_RATING_COLUMNS,
+    K_VALUE_BONUSES,
+    MAJOR_REGION_MODIFIERS,
+    REGION_ELO_MODIFIERS,
+)
+from elo import (
+    SORTED_LEAGUE_TOURNAMENTS,
+    get_losing_teams,
+    get_stage_base_k_value_names,
+    get_stage_k_features,
+    get_stage_op_champions,
+    get_unique_stage_names,
+    get_unique_team_names,
+    get_weighted_k_value,
+    reference_data,
+)
+from mapped_games import get_mapped_games_version, read_mapped_games
+from rating_checkpoint import (
+    RATING_CHECKPOINT_PATH,
+    get_checkpoint_engine,
+    is_game_after_checkpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from rating_engine import RatingEngine
+from rating_history import RATING_HISTORY_PATH, RatingHistory, to_days
+
+GLOBAL_ELO_PATH = f"{CREATED_DATA_DIR}/global_elo.csv"
+
+
+class GameRecord(NamedTuple):
+    game_date: str
+    game_number: int
+    game_id: str
+    league_id: str
+    tournament_slug: str
+    stage_name: str
+    winner: str
+    loser: str
+    k_value: float
+
+
+def get_sorted_tournaments(by_date: Optional[str] = None) -> List[Tuple[str, str, str]]:
+    """(league_id, tournament_slug, first game date) of every rated tournament, oldest first."""
+    sorted_league_tournaments = pd.read_csv(SORTED_LEAGUE_TOURNAMENTS, dtype={"league_id": str})
+    if by_date:
+        sorted_league_tournaments = sorted_league_tournaments[sorted_league_tournaments["game_date"] < by_date]
+    return list(
+        zip(
+            sorted_league_tournaments["league_id"],
+            sorted_league_tournaments["tournament_slug"],
+            sorted_league_tournaments["game_date"],
+        )
+    )
+
+
+def read_tournament_games(league_id: str, tournament_slug: str) -> pd.DataFrame:
+    """Rating columns of a tournament's games in (game_date, game_number) order, with the winning and losing team
+    of each game."""
+    tournament_df = read_mapped_games(league_id, tournament_slug, columns=GAME_RATING_COLUMNS)
+    # `merge_tournament_games` relies on every tournament being in game order
+    tournament_df.sort_values(by=["game_date", "game_number"], kind="stable", inplace=True, ignore_index=True)
+    tournament_df["winning_team"] = np.where(
+        tournament_df["game_winner"] == 100, tournament_df["team_100_blue_name"], tournament_df["team_200_red_name"]
+    )
+    tournament_df["losing_team"] = get_losing_teams(tournament_df)
+    return tournament_df
+
+
+def get_tournament_k_features(tournament_df: pd.DataFrame, rated_teams: Set[str]) -> pd.DataFrame:
+    """Base K value name and K features of every game of a tournament, in row order.
+
+    OP champions are picked per stage against every team rated so far, as `elo.process_tournament_elo` does with
+    the teams of its ELO table: each stage's teams are added to `rated_teams` in place before its games are
+    weighted, so tournaments must be passed in rating order.
+    """
+    stage_features = []
+    for stage_name in get_unique_stage_names(tournament_df):
+        stage_df = tournament_df[tournament_df["stage_name"] == stage_name]
+        rated_teams |= get_unique_team_names(stage_df)
+        op_champions = get_stage_op_champions(stage_df, list(rated_teams))
+        stage_features.append(
+            pd.DataFrame(
+                {
+                    "base_k_value_name": get_stage_base_k_value_names(stage_df),
+                    **get_stage_k_features(stage_df, op_champions),
+                },
+                index=stage_df.index,
+            )
+        )
+    return pd.concat(stage_features).reindex(tournament_df.index)
+
+
+def get_tournament_k_values(tournament_df: pd.DataFrame, rated_teams: Set[str]) -> np.ndarray:
+    """Weighted K value of every game of a tournament, in row order, see `get_tournament_k_features`."""
+    k_features_df = get_tournament_k_features(tournament_df, rated_teams)
+    loser_leagues = tournament_df["losing_team"].map(reference_data.get_team_league)
+    return get_weighted_k_value(
+        np.array([BASE_K_VALUES[name] for name in k_features_df["base_k_value_name"]], dtype=np.float64),
+        loser_leagues.map(MAJOR_REGION_MODIFIERS).to_numpy(dtype=np.float64),
+        {feature_name: k_features_df[feature_name].to_numpy() for feature_name in K_VALUE_BONUSES},
+    )
+
+
+def iter_tournament_games(league_id: str, tournament_slug: str, rated_teams: Set[str]) -> Iterator[GameRecord]:
+    """Yields the games of one tournament in (game_date, game_number) order with their weighted K value.
+
+    The tournament is only read when the first game is requested, and only the columns
+    needed for rating are read. Its teams are then added to `rated_teams`, see `get_tournament_k_features`.
+    """
+    tournament_df = read_tournament_games(league_id, tournament_slug)
+    # K values depend on the OP champions of the whole stage, so they are computed per stage up front
+    k_values = get_tournament_k_values(tournament_df, rated_teams)
+
+    for game, k_value in zip(
+        tournament_df[["game_date", "game_number", "game_id", "stage_name", "winning_team", "losing_team"]].itertuples(
+            index=False
+        ),
+        k_values.tolist(),
+    ):
+        yield GameRecord(
+            game_date=game.game_date,
+            game_number=int(game.game_number),
+            game_id=game.game_id,
+            league_id=league_id,
+            tournament_slug=tournament_slug,
+            stage_name=game.stage_name,
+            winner=game.winning_team,
+            loser=game.losing_team,
+            k_value=k_value,
+        )
+
+
+def merge_tournament_games(
+    tournaments: List[Tuple[str, str, str]], rated_teams: Optional[Set[str]] = None
+) -> Iterator[GameRecord]:
+    """k-way merge of every tournament's games in (game_date, game_number) order across leagues.
+
+    A heap holds one entry per tournament: either the next game of an open tournament, or a
+    placeholder keyed on the tournament's first game date. A tournament is only read once the
+    merge reaches its first day, so memory is bounded by the tournaments running at the same time
+    instead of the whole history. Ties are broken by tournament order, then game order.
+
+    Tournaments are opened in the given order, which is the order their teams join `rated_teams` (teams rated
+    before the first tournament, e.g. from a checkpoint).
+    """
+    rated_teams = set() if rated_teams is None else rated_teams
+    heap = [
+        ((first_game_date, -1, order, -1), order, None, None)
+        for order, (_, _, first_game_date) in enumerate(tournaments)
+    ]
+    heapq.heapify(heap)
+
+    while heap:
+        _, order, game, games = heapq.heappop(heap)
+        if games is None:
+            league_id, tournament_slug, _ = tournaments[order]
+            games = enumerate(iter_tournament_games(league_id, tournament_slug, rated_teams))
+        else:
+            yield game
+
+        position, next_game = next(games, (None, None))
+        if next_game is not None:
+            heapq.heappush(
+                heap, ((next_game.game_date, next_game.game_number, order, position), order, next_game, games)
+            )
+
+
+def process_global_ratings(
+    by_date: Optional[str] = None,
+    batch_size: int = 1024,
+    output_file: Optional[str] = GLOBAL_ELO_PATH,
+    incremental: bool = False,
+    checkpoint_path: Optional[str] = RATING_CHECKPOINT_PATH,
+    history_path: Optional[str] = RATING_HISTORY_PATH,
+) -> RatingEngine:
+    """Rates every game of every tournament in true game order across leagues, instead of one
+    tournament at a time. A team starts at its region's ELO the first time it plays.
+
+    Args:
+        incremental (bool): resume from the rating checkpoint and only apply games played after it.
+            Tournament files that have not changed since the checkpoint are not read at all. Falls back
+            to a full replay when there is no usable checkpoint (missing, or K values/region modifiers changed).
+        checkpoint_path (str, optional): where the rating checkpoint is read from and written to, None to disable.
+        history_path (str, optional): where every rating change is stored for `RatingHistory` queries, None to
+            disable. Incremental runs append to the existing history.
+    """
+    checkpoint = load_checkpoint(checkpoint_path) if incremental and checkpoint_path else None
+    tournaments = get_sorted_tournaments(by_date)
+    tournament_versions = {
+        f"{league_id}/{tournament_slug}": get_mapped_games_version(league_id, tournament_slug)
+        for league_id, tournament_slug, _ in tournaments
+    }
+
+    if checkpoint:
+        engine = get_checkpoint_engine(checkpoint, track_history=bool(history_path))
+        last_game_date, last_game_ids = checkpoint["last_game_date"], set(checkpoint["last_game_ids"])
+        tournaments = [
+            (league_id, tournament_slug, first_game_date)
+            for league_id, tournament_slug, first_game_date in tournaments
+            if checkpoint["tournament_versions"].get(f"{league_id}/{tournament_slug}")
+            != tournament_versions[f"{league_id}/{tournament_slug}"]
+        ]
+        print(f"Resuming from rating checkpoint at {last_game_date}, {len(tournaments)} tournaments changed")
+    else:
+        engine = RatingEngine(track_history=bool(history_path))
+        last_game_date, last_game_ids = None, set()
+    winners, losers, k_values, game_dates = [], [], [], []
+
+    def apply_batch():
+        engine.replay(
+            engine.encode(winners),
+            engine.encode(losers),
+            np.asarray(k_values, dtype=np.float64),
+            to_days(game_dates) if history_path else None,
+        )
+        winners.clear()
+        losers.clear()
+        k_values.clear()
+        game_dates.clear()
+
+    num_games = 0
+    for game in merge_tournament_games(tournaments, set(engine.teams)):
+        if by_date and game.game_date >= by_date:
+            break
+        if checkpoint and not is_game_after_checkpoint(game.game_date, game.game_id, checkpoint):
+            continue
+        for team in (game.winner, game.loser):
+            if team not in engine:
+                engine.add_team(team, REGION_ELO_MODIFIERS[reference_data.get_team_league(team)])
+        winners.append(game.winner)
+        losers.append(game.loser)
+        k_values.append(game.k_value)
+        game_dates.append(game.game_date)
+        num_games += 1
+        if len(winners) == batch_size:
+            apply_batch()
+
+        if game.game_date != last_game_date:
+            last_game_date, last_game_ids = game.game_date, set()
+        last_game_ids.add(game.game_id)
+    apply_batch()
+
+    print(f"Processed {num_games} games across {len(engine)} teams")
+    if checkpoint_path:
+        # a run cut short by by_date has not consumed its tournaments, so they must be re-read next time
+        save_checkpoint(
+            engine, last_game_date, list(last_game_ids), {} if by_date else tournament_versions, checkpoint_path
+        )
+    if history_path:
+        history = engine.get_history()
+        if checkpoint and os.path.exists(history_path):
+            history = RatingHistory.load(history_path).append(history)
+        history.save(history_path)
+    if output_file:
+        elo_df = engine.to_elo_df().sort_values(by=["ELO"], ascending=False)
+        elo_df.to_csv(output_file, index=False)
+        print(elo_df)
+    return engine
+
+
+if __name__ == "__main__":
+    process_global_ratings()
@@ -0,0 +1,159 @@
+import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+def get_value_kind(value: Any) -> Optional[str]:
+    """numpy dtype a column holding `value` is stored as, None for a missing value."""
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return "bool"
+    if isinstance(value, (int, np.integer)):
+        return "int64"
+    if isinstance(value, (float, np.floating)):
+        return "float64"
+    if isinstance(value, (datetime.datetime, np.datetime64)):
+        return "datetime64[ns]"
+    return "object"
+
+
+def get_common_kind(kind: str, other_kind: str) -> str:
+    """Kind able to hold values of both kinds, ints widen to floats and anything else mixed is kept as objects."""
+    if kind == other_kind:
+        return kind
+    if {kind, other_kind} == {"int64", "float64"}:
+        return "float64"
+    return "object"
+
+
+class ColumnBuffer:
+    """Typed values of one column, with a validity mask for the rows the column is missing from."""
+
+    def __init__(self, kind: str, capacity: int):
+        self.kind = kind
+        self.values = np.empty(capacity, dtype=kind)
+        self.is_valid = np.zeros(capacity, dtype=bool)
+
+    def resize(self, capacity: int) -> None:
+        values = np.empty(capacity, dtype=self.kind)
+        values[: self.values.shape[0]] = self.values
+        is_valid = np.zeros(capacity, dtype=bool)
+        is_valid[: self.is_valid.shape[0]] = self.is_valid
+        self.values, self.is_valid = values, is_valid
+
+    def convert(self, kind: str) -> None:
+        """Changes the stored kind, existing values are kept (ints become floats, anything becomes an object)."""
+        values = np.empty(self.values.shape[0], dtype=kind)
+        if kind == "object":
+            values[self.is_valid] = pd.Series(self.values[self.is_valid]).tolist()
+        else:
+            values[self.is_valid] = self.values[self.is_valid].astype(kind)
+        self.kind, self.values = kind, values
+
+    def set(self, row: int, value: Any) -> None:
+        if self.kind == "datetime64[ns]":
+            value = pd.Timestamp(value).to_datetime64()
+        self.values[row] = value
+        self.is_valid[row] = True
+
+    def to_array(self, num_rows: int):
+        """First `num_rows` values. Missing values become NaN for floats, NaT for dates and None for objects, while
+        int and bool columns with missing values become nullable (`Int64`, `boolean`) instead of floats."""
+        values, is_valid = self.values[:num_rows], self.is_valid[:num_rows]
+        if is_valid.all():
+            return values
+        if self.kind == "int64":
+            return pd.arrays.IntegerArray(values, ~is_valid)
+        if self.kind == "bool":
+            return pd.arrays.BooleanArray(values, ~is_valid)
+        if self.kind == "float64":
+            return np.where(is_valid, values, np.nan)
+        if self.kind == "datetime64[ns]":
+            return np.where(is_valid, values, np.datetime64("NaT"))
+        return np.where(is_valid, values, None)
+
+    def to_arrow(self, num_rows: int) -> pa.Array:
+        values, is_valid = self.values[:num_rows], self.is_valid[:num_rows]
+        return pa.array(values, mask=~is_valid, from_pandas=self.kind == "object")
+
+
+class GameTableBuilder:
+    """Accumulates extracted game rows (see `utils.extract_game_data`) column by column, instead of making a one row
+    DataFrame per game, and builds the table once at the end.
+
+    Values are appended to typed column buffers that grow by doubling. A column's kind comes from its first value
+    and is widened when a later game disagrees (see `get_common_kind`).
+    Games do not all have the same columns (e.g. LPL games have no `summonerName`, objectives that never happened
+    are missing): a column first seen in a later game is missing for the earlier ones, and a column a game does not
+    have is missing for that game. Missing values are tracked in a validity mask rather than filled in on the way.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.num_rows = 0
+        self.columns: Dict[str, ColumnBuffer] = {}
+        # columns are kept in the order first seen, as `pd.concat` of the row frames did. A column only
+        # gets a buffer once it has a value, so a column that is always missing has none
+        self._column_order: Dict[str, None] = {}
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._column_order)
+
+    def append(self, game_data: Dict[str, Any]) -> None:
+        if self.num_rows == self.capacity:
+            self.capacity *= 2
+            for column_buffer in self.columns.values():
+                column_buffer.resize(self.capacity)
+
+        row = self.num_rows
+        for column, value in game_data.items():
+            if column not in self._column_order:
+                self._column_order[column] = None
+            kind = get_value_kind(value)
+            column_buffer = self.columns.get(column)
+            if column_buffer is None:
+                if kind is None:
+                    continue
+                column_buffer = self.columns[column] = ColumnBuffer(kind, self.capacity)
+            elif kind is None:
+                continue
+            elif kind != column_buffer.kind:
+                common_kind = get_common_kind(column_buffer.kind, kind)
+                if common_kind != column_buffer.kind:
+                    column_buffer.convert(common_kind)
+            column_buffer.set(row, value)
+        self.num_rows += 1
+
+    def extend(self, games_data: List[Dict[str, Any]]) -> "GameTableBuilder":
+        for game_data in games_data:
+            self.append(game_data)
+        return self
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                column: (
+                    self.columns[column].to_array(self.num_rows)
+                    if column in self.columns
+                    else np.full(self.num_rows, None, dtype=object)
+                )
+                for column in self._column_order
+            }
+        )
+
+    def to_record_batch(self) -> pa.RecordBatch:
+        return pa.RecordBatch.from_arrays(
+            [
+                self.columns[column].to_arrow(self.num_rows) if column in self.columns else pa.nulls(self.num_rows)
+                for column in self._column_order
+            ],
+            names=self.column_names,
+        )
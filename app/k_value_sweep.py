@@ -0,0 +1,115 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from backtest import build_game_table, get_game_table_arrays, get_prediction_metrics, replay_game_table
+from constants import CREATED_DATA_DIR
+from rating_history import to_days
+
+SWEEP_RESULTS_PATH = f"{CREATED_DATA_DIR}/k_value_sweep_results.csv"
+# games from this date on are held out: ratings keep updating on them, but only they are scored
+HOLDOUT_DATE = "2023-06-01"
+
+# arrays of the game table the workers read from shared memory
+_worker_blocks: List[SharedMemory] = []
+_worker_arrays: Dict[str, np.ndarray] = {}
+
+
+def create_shared_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[List[SharedMemory], Dict[str, tuple]]:
+    """Copies every array once into its own shared memory block. Returns the blocks (the caller
+    closes and unlinks them) and the (block name, shape, dtype) specs workers attach with."""
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def init_sweep_worker(specs: Dict[str, tuple]):
+    for name, (block_name, shape, dtype) in specs.items():
+        # pool workers share the parent's resource tracker, the parent unlinks the blocks once the sweep is done
+        block = SharedMemory(name=block_name)
+        _worker_blocks.append(block)
+        _worker_arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def evaluate_parameters(parameter_overrides: Dict[str, float], arrays: Optional[Dict[str, np.ndarray]] = None) -> dict:
+    """Replays every game with the given parameters and scores the pre-game predictions of the held out games."""
+    arrays = arrays or _worker_arrays
+    expected_wins = replay_game_table(arrays, parameter_overrides)
+    metrics = get_prediction_metrics(expected_wins[arrays["is_holdout"]])
+    return dict(parameter_overrides, **{name: float(values[0]) for name, values in metrics.items()})
+
+
+def get_parameter_grid(grid: Dict[str, List[float]]) -> List[Dict[str, float]]:
+    """Every combination of the given values, e.g. {"BASE_K_VALUES.BASE_K_VALUE_2023": [20, 30, 40]}."""
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def get_random_parameters(
+    search_space: Dict[str, Tuple[float, float]], num_samples: int, seed: int = 0
+) -> List[Dict[str, float]]:
+    """`num_samples` parameter sets drawn uniformly from the given (low, high) ranges."""
+    rng = np.random.default_rng(seed)
+    return [
+        {name: float(rng.uniform(low, high)) for name, (low, high) in search_space.items()} for _ in range(num_samples)
+    ]
+
+
+def run_sweep(
+    parameter_sets: List[Dict[str, float]],
+    max_workers: Optional[int] = None,
+    holdout_date: str = HOLDOUT_DATE,
+    output_file: Optional[str] = SWEEP_RESULTS_PATH,
+) -> pd.DataFrame:
+    """Scores every parameter set across a process pool and returns them ranked by held out accuracy,
+    then log loss. The current constants (no overrides) are always scored as a reference."""
+    game_table = build_game_table()
+    print(f"Loaded {game_table.shape[0]} games, evaluating {len(parameter_sets) + 1} parameter sets...")
+
+    arrays = get_game_table_arrays(game_table)
+    arrays["is_holdout"] = arrays["days"] >= to_days(holdout_date)
+    blocks, specs = create_shared_arrays(arrays)
+    try:
+        max_workers = max_workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_sweep_worker, initargs=(specs,)) as executor:
+            results = list(
+                executor.map(
+                    evaluate_parameters,
+                    [{}, *parameter_sets],
+                    chunksize=max(1, len(parameter_sets) // (max_workers * 4)),
+                )
+            )
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    results_df = pd.DataFrame(results).sort_values(
+        by=["accuracy", "log_loss"], ascending=[False, True], ignore_index=True
+    )
+    if output_file:
+        results_df.to_csv(output_file, index=False)
+    return results_df
+
+
+if __name__ == "__main__":
+    results = run_sweep(
+        get_random_parameters(
+            {
+                "BASE_K_VALUES.BASE_K_VALUE_2023": (15, 60),
+                "BASE_K_VALUES.BASE_K_VALUE_MSI_2023": (50, 150),
+                "K_VALUE_BONUSES.red_side_win": (0, 8),
+                "K_VALUE_BONUSES.op_champion": (0, 4),
+                "K_VALUE_BONUSES.gold_diff_10k": (0, 12),
+            },
+            num_samples=2000,
+        )
+    )
+    print(results.head(20))
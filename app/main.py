@@ -3,14 +3,15 @@ from typing import List, Optional
 
 import pandas as pd
 from constants import CREATED_DATA_DIR, MAPPED_GAMES_DIR
-from elo import get_team_name_to_id_mapping, get_unique_stage_names, get_unique_team_names
+from elo import get_unique_stage_names, get_unique_team_names, reference_data
+from mapped_games import read_mapped_games
 
 from utils import get_team_id_to_info_mapping
 
 
 def transform_df_rows_to_response(df: pd.DataFrame):
     resp_array = []
-    team_name_mappings = get_team_name_to_id_mapping()
+    team_name_mappings = reference_data.team_name_to_id
     for index, row in df.iterrows():
         resp = {}
         resp["rank"] = index + 1
@@ -33,8 +34,10 @@ def get_tournament_rankings(tournament_id: str, stage: Optional[str] = None):
         tournament_slug = sorted_tournaments[sorted_tournaments["tournament_id"] == tournament_id][
             "tournament_slug"
         ].values[0]
-        # Load tournament CSV
-        tournament_df = pd.read_csv(f"{MAPPED_GAMES_DIR}/{league_id}/{tournament_slug}.csv")
+        # Load tournament games
+        tournament_df = read_mapped_games(
+            league_id, tournament_slug, columns=["stage_name", "team_100_blue_name", "team_200_red_name"]
+        )
         all_available_stages = get_unique_stage_names(tournament_df)
         if stage and stage in all_available_stages:
             stage_df = tournament_df[tournament_df["stage_name"] == stage].copy()
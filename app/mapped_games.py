@@ -0,0 +1,208 @@
+import os
+import shutil
+from typing import List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from constants import MAPPED_GAMES_DATASET_DIR, MAPPED_GAMES_DIR, MAPPED_GAMES_ROW_GROUP_SIZE
+from extraction_cache import EXTRACTOR_VERSION_KEY
+from file_version import get_file_version
+
+# ids are kept as strings, whichever format a tournament is read from
+ID_COLUMN_DTYPES = {"league_id": str, "tournament_id": str, "game_id": str, "platform_game_id": str}
+DATE_COLUMNS = ["tournament_start_date", "tournament_end_date"]
+
+
+def get_parquet_path(league_id: str, tournament_slug: str) -> str:
+    return f"{MAPPED_GAMES_DATASET_DIR}/{league_id}/{tournament_slug}.parquet"
+
+
+def get_csv_path(league_id: str, tournament_slug: str) -> str:
+    return f"{MAPPED_GAMES_DIR}/{league_id}/{tournament_slug}.csv"
+
+
+def has_mapped_games(league_id: str, tournament_slug: str) -> bool:
+    return os.path.isfile(get_parquet_path(league_id, tournament_slug)) or os.path.isfile(
+        get_csv_path(league_id, tournament_slug)
+    )
+
+
+def get_mapped_games_version(league_id: str, tournament_slug: str) -> List[int]:
+    """Version of the file a tournament is read from, see `file_version.get_file_version`."""
+    if os.path.isfile(get_parquet_path(league_id, tournament_slug)):
+        return get_file_version(get_parquet_path(league_id, tournament_slug))
+    return get_file_version(get_csv_path(league_id, tournament_slug))
+
+
+def get_league_tournament_slugs(league_id: str) -> List[str]:
+    """Every tournament of a league that has mapped games, in either format."""
+    tournament_slugs = set()
+    if os.path.isdir(f"{MAPPED_GAMES_DATASET_DIR}/{league_id}"):
+        tournament_slugs |= {
+            file_name[: -len(".parquet")]
+            for file_name in os.listdir(f"{MAPPED_GAMES_DATASET_DIR}/{league_id}")
+            if file_name.endswith(".parquet")
+        }
+    if os.path.isdir(f"{MAPPED_GAMES_DIR}/{league_id}"):
+        # the same directory holds the per stage `_elo.csv` snapshots
+        tournament_slugs |= {
+            file_name[: -len(".csv")]
+            for file_name in os.listdir(f"{MAPPED_GAMES_DIR}/{league_id}")
+            if file_name.endswith(".csv") and not file_name.endswith("_elo.csv")
+        }
+    return sorted(tournament_slugs)
+
+
+def get_stored_tournaments() -> List[Tuple[str, str]]:
+    """(league_id, tournament_slug) of every tournament with mapped games, in either format."""
+    league_ids = set()
+    for games_dir in [MAPPED_GAMES_DATASET_DIR, MAPPED_GAMES_DIR]:
+        if os.path.isdir(games_dir):
+            league_ids |= {
+                league_id for league_id in os.listdir(games_dir) if os.path.isdir(f"{games_dir}/{league_id}")
+            }
+    return [
+        (league_id, tournament_slug)
+        for league_id in sorted(league_ids)
+        for tournament_slug in get_league_tournament_slugs(league_id)
+    ]
+
+
+def get_mapped_games_columns(league_id: str, tournament_slug: str) -> List[str]:
+    """Columns of a tournament's games, without reading them."""
+    if os.path.isfile(get_parquet_path(league_id, tournament_slug)):
+        return pq.read_schema(get_parquet_path(league_id, tournament_slug)).names
+    return pd.read_csv(get_csv_path(league_id, tournament_slug), nrows=0).columns.tolist()
+
+
+def read_mapped_games(
+    league_id: str,
+    tournament_slug: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[list] = None,
+) -> pd.DataFrame:
+    """Games of a tournament, only reading the given columns.
+
+    Args:
+        columns (list, optional): columns to read, all of them when None.
+        filters (list, optional): pyarrow filters, e.g. [("stage_name", "==", "Playoffs")]. Row groups whose
+            statistics rule them out are skipped without being read.
+    """
+    parquet_path = get_parquet_path(league_id, tournament_slug)
+    if os.path.isfile(parquet_path):
+        return pd.read_parquet(parquet_path, engine="pyarrow", columns=columns, filters=filters)
+
+    # tournaments that were not converted yet are read from their CSV
+    tournament_df = pd.read_csv(
+        get_csv_path(league_id, tournament_slug),
+        usecols=columns,
+        dtype=ID_COLUMN_DTYPES,
+        parse_dates=[column for column in DATE_COLUMNS if columns is None or column in columns],
+        float_precision="round_trip",
+    )
+    if filters:
+        tournament_table = pa.Table.from_pandas(tournament_df, preserve_index=False)
+        tournament_df = tournament_table.filter(pq.filters_to_expression(filters)).to_pandas()
+    return tournament_df
+
+
+def to_arrow_compatible(tournament_df: pd.DataFrame) -> pd.DataFrame:
+    """Object columns Arrow can't type (e.g. ints in some games and strings in others) are stored as strings."""
+    tournament_df = tournament_df.copy()
+    for column in tournament_df.columns[tournament_df.dtypes == object]:
+        try:
+            pa.array(tournament_df[column], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            tournament_df[column] = tournament_df[column].map(lambda value: None if pd.isna(value) else str(value))
+    return tournament_df
+
+
+def write_mapped_games(
+    tournament_df: pd.DataFrame, league_id: str, tournament_slug: str, export_csv: bool = True
+) -> None:
+    """Writes a tournament's games to the dataset, replacing any previous version atomically.
+
+    Args:
+        export_csv (bool): also write `mapped-games/<league_id>/<tournament_slug>.csv`.
+    """
+    parquet_path = get_parquet_path(league_id, tournament_slug)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    to_arrow_compatible(tournament_df).to_parquet(
+        f"{parquet_path}.tmp", engine="pyarrow", index=False, row_group_size=MAPPED_GAMES_ROW_GROUP_SIZE
+    )
+    os.replace(f"{parquet_path}.tmp", parquet_path)
+
+    if export_csv:
+        csv_path = get_csv_path(league_id, tournament_slug)
+        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+        tournament_df.to_csv(f"{csv_path}.tmp", index=False)
+        os.replace(f"{csv_path}.tmp", csv_path)
+
+
+def get_checkpoint_dir(league_id: str, tournament_slug: str) -> str:
+    return f"{MAPPED_GAMES_DATASET_DIR}/{league_id}/{tournament_slug}.checkpoint"
+
+
+def write_checkpoint_games(games_df: pd.DataFrame, league_id: str, tournament_slug: str, version: str) -> None:
+    """Saves games extracted since the last checkpoint of a run that has not written the tournament yet. Each
+    checkpoint is a new part, earlier ones are never rewritten.
+
+    Args:
+        version (str): extractor version of the games, see `extraction_cache.ExtractionCache`.
+    """
+    checkpoint_dir = get_checkpoint_dir(league_id, tournament_slug)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    part_path = f"{checkpoint_dir}/{len(get_checkpoint_part_paths(league_id, tournament_slug)):05d}.parquet"
+    table = pa.Table.from_pandas(to_arrow_compatible(games_df), preserve_index=False)
+    pq.write_table(table.replace_schema_metadata({EXTRACTOR_VERSION_KEY: version.encode()}), f"{part_path}.tmp")
+    os.replace(f"{part_path}.tmp", part_path)
+
+
+def get_checkpoint_part_paths(league_id: str, tournament_slug: str) -> List[str]:
+    checkpoint_dir = get_checkpoint_dir(league_id, tournament_slug)
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    return [
+        f"{checkpoint_dir}/{file_name}"
+        for file_name in sorted(os.listdir(checkpoint_dir))
+        if file_name.endswith(".parquet")
+    ]
+
+
+def read_checkpoint_games(league_id: str, tournament_slug: str, version: str) -> Optional[pd.DataFrame]:
+    """Games an interrupted run checkpointed, None if there are none. Parts of another extractor version are skipped."""
+    part_dfs = [
+        pd.read_parquet(part_path, engine="pyarrow")
+        for part_path in get_checkpoint_part_paths(league_id, tournament_slug)
+        if (pq.read_schema(part_path).metadata or {}).get(EXTRACTOR_VERSION_KEY) == version.encode()
+    ]
+    return pd.concat(part_dfs, ignore_index=True) if part_dfs else None
+
+
+def clear_checkpoint_games(league_id: str, tournament_slug: str) -> None:
+    """Removes the checkpoint once the tournament is written."""
+    shutil.rmtree(get_checkpoint_dir(league_id, tournament_slug), ignore_errors=True)
+
+
+def convert_mapped_games_to_parquet(overwrite: bool = False) -> int:
+    """Adds every tournament that only has a CSV to the dataset. Returns the number of tournaments converted."""
+    num_converted = 0
+    for league_id, tournament_slug in get_stored_tournaments():
+        if not os.path.isfile(get_csv_path(league_id, tournament_slug)):
+            continue
+        if overwrite or not os.path.isfile(get_parquet_path(league_id, tournament_slug)):
+            tournament_df = pd.read_csv(
+                get_csv_path(league_id, tournament_slug),
+                dtype=ID_COLUMN_DTYPES,
+                parse_dates=DATE_COLUMNS,
+                float_precision="round_trip",
+            )
+            write_mapped_games(tournament_df, league_id, tournament_slug, export_csv=False)
+            num_converted += 1
+            print(f"Converted {league_id}/{tournament_slug} ({tournament_df.shape[0]} games)")
+    return num_converted
+
+
+if __name__ == "__main__":
+    convert_mapped_games_to_parquet()
@@ -0,0 +1,196 @@
+import json
+import os
+from typing import Callable, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from constants import LOL_ESPORTS_DATA_DIR, METADATA_CATALOG_DIR
+from file_version import get_file_version
+
+# bump whenever the snapshot tables change
+METADATA_CATALOG_VERSION = 1
+# parquet schema metadata key the version of the source file a snapshot was built from is stored under
+SOURCE_VERSION_KEY = b"source_version"
+
+TOURNAMENT_COLUMNS = ["id", "leagueId", "name", "slug", "startDate", "endDate"]
+
+
+def get_tournament_tables(tournaments_data: List[dict]) -> Dict[str, pa.Table]:
+    """`tournaments`: one row per tournament. `tournament_games`: one row per completed game of a completed match,
+    in stage -> section -> match -> game order. A game without a number gets a null `game_number`."""
+    tournaments = {column: [] for column in TOURNAMENT_COLUMNS}
+    tournament_games = {
+        column: [] for column in ["tournament_id", "stage_name", "stage_slug", "section_name", "game_id", "game_number"]
+    }
+    for tournament in tournaments_data:
+        for column in TOURNAMENT_COLUMNS:
+            tournaments[column].append(tournament.get(column, ""))
+        for stage in tournament.get("stages", []):
+            for section in stage.get("sections", []):
+                for match in section.get("matches", []):
+                    if match.get("state") != "completed":
+                        continue
+                    for game in match.get("games", []):
+                        if game.get("state") != "completed":
+                            continue
+                        tournament_games["tournament_id"].append(tournament.get("id", ""))
+                        tournament_games["stage_name"].append(stage["name"])
+                        tournament_games["stage_slug"].append(stage["slug"])
+                        tournament_games["section_name"].append(section["name"])
+                        tournament_games["game_id"].append(game.get("id"))
+                        tournament_games["game_number"].append(int(game["number"]) if "number" in game else None)
+    return {
+        "tournaments": pa.table(tournaments),
+        "tournament_games": pa.table(
+            tournament_games,
+            schema=pa.schema(
+                [(column, pa.string()) for column in list(tournament_games)[:-1]] + [("game_number", pa.int64())]
+            ),
+        ),
+    }
+
+
+def get_mapping_tables(mappings_data: List[dict]) -> Dict[str, pa.Table]:
+    """`game_mappings`: the platform game id and side team ids of every esports game. A side missing from the
+    team mapping is null."""
+    game_mappings = {"esportsGameId": [], "platformGameId": [], "team_100_id": [], "team_200_id": []}
+    for esports_game in mappings_data:
+        team_mapping = esports_game.get("teamMapping", {})
+        game_mappings["esportsGameId"].append(esports_game["esportsGameId"])
+        game_mappings["platformGameId"].append(esports_game.get("platformGameId"))
+        game_mappings["team_100_id"].append(str(team_mapping["100"]) if "100" in team_mapping else None)
+        game_mappings["team_200_id"].append(str(team_mapping["200"]) if "200" in team_mapping else None)
+    return {"game_mappings": pa.table(game_mappings, schema=pa.schema([(c, pa.string()) for c in game_mappings]))}
+
+
+def get_league_tables(leagues_data: List[dict]) -> Dict[str, pa.Table]:
+    """`league_tournaments`: one row per tournament of a league, in the league's order."""
+    league_tournaments = {"league_id": [], "tournament_id": []}
+    for league in leagues_data:
+        for tournament in league["tournaments"]:
+            league_tournaments["league_id"].append(league["id"])
+            league_tournaments["tournament_id"].append(tournament["id"])
+    return {"league_tournaments": pa.table(league_tournaments)}
+
+
+class MetadataCatalog:
+    """Leagues, tournaments and game mappings of the lolesports data, loaded once and indexed by id.
+
+    Each source JSON file is flattened into narrow tables the first time it is needed, which are kept as Parquet
+    snapshots in `snapshot_dir` and reloaded as long as the source file is unchanged (see
+    `file_version.get_file_version`). The `*.parquet` copies next to the sources can't be used instead: their
+    64 bit ids went through floats and no longer match the game ids.
+    """
+
+    def __init__(self, data_dir: str = LOL_ESPORTS_DATA_DIR, snapshot_dir: str = METADATA_CATALOG_DIR):
+        self.data_dir = data_dir
+        self.snapshot_dir = snapshot_dir
+        self._tournaments: Optional[Dict[str, dict]] = None
+        self._tournament_games: Optional[Dict[str, List[dict]]] = None
+        self._game_mappings: Optional[Dict[str, dict]] = None
+        self._league_tournament_ids: Optional[Dict[str, List[str]]] = None
+
+    def get_snapshot_path(self, table_name: str) -> str:
+        return f"{self.snapshot_dir}/{table_name}.parquet"
+
+    def load_tables(
+        self, source_name: str, get_tables: Callable[[List[dict]], Dict[str, pa.Table]], table_names: List[str]
+    ) -> Dict[str, pa.Table]:
+        """Snapshot tables of a source file, rebuilt by `get_tables` from the parsed JSON when any is out of date."""
+        source_path = f"{self.data_dir}/{source_name}.json"
+        source_version = json.dumps([METADATA_CATALOG_VERSION, get_file_version(source_path)]).encode()
+        tables = {}
+        for table_name in table_names:
+            try:
+                table = pq.read_table(self.get_snapshot_path(table_name))
+            except (FileNotFoundError, pa.ArrowInvalid):
+                break
+            if (table.schema.metadata or {}).get(SOURCE_VERSION_KEY) != source_version:
+                break
+            tables[table_name] = table
+        else:
+            return tables
+
+        print(f"Building metadata catalog from {source_path}")
+        with open(source_path, "r") as f:
+            tables = get_tables(json.load(f))
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        for table_name, table in tables.items():
+            table = table.replace_schema_metadata({SOURCE_VERSION_KEY: source_version})
+            snapshot_path = self.get_snapshot_path(table_name)
+            pq.write_table(table, f"{snapshot_path}.{os.getpid()}.tmp")
+            os.replace(f"{snapshot_path}.{os.getpid()}.tmp", snapshot_path)
+        return tables
+
+    def _load_tournaments(self) -> None:
+        tables = self.load_tables("tournaments", get_tournament_tables, ["tournaments", "tournament_games"])
+        self._tournaments = {tournament["id"]: tournament for tournament in tables["tournaments"].to_pylist()}
+        self._tournament_games = {tournament_id: [] for tournament_id in self._tournaments}
+        for game in tables["tournament_games"].to_pylist():
+            self._tournament_games[game["tournament_id"]].append(game)
+
+    @property
+    def tournaments(self) -> Dict[str, dict]:
+        """Tournament id -> `id`, `leagueId`, `name`, `slug`, `startDate` and `endDate`, in the source order."""
+        if self._tournaments is None:
+            self._load_tournaments()
+        return self._tournaments
+
+    @property
+    def tournament_games(self) -> Dict[str, List[dict]]:
+        """Tournament id -> completed games, see `get_tournament_tables`."""
+        if self._tournament_games is None:
+            self._load_tournaments()
+        return self._tournament_games
+
+    @property
+    def game_mappings(self) -> Dict[str, dict]:
+        """Esports game id -> the mapping data of the game: its `platformGameId` and `teamMapping`."""
+        if self._game_mappings is None:
+            table = self.load_tables("mapping_data", get_mapping_tables, ["game_mappings"])["game_mappings"]
+            self._game_mappings = {}
+            for esports_game in table.to_pylist():
+                team_mapping = {}
+                if esports_game["team_100_id"] is not None:
+                    team_mapping["100"] = esports_game["team_100_id"]
+                if esports_game["team_200_id"] is not None:
+                    team_mapping["200"] = esports_game["team_200_id"]
+                self._game_mappings[esports_game["esportsGameId"]] = {
+                    "esportsGameId": esports_game["esportsGameId"],
+                    "platformGameId": esports_game["platformGameId"],
+                    "teamMapping": team_mapping,
+                }
+        return self._game_mappings
+
+    @property
+    def league_tournament_ids(self) -> Dict[str, List[str]]:
+        if self._league_tournament_ids is None:
+            table = self.load_tables("leagues", get_league_tables, ["league_tournaments"])["league_tournaments"]
+            self._league_tournament_ids = {}
+            for league_id, tournament_id in zip(table["league_id"].to_pylist(), table["tournament_id"].to_pylist()):
+                self._league_tournament_ids.setdefault(league_id, []).append(tournament_id)
+        return self._league_tournament_ids
+
+    def get_tournament(self, tournament_id: str) -> Optional[dict]:
+        return self.tournaments.get(tournament_id)
+
+    def get_tournament_games(self, tournament_id: str) -> List[dict]:
+        return self.tournament_games.get(tournament_id, [])
+
+    def get_game_mapping(self, esports_game_id: str) -> Optional[dict]:
+        return self.game_mappings.get(esports_game_id)
+
+    def get_league_tournament_ids(self, league_id: str) -> Optional[List[str]]:
+        """Tournament ids of a league, None for an unknown league."""
+        return self.league_tournament_ids.get(league_id)
+
+
+_metadata_catalog: Optional[MetadataCatalog] = None
+
+
+def get_metadata_catalog() -> MetadataCatalog:
+    """Process wide catalog over `LOL_ESPORTS_DATA_DIR`, created on first use."""
+    global _metadata_catalog
+    if _metadata_catalog is None:
+        _metadata_catalog = MetadataCatalog()
+    return _metadata_catalog
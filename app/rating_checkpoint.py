@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+
+import constants
+from constants import CREATED_DATA_DIR
+from rating_engine import RatingEngine
+
+RATING_CHECKPOINT_PATH = f"{CREATED_DATA_DIR}/rating_checkpoint.json"
+# bump whenever the checkpoint layout or the rating update itself changes
+RATING_CHECKPOINT_VERSION = 1
+
+# constants that change the ratings, a checkpoint is only reused if all of them are unchanged
+MODEL_PARAMETER_NAMES = [
+    "BASE_K_VALUES",
+    "K_VALUE_BONUSES",
+    "MAJOR_REGION_MODIFIERS",
+    "REGION_ELO_MODIFIERS",
+    "MSI_2022_DATE",
+    "WORLDS_2022_DATE",
+]
+
+
+def get_model_parameters() -> dict:
+    return {name: getattr(constants, name) for name in MODEL_PARAMETER_NAMES}
+
+
+def get_model_parameters_hash(model_parameters: dict) -> str:
+    return hashlib.sha256(json.dumps(model_parameters, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def save_checkpoint(
+    engine: RatingEngine,
+    last_game_date: Optional[str],
+    last_game_ids: List[str],
+    tournament_versions: Dict[str, List[int]],
+    path: str = RATING_CHECKPOINT_PATH,
+) -> None:
+    """Persists the ratings, the last processed game and the model parameters they were computed with.
+
+    Args:
+        last_game_date (str): date of the last processed game.
+        last_game_ids (list): ids of every processed game on `last_game_date`, since games only have a date
+            and several can share it.
+        tournament_versions (dict): `league_id/tournament_slug` -> (mtime, size) of every tournament file
+            whose games were all processed. Those files are skipped by incremental runs until they change.
+    """
+    model_parameters = get_model_parameters()
+    checkpoint = {
+        "version": RATING_CHECKPOINT_VERSION,
+        "model_parameters_hash": get_model_parameters_hash(model_parameters),
+        "model_parameters": model_parameters,
+        "last_game_date": last_game_date,
+        "last_game_ids": sorted(last_game_ids),
+        "tournament_versions": tournament_versions,
+        # floats are written with repr, so ratings survive the round trip exactly
+        "ratings": [[team, rating] for team, rating in zip(engine.teams, engine.ratings.tolist())],
+    }
+    # write then rename, so an interrupted run never leaves a half written checkpoint
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+
+def load_checkpoint(path: str = RATING_CHECKPOINT_PATH) -> Optional[dict]:
+    """Returns the checkpoint if it can be resumed from, None if it is missing or stale.
+
+    A checkpoint is stale when it was written by another checkpoint version or with different
+    K values / region modifiers, in which case the caller has to replay everything.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)
+
+    if checkpoint.get("version") != RATING_CHECKPOINT_VERSION:
+        print(f"Rating checkpoint version {checkpoint.get('version')} is outdated, full replay needed")
+        return None
+    if checkpoint.get("model_parameters_hash") != get_model_parameters_hash(get_model_parameters()):
+        print("Model parameters changed since the rating checkpoint was written, full replay needed")
+        return None
+    checkpoint["last_game_ids"] = set(checkpoint["last_game_ids"])
+    return checkpoint
+
+
+def get_checkpoint_engine(checkpoint: dict, track_history: bool = False) -> RatingEngine:
+    engine = RatingEngine(initial_capacity=max(256, len(checkpoint["ratings"])), track_history=track_history)
+    for team, rating in checkpoint["ratings"]:
+        engine.add_team(team, rating)
+    return engine
+
+
+def is_game_after_checkpoint(game_date: str, game_id: str, checkpoint: dict) -> bool:
+    if checkpoint["last_game_date"] is None or game_date > checkpoint["last_game_date"]:
+        return True
+    return game_date == checkpoint["last_game_date"] and game_id not in checkpoint["last_game_ids"]
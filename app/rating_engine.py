@@ -0,0 +1,141 @@
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from rating_history import RatingHistory
+
+
+class RatingEngine:
+    """Array backed ELO ratings.
+
+    Team names are turned into dense integer ids once, ratings live in a contiguous float64 array
+    and games are replayed from pre-extracted winner/loser/K arrays, so a rating lookup is an index
+    instead of a boolean mask scan over an ELO DataFrame.
+
+    The update is the same arithmetic as `elo.update_weighted_elo`, performed in the same order,
+    so replayed ratings are bit for bit identical to the DataFrame based loop.
+    """
+
+    def __init__(self, initial_capacity: int = 256, track_history: bool = False):
+        self.team_to_id: Dict[str, int] = {}
+        self.teams: List[str] = []
+        self._ratings = np.zeros(initial_capacity, dtype=np.float64)
+
+        # every rating change as (team id, day, rating), in game order
+        self.track_history = track_history
+        self._history_team_ids = array("q")
+        self._history_days = array("q")
+        self._history_ratings = array("d")
+
+    @classmethod
+    def from_elo_df(cls, elo_df: pd.DataFrame) -> "RatingEngine":
+        """Seed an engine from a `Team`/`ELO` DataFrame as written to the `_elo.csv` files."""
+        engine = cls(initial_capacity=max(256, len(elo_df)))
+        for team, elo in zip(elo_df["Team"].tolist(), elo_df["ELO"].tolist()):
+            engine.add_team(team, elo)
+        return engine
+
+    @property
+    def ratings(self) -> np.ndarray:
+        return self._ratings[: len(self.teams)]
+
+    def __len__(self) -> int:
+        return len(self.teams)
+
+    def __contains__(self, team: str) -> bool:
+        return team in self.team_to_id
+
+    def add_team(self, team: str, rating: float) -> int:
+        """Register a team with its starting rating, returns its id. Existing teams keep their rating."""
+        team_id = self.team_to_id.get(team)
+        if team_id is not None:
+            return team_id
+
+        team_id = len(self.teams)
+        if team_id == self._ratings.shape[0]:
+            self._ratings = np.concatenate([self._ratings, np.zeros_like(self._ratings)])
+        self._ratings[team_id] = rating
+        self.team_to_id[team] = team_id
+        self.teams.append(team)
+        return team_id
+
+    def encode(self, teams: Iterable[str]) -> np.ndarray:
+        """Map team names to their dense ids."""
+        team_to_id = self.team_to_id
+        return np.fromiter((team_to_id[team] for team in teams), dtype=np.int64)
+
+    def get_rating(self, team: str) -> float:
+        return float(self._ratings[self.team_to_id[team]])
+
+    def get_ratings(self, teams: Iterable[str]) -> np.ndarray:
+        return self._ratings[self.encode(teams)]
+
+    def replay(
+        self,
+        winner_ids: np.ndarray,
+        loser_ids: np.ndarray,
+        k_values: np.ndarray,
+        days: Optional[np.ndarray] = None,
+        return_expected: bool = False,
+    ) -> Optional[np.ndarray]:
+        """Apply games in order. Each game depends on the ratings left by the previous one,
+        so the loop stays sequential, but it only touches plain floats.
+
+        `days` (days since epoch, see `rating_history.to_days`) is required when tracking history.
+        With `return_expected`, returns the pre-game expected win probability of each game's winner.
+        """
+        if self.track_history and days is None:
+            raise ValueError("days are required to track the rating history")
+
+        # python floats are IEEE doubles, same as the float64 array, so this is exact
+        ratings = self._ratings[: len(self.teams)].tolist()
+        winner_ids = np.asarray(winner_ids).tolist()
+        loser_ids = np.asarray(loser_ids).tolist()
+        track_history = self.track_history
+        new_winner_ratings, new_loser_ratings = [], []
+        expected_wins = []
+
+        for winner_id, loser_id, k_value in zip(winner_ids, loser_ids, np.asarray(k_values).tolist()):
+            winner_elo = ratings[winner_id]
+            loser_elo = ratings[loser_id]
+
+            expected_win_winner = 1 / (1 + 10 ** ((loser_elo - winner_elo) / 400))
+            expected_win_loser = 1 / (1 + 10 ** ((winner_elo - loser_elo) / 400))
+
+            ratings[winner_id] = winner_elo + k_value * (1 - expected_win_winner)
+            ratings[loser_id] = loser_elo + k_value * (0 - expected_win_loser)
+            if return_expected:
+                expected_wins.append(expected_win_winner)
+            if track_history:
+                new_winner_ratings.append(ratings[winner_id])
+                new_loser_ratings.append(ratings[loser_id])
+
+        self._ratings[: len(ratings)] = ratings
+
+        if track_history:
+            days = np.asarray(days, dtype=np.int64).tolist()
+            for winner_id, loser_id, day, winner_elo, loser_elo in zip(
+                winner_ids, loser_ids, days, new_winner_ratings, new_loser_ratings
+            ):
+                self._history_team_ids.extend((winner_id, loser_id))
+                self._history_days.extend((day, day))
+                self._history_ratings.extend((winner_elo, loser_elo))
+
+        if return_expected:
+            return np.asarray(expected_wins, dtype=np.float64)
+        return None
+
+    def get_history(self) -> RatingHistory:
+        """Rating changes recorded so far, see `track_history`."""
+        return RatingHistory(
+            self.teams,
+            np.array(self._history_team_ids, dtype=np.int64),
+            np.array(self._history_days, dtype=np.int64),
+            np.array(self._history_ratings, dtype=np.float64),
+        )
+
+    def to_elo_df(self, teams: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """`Team`/`ELO` DataFrame in registration order, or in the order of `teams` if given."""
+        teams = list(self.teams if teams is None else teams)
+        return pd.DataFrame({"Team": teams, "ELO": self.get_ratings(teams)})
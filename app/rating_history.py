@@ -0,0 +1,96 @@
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from constants import CREATED_DATA_DIR
+
+RATING_HISTORY_PATH = f"{CREATED_DATA_DIR}/rating_history.parquet"
+
+# team ids and days are folded into one sortable int64 key, days since epoch stay far below this
+KEY_STRIDE = 1 << 32
+
+
+def to_days(dates) -> np.ndarray:
+    """`YYYY-MM-DD` strings (or datetimes) -> int64 days since epoch."""
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+class RatingHistory:
+    """Every rating change of every team, stored per team in contiguous arrays.
+
+    Changes are grouped by team (CSR layout: `offsets[team_id]:offsets[team_id + 1]` is a team's
+    slice) and kept in game order inside a team, so "rating as of a date" is the last change on or
+    before that date, found with a binary search over one int64 key array.
+    """
+
+    def __init__(self, teams: List[str], team_ids: np.ndarray, days: np.ndarray, ratings: np.ndarray):
+        team_ids = np.asarray(team_ids, dtype=np.int64)
+        # stable sort keeps the game order of changes made on the same day
+        order = np.argsort(team_ids, kind="stable")
+
+        self.teams = list(teams)
+        self.team_to_id = {team: team_id for team_id, team in enumerate(self.teams)}
+        self._team_names = np.asarray(self.teams, dtype=object)
+        self.team_ids = team_ids[order]
+        self.days = np.asarray(days, dtype=np.int64)[order]
+        self.ratings = np.asarray(ratings, dtype=np.float64)[order]
+        self.offsets = np.searchsorted(self.team_ids, np.arange(len(self.teams) + 1))
+        self._keys = self.team_ids * KEY_STRIDE + self.days
+
+    def __len__(self) -> int:
+        return self.ratings.shape[0]
+
+    def rating_as_of(self, team: str, date: str) -> Optional[float]:
+        """Rating of `team` after its last game on or before `date`, None if it had not played yet."""
+        team_id = self.team_to_id.get(team)
+        if team_id is None:
+            return None
+        position = np.searchsorted(self._keys, team_id * KEY_STRIDE + to_days(date), side="right") - 1
+        if position < self.offsets[team_id]:
+            return None
+        return float(self.ratings[position])
+
+    def get_team_history(self, team: str) -> pd.DataFrame:
+        team_id = self.team_to_id[team]
+        start, end = self.offsets[team_id], self.offsets[team_id + 1]
+        return pd.DataFrame({"date": self.days[start:end].astype("datetime64[D]"), "ELO": self.ratings[start:end]})
+
+    def leaderboard_as_of(self, date: str) -> pd.DataFrame:
+        """Ratings of every team that had played by `date`, highest first. One vectorized binary search
+        covers all teams."""
+        team_ids = np.arange(len(self.teams), dtype=np.int64)
+        positions = np.searchsorted(self._keys, team_ids * KEY_STRIDE + to_days(date), side="right") - 1
+        played_team_ids = team_ids[positions >= self.offsets[:-1]]
+        elos = self.ratings[positions[played_team_ids]]
+        order = np.argsort(-elos, kind="stable")
+
+        return pd.DataFrame({"Team": self._team_names[played_team_ids[order]], "ELO": elos[order]})
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "team": pd.Categorical.from_codes(self.team_ids, categories=self.teams),
+                "date": self.days.astype("datetime64[D]"),
+                "ELO": self.ratings,
+            }
+        )
+
+    @classmethod
+    def from_frame(cls, history_df: pd.DataFrame) -> "RatingHistory":
+        teams = pd.Categorical(history_df["team"])
+        return cls(list(teams.categories), teams.codes, to_days(history_df["date"]), history_df["ELO"].to_numpy())
+
+    def append(self, other: "RatingHistory") -> "RatingHistory":
+        """History of `self` followed by the (later) changes of `other`."""
+        return RatingHistory.from_frame(
+            pd.concat(
+                [self.to_frame().astype({"team": str}), other.to_frame().astype({"team": str})], ignore_index=True
+            )
+        )
+
+    def save(self, path: str = RATING_HISTORY_PATH) -> None:
+        self.to_frame().to_parquet(path, engine="pyarrow", index=False)
+
+    @classmethod
+    def load(cls, path: str = RATING_HISTORY_PATH) -> "RatingHistory":
+        return cls.from_frame(pd.read_parquet(path, engine="pyarrow"))
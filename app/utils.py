@@ -1,22 +1,27 @@
-import gzip
 import json
 import logging
+import multiprocessing
 import os
+import re
 import shutil
 from collections import defaultdict
-from io import BytesIO
-from typing import Any, Dict, List, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple, Union
 
+import numpy as np
 import pandas as pd
 import requests
 from constants import (
-    BLUE_CHAMPION_COLUMNS,
+    BLUE_SIDE_CHECK_COLUMNS,
+    BLUE_TEAM_COLUMNS,
     BUILDING_DESTROYED,
     CHAMPION_KILL,
-    CREATED_DATA_DIR,
     DRAGON_TYPE_MAPPINGS,
     EPIC_MONSTER_KILL,
     GAME_INFO,
+    GAME_EXTRACTOR_VERSION,
     GAMES_DIR,
     LANE_MAPPING,
     LOL_ESPORTS_DATA_DIR,
@@ -24,23 +29,45 @@ from constants import (
     PARTICIPANT_BASE_INFO_LPL,
     PARTICIPANT_GAME_STATS,
     PARTICIPANT_GENERAL_STATS,
-    RED_CHAMPION_COLUMNS,
+    RED_SIDE_CHECK_COLUMNS,
+    RED_TEAM_COLUMNS,
     ROLES,
     S3_BUCKET_URL,
     STATS_UPDATE,
     STR_SIDE_MAPPING,
     TEAM_ID_TO_INFO_MAPPING_PATH,
     TEAM_STATS,
+    TIMELINE_GAME_STATS,
+    TIMELINE_GENERAL_STATS,
     TOURNAMENT_TO_SLUGS_MAPPING_PATH,
     TURRET,
     ExperienceTimers,
     Monsters,
     Turret,
 )
+from champion_stats import update_champion_stats
+from extraction_cache import ExtractionCache
+from game_cache import GameCache, get_game_cache, init_worker_game_cache
+from game_fetcher import GameFetcher, GamePrefetcher
+from game_table import GameTableBuilder
+from mapped_games import (
+    clear_checkpoint_games,
+    get_mapped_games_columns,
+    get_stored_tournaments,
+    has_mapped_games,
+    read_checkpoint_games,
+    read_mapped_games,
+    write_checkpoint_games,
+    write_mapped_games,
+)
+from metadata_catalog import MetadataCatalog, get_metadata_catalog
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO)
 
+# whitespace and item separators between the values of a JSON array
+JSON_ARRAY_SEPARATORS = re.compile(r"[\s,]*")
+
 
 def get_tournament_to_stage_slug_mapping():
     """
@@ -109,12 +136,28 @@ def get_team_side_by_value(value: int) -> str:
     return None
 
 
+def download_game_to_cache(platform_game_id: str, game_cache: Optional[GameCache] = None) -> bool:
+    """Downloads a game from S3 into the game cache, still compressed. Returns whether it is cached."""
+    if game_cache is None:
+        game_cache = get_game_cache()
+    with requests.get(f"{S3_BUCKET_URL}/{platform_game_id}.json.gz", stream=True) as response:
+        if response.status_code != 200:
+            print(f"Failed to request {platform_game_id} from S3")
+            return False
+        # undo any transfer encoding, the file itself stays gzipped
+        response.raw.decode_content = True
+        with game_cache.writer(platform_game_id) as f:
+            shutil.copyfileobj(response.raw, f)
+    return True
+
+
 def get_direct_game_data(platform_game_id: str):
-    """Reads game data from S3 without saving it locally.
+    """Reads game data from the local game cache, downloading it from S3 into the cache first if needed.
 
     Args:
         platform_game_id (str): The platform game ID.
     """
+    # uncompressed games downloaded before the cache existed
     if os.path.exists(f"{GAMES_DIR}/{platform_game_id}.json"):
         try:
             with open(f"{GAMES_DIR}/{platform_game_id}.json", "r") as f:
@@ -125,21 +168,100 @@ def get_direct_game_data(platform_game_id: str):
             print("Error:", e)
     else:
         try:
-            # Download the compressed JSON data from S3
-            response = requests.get(f"{S3_BUCKET_URL}/{platform_game_id}.json.gz")
-            if response.status_code == 200:
-                gzip_bytes = BytesIO(response.content)
-                with gzip.GzipFile(fileobj=gzip_bytes, mode="rb") as gzipped_file:
-                    json_data = json.load(gzipped_file)
-
-                print(f"{platform_game_id} - game data downloaded & loaded! ---")
-                return json_data
+            game_cache = get_game_cache()
+            if platform_game_id in game_cache:
+                message = "loaded"
+            elif download_game_to_cache(platform_game_id, game_cache):
+                message = "downloaded & loaded"
             else:
-                print(f"Failed to request {platform_game_id} from S3")
+                return None
+
+            json_data = game_cache.load(platform_game_id)
+            print(f"{platform_game_id} - game data {message}! ---")
+            return json_data
         except Exception as e:
             print("Error:", e)
 
 
+def iter_json_array(text_stream: TextIO, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Yields the items of a top level JSON array one at a time, reading `text_stream` in chunks.
+
+    Only the item being decoded and the current chunk are held in memory, never the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position = "", 0
+    is_array_open = False
+
+    while True:
+        position = JSON_ARRAY_SEPARATORS.match(buffer, position).end()
+        if position < len(buffer):
+            if not is_array_open:
+                if buffer[position] != "[":
+                    raise ValueError("Game data is not a JSON array")
+                is_array_open = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+                yield item
+                continue
+            except json.JSONDecodeError:
+                # the item continues in the next chunk
+                pass
+
+        # an item bigger than a chunk doubles the read size, so it is re-decoded a logarithmic number of times
+        chunk = text_stream.read(max(chunk_size, len(buffer) - position))
+        if not chunk:
+            raise ValueError("Game data ended before the end of the JSON array")
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+@contextmanager
+def open_game_data_stream(platform_game_id: str) -> Iterator[Optional[TextIO]]:
+    """Text stream over a game's events, decompressed from the game cache as it is read. Games missing
+    from the cache are downloaded into it first. Yields None if the game can't be requested.
+
+    Args:
+        platform_game_id (str): The platform game ID.
+    """
+    # uncompressed games downloaded before the cache existed
+    if os.path.exists(f"{GAMES_DIR}/{platform_game_id}.json"):
+        with open(f"{GAMES_DIR}/{platform_game_id}.json", "r") as f:
+            yield f
+        return
+
+    game_cache = get_game_cache()
+    if platform_game_id not in game_cache and not download_game_to_cache(platform_game_id, game_cache):
+        yield None
+        return
+    with game_cache.open(platform_game_id) as f:
+        yield f
+
+
+def get_streamed_game_event_data(
+    platform_game_id: str, mappings_data: dict, timeline_step: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """Same as `get_game_event_data(get_direct_game_data(platform_game_id), mappings_data)`, but events are
+    handed to a `GameEventCollector` as they are parsed, so memory stays flat however long the game is.
+    """
+    collector = GameEventCollector(timeline_step)
+    try:
+        with open_game_data_stream(platform_game_id) as game_stream:
+            if game_stream is None:
+                return None
+            for event in iter_json_array(game_stream):
+                collector.add(event)
+        print(f"{platform_game_id} - game data streamed! ---")
+    except Exception as e:
+        print("Error:", e)
+        return None
+
+    return collector.get_game_event_data(mappings_data)
+
+
 def get_team_side_data(mapping_game_data: dict, game_end_data: dict):
     """Detecting game winning side could be finnicky. We have been told that the tournaments file
     should NOT be used to:
@@ -173,69 +295,13 @@ def get_team_side_data(mapping_game_data: dict, game_end_data: dict):
     return team_side_data
 
 
-def get_game_event_data(game_json_data, mappings_data):
-    """Gets all the relevant information from the `game_info` eventType."""
-    (
-        game_info_events,
-        turret_destroyed_events,
-        champion_kill_events,
-        dragon_events,
-        baron_events,
-        herald_events,
-        stats_update_events,
-    ) = get_filtered_events_from_game_data(game_json_data)
-
-    is_game_info_available = bool(game_info_events)
-
-    # some LPL games have no game_info events
-    # must fall back to stats_update events
-    if is_game_info_available:
-        game_start = game_info_events[0]
-    else:
-        game_start = stats_update_events[0]
-
-    game_end = game_json_data[-1]
-
-    game_info_event_data = {}
-
-    game_info_event_data["game_date"] = game_start["eventTime"].split("T")[0]
-    game_info_event_data["game_duration"] = game_end["gameTime"] // 1000  # ms -> seconds
-    game_info_event_data["game_patch"] = game_start.get("gameVersion", "unknown")
-
-    team_side_data = get_team_side_data(
-        mapping_game_data=mappings_data,
-        game_end_data=game_end,
-    )
-
-    participant_data = get_game_participant_data(
-        game_start["participants"], get_base_info=True, is_game_info_available=is_game_info_available
-    )
-
-    epic_monsters_killed_data = get_epic_monster_kills(
-        dragon_kill_events=dragon_events, baron_kill_events=baron_events, herald_kill_events=herald_events
-    )
-
-    (
-        game_info_event_data["team_first_turret_destroyed"],
-        game_info_event_data["lane_first_turret_destroyed"],
-    ) = get_team_first_turret_destroyed(turret_destroyed_events=turret_destroyed_events)
-
-    game_info_event_data["team_first_blood"] = get_team_first_blood(champion_kill_events=champion_kill_events)
-
-    #### Get stats updates
-    # They are always in order of participantID 1-5, 5-10, then repeats
-    # team data is always in order of 100, then 200.
-
-    #### Game stats
-    game_status_update_data = get_game_status_update_event_data(stats_update_events=stats_update_events)
-
-    return dict(
-        game_info_event_data,
-        **team_side_data,
-        **participant_data,
-        **epic_monsters_killed_data,
-        **game_status_update_data,
-    )
+def get_game_event_data(game_json_data, mappings_data, timeline_step: Optional[int] = None):
+    """Gets all the relevant information from the events of a fully loaded game.
+    With a `timeline_step`, also samples `get_game_timeline_data` every `timeline_step` seconds."""
+    collector = GameEventCollector(timeline_step)
+    for event in game_json_data:
+        collector.add(event)
+    return collector.get_game_event_data(mappings_data)
 
 
 def get_game_participant_data(
@@ -305,116 +371,359 @@ def get_game_team_data(teams_data: List[Dict[str, Any]], time_stamp: str) -> Dic
     return game_team_data
 
 
-def get_filtered_events_from_game_data(game_json_data):
-    """Get events that are relevant to the game but in one go O(N) vs multiple O(N)s
-    in each function to go over every event.
+class StatsSnapshotSchema:
+    """Columns of the participant and team stats of one `stats_update` snapshot, each mapped to a slot of a flat row.
 
-    Since we iterate over every event, items are appended in order and won't require
-    sorting it again."""
-    # particular data events
-    turret_destroyed_events = []
-    champion_kill_events = []
-    dragon_events = []
-    baron_events = []
-    herald_events = []
-    stats_update_events = []
-    game_info_events = []
+    The columns and their order are the ones `get_game_participant_data` and `get_game_team_data` build for
+    participants 1-10 (100 side first) and teams 100, 200, but their names are only formatted once per time stamp.
+    """
 
-    for event in game_json_data:
-        if event["eventType"] == GAME_INFO:
-            game_info_events.append(event)
-        if event["eventType"] == STATS_UPDATE:
-            stats_update_events.append(event)
-        if event["eventType"] == BUILDING_DESTROYED and event["buildingType"] == TURRET:
-            turret_destroyed_events.append(event)
-        if event["eventType"] == CHAMPION_KILL:
-            champion_kill_events.append(event)
-        if event["eventType"] == EPIC_MONSTER_KILL and event.get("monsterType", "") == Monsters.DRAGON.value:
-            dragon_events.append(event)
-        if event["eventType"] == EPIC_MONSTER_KILL and event.get("monsterType", "") == Monsters.BARON.value:
-            baron_events.append(event)
-        if event["eventType"] == EPIC_MONSTER_KILL and event.get("monsterType", "") == Monsters.HERALD.value:
-            herald_events.append(event)
-
-    return (
-        game_info_events,
-        turret_destroyed_events,
-        champion_kill_events,
-        dragon_events,
-        baron_events,
-        herald_events,
-        stats_update_events,
-    )
+    def __init__(self, time_stamp: str):
+        self.participant_keys = [(index + 1, 100 if index < 5 else 200) for index in range(len(ROLES))]
+        self.team_ids = [100, 200]
+        self.columns: List[str] = []
+        self.general_stat_slots: List[List[int]] = []
+        self.game_stat_slots: List[List[int]] = []
+        self.team_total_slots: List[List[int]] = []
+        self.team_stat_slots: List[List[int]] = []
+        slots: Dict[str, int] = {}
+
+        def get_slot(column: str) -> int:
+            if column not in slots:
+                slots[column] = len(self.columns)
+                self.columns.append(column)
+            return slots[column]
+
+        for (participant_id, team_id), role in zip(self.participant_keys, ROLES):
+            base_key = f"{participant_id}_{team_id}_{role}"
+            self.general_stat_slots.append(
+                [get_slot(f"{base_key}_{general_stat}_{time_stamp}") for general_stat in PARTICIPANT_GENERAL_STATS]
+            )
+            game_stat_slots, team_total_slots = [], []
+            for game_stat in PARTICIPANT_GAME_STATS:
+                game_stat_slots.append(get_slot(f"{base_key}_{game_stat}_{time_stamp}"))
+                team_total_slots.append(get_slot(f"{team_id}_total_{game_stat}_{time_stamp}"))
+            self.game_stat_slots.append(game_stat_slots)
+            self.team_total_slots.append(team_total_slots)
+
+        for team_id in self.team_ids:
+            side = get_team_side_by_value(team_id)
+            self.team_stat_slots.append(
+                [get_slot(f"{team_id}_{side}_{team_stat}_{time_stamp}") for team_stat in TEAM_STATS]
+            )
+
+        self.game_stat_indices = {game_stat: index for index, game_stat in enumerate(PARTICIPANT_GAME_STATS)}
+
+    def get_snapshot_data(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Stats of a `stats_update` event, None if its participants or teams are not laid out as expected."""
+        participants_data, teams_data = event["participants"], event["teams"]
+        participant_keys = [(player_info["participantID"], player_info["teamID"]) for player_info in participants_data]
+        team_ids = [team_info["teamID"] for team_info in teams_data]
+        if participant_keys != self.participant_keys or team_ids != self.team_ids:
+            return None
+
+        # team totals accumulate from 0.0, every other slot is overwritten
+        row = [0.0] * len(self.columns)
+        for player_info, general_stat_slots, game_stat_slots, team_total_slots in zip(
+            participants_data, self.general_stat_slots, self.game_stat_slots, self.team_total_slots
+        ):
+            for slot, general_stat in zip(general_stat_slots, PARTICIPANT_GENERAL_STATS):
+                row[slot] = player_info[general_stat]
+
+            game_stat_values = [0] * len(PARTICIPANT_GAME_STATS)
+            for stat in player_info["stats"]:
+                index = self.game_stat_indices.get(stat["name"])
+                if index is not None:
+                    game_stat_values[index] = stat["value"]
+            for slot, team_total_slot, value in zip(game_stat_slots, team_total_slots, game_stat_values):
+                value = float(value)
+                row[slot] = value
+                row[team_total_slot] += value
+
+        for team_info, team_stat_slots in zip(teams_data, self.team_stat_slots):
+            for slot, team_stat in zip(team_stat_slots, TEAM_STATS):
+                row[slot] = int(team_info[team_stat])
+
+        return dict(zip(self.columns, row))
+
+
+@lru_cache(maxsize=None)
+def get_stats_snapshot_schema(time_stamp: str) -> StatsSnapshotSchema:
+    return StatsSnapshotSchema(time_stamp)
+
+
+def get_stats_snapshot_data(event: Dict[str, Any], time_stamp: str) -> Dict[str, Any]:
+    """Participant and team stats of a `stats_update` event, with columns suffixed by `time_stamp`."""
+    snapshot_data = get_stats_snapshot_schema(time_stamp).get_snapshot_data(event)
+    if snapshot_data is None:
+        # unexpected layout, build the columns from the ids in the event instead
+        snapshot_data = dict(
+            get_game_participant_data(event["participants"], get_stats_info=True, time_stamp=time_stamp),
+            **get_game_team_data(event["teams"], time_stamp=time_stamp),
+        )
+    return snapshot_data
 
 
-def find_nearest_event(stats_update_events: List[Dict[str, Any]], target_time: int) -> Dict[str, Any]:
-    """Find the nearest event to the given time stamp.
-    This is used to get the participant and team stats for a game.
+class NearestStatsUpdate:
+    """Tracks the `stats_update` event nearest to `target_time` (seconds) while events stream by.
+
+    Picks the same event a binary search over the complete, time ordered list of `stats_update`
+    events would: an event at exactly `target_time` if there is one, otherwise the closer of the
+    events either side of it, the earlier one on a tie.
     """
-    left, right = 0, len(stats_update_events) - 1
-    while left <= right:
-        mid = (left + right) // 2
-        mid_event_game_time = int(stats_update_events[mid]["gameTime"]) // 1000
-
-        if mid_event_game_time == target_time:
-            return stats_update_events[mid]
-        elif mid_event_game_time > target_time:
-            right = mid - 1
-        else:
-            left = mid + 1
 
-    if left >= len(stats_update_events):
-        return stats_update_events[right]
-    elif right < 0:
-        return stats_update_events[left]
-    else:
+    def __init__(self, target_time: int):
+        self.target_time = target_time
+        self.num_events_before = 0
+        self.last_event_before = None
+        self.exact_events = []
+        self.first_event_after = None
+
+    def add(self, event: Dict[str, Any], game_time: int) -> None:
+        if game_time < self.target_time:
+            self.num_events_before += 1
+            self.last_event_before = event
+        elif game_time == self.target_time:
+            self.exact_events.append(event)
+        elif self.first_event_after is None:
+            self.first_event_after = event
+
+    def get_event(self, num_events: int) -> Dict[str, Any]:
+        """Nearest event, given the total number of `stats_update` events in the game."""
+        if self.exact_events:
+            # several events can share a second, replay the binary search over their positions
+            first_exact, last_exact = self.num_events_before, self.num_events_before + len(self.exact_events) - 1
+            left, right = 0, num_events - 1
+            while True:
+                mid = (left + right) // 2
+                if mid < first_exact:
+                    left = mid + 1
+                elif mid > last_exact:
+                    right = mid - 1
+                else:
+                    return self.exact_events[mid - first_exact]
+
+        if self.first_event_after is None:
+            return self.last_event_before
+        if self.last_event_before is None:
+            return self.first_event_after
+        after_time = int(self.first_event_after["gameTime"]) // 1000
+        before_time = int(self.last_event_before["gameTime"]) // 1000
         return (
-            stats_update_events[left]
-            if abs((int(stats_update_events[left]["gameTime"]) // 1000) - target_time)
-            < abs((int(stats_update_events[right]["gameTime"]) // 1000) - target_time)
-            else stats_update_events[right]
+            self.first_event_after
+            if abs(after_time - self.target_time) < abs(before_time - self.target_time)
+            else self.last_event_before
         )
 
 
-def get_game_status_update_event_data(stats_update_events: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Get the late game and end game stats from the stats update events.
-    This is the last event in the stats update events list.
+class GameEventCollector:
+    """Consumes the events of a game one at a time, in order, and keeps only what the extractors need.
+
+    Every `stats_update` snapshot is looked at once, but only the first, the last and the ones nearest
+    the `ExperienceTimers` are kept, so memory does not grow with the length of the game. With a
+    `timeline_step`, the snapshots either side of every multiple of it are kept too.
     """
-    game_status_data = {}
 
-    # only include timers if they are at least 5 mins off the actual game_end time
-    # otherwise just use game_end time since the data won't be drastically different
-    GAME_TIMES = [
-        ExperienceTimers.FIVE_MINS.value,
-        ExperienceTimers.TEN_MINS.value,
-        ExperienceTimers.FIFTEEN_MINS.value,
-    ]
+    def __init__(self, timeline_step: Optional[int] = None):
+        self.game_info_event = None
+        self.first_stats_update_event = None
+        self.last_stats_update_event = None
+        self.last_stats_update_time = None
+        self.num_stats_update_events = 0
+        self.timeline_step = timeline_step
+        # (game time, event) of the snapshots the timeline samples are picked from
+        self.timeline_candidates = []
+        self.nearest_stats_updates = [NearestStatsUpdate(timer.value) for timer in ExperienceTimers]
+        self.first_outer_turret_destroyed_event = None
+        self.first_champion_kill_event = None
+        self.first_baron_event = None
+        # a handful per game, the dragon soul and herald counts need all of them
+        self.dragon_events = []
+        self.herald_events = []
+        self.last_event = None
+
+    def add(self, event: Dict[str, Any]) -> None:
+        event_type = event["eventType"]
+
+        if event_type == STATS_UPDATE:
+            game_time = int(event["gameTime"]) // 1000
+            for nearest_stats_update in self.nearest_stats_updates:
+                nearest_stats_update.add(event, game_time)
+            if self.timeline_step:
+                self.add_timeline_candidate(event, game_time)
+            if self.first_stats_update_event is None:
+                self.first_stats_update_event = event
+            self.last_stats_update_event = event
+            self.last_stats_update_time = game_time
+            self.num_stats_update_events += 1
+        elif event_type == GAME_INFO:
+            if self.game_info_event is None:
+                self.game_info_event = event
+        elif event_type == BUILDING_DESTROYED and event["buildingType"] == TURRET:
+            # outer turrets are first to go, the first one destroyed is all we need
+            if self.first_outer_turret_destroyed_event is None and event["turretTier"] == Turret.OUTER.value:
+                self.first_outer_turret_destroyed_event = event
+        elif event_type == CHAMPION_KILL:
+            if self.first_champion_kill_event is None:
+                self.first_champion_kill_event = event
+        elif event_type == EPIC_MONSTER_KILL:
+            monster_type = event.get("monsterType", "")
+            if monster_type == Monsters.DRAGON.value:
+                self.dragon_events.append(event)
+            elif monster_type == Monsters.BARON.value:
+                if self.first_baron_event is None:
+                    self.first_baron_event = event
+            elif monster_type == Monsters.HERALD.value:
+                self.herald_events.append(event)
+
+        self.last_event = event
+
+    def add_timeline_candidate(self, event: Dict[str, Any], game_time: int) -> None:
+        """The snapshot nearest a sample time is either the last one before it or the first one at or after it,
+        so only the snapshots either side of a multiple of `timeline_step` need to be kept."""
+        if self.last_stats_update_event is None:
+            self.timeline_candidates.append((game_time, event))
+        elif game_time // self.timeline_step > self.last_stats_update_time // self.timeline_step:
+            if self.timeline_candidates[-1][1] is not self.last_stats_update_event:
+                self.timeline_candidates.append((self.last_stats_update_time, self.last_stats_update_event))
+            self.timeline_candidates.append((game_time, event))
+
+    def get_game_event_data(self, mappings_data) -> Dict[str, Any]:
+        """Gets all the relevant information from the collected events."""
+        is_game_info_available = self.game_info_event is not None
+
+        # some LPL games have no game_info events
+        # must fall back to stats_update events
+        if is_game_info_available:
+            game_start = self.game_info_event
+        else:
+            game_start = self.first_stats_update_event
 
-    for time_stamp in GAME_TIMES:
-        event = find_nearest_event(stats_update_events=stats_update_events, target_time=time_stamp)
-        participants_data = event["participants"]
-        teams_data = event["teams"]
+        game_end = self.last_event
+
+        game_info_event_data = {}
+
+        game_info_event_data["game_date"] = game_start["eventTime"].split("T")[0]
+        game_info_event_data["game_duration"] = game_end["gameTime"] // 1000  # ms -> seconds
+        game_info_event_data["game_patch"] = game_start.get("gameVersion", "unknown")
+
+        team_side_data = get_team_side_data(
+            mapping_game_data=mappings_data,
+            game_end_data=game_end,
+        )
+
+        participant_data = get_game_participant_data(
+            game_start["participants"], get_base_info=True, is_game_info_available=is_game_info_available
+        )
+
+        epic_monsters_killed_data = get_epic_monster_kills(
+            dragon_kill_events=self.dragon_events,
+            baron_kill_events=[self.first_baron_event] if self.first_baron_event else [],
+            herald_kill_events=self.herald_events,
+        )
+
+        (
+            game_info_event_data["team_first_turret_destroyed"],
+            game_info_event_data["lane_first_turret_destroyed"],
+        ) = get_team_first_turret_destroyed(
+            turret_destroyed_events=(
+                [self.first_outer_turret_destroyed_event] if self.first_outer_turret_destroyed_event else []
+            )
+        )
+
+        game_info_event_data["team_first_blood"] = get_team_first_blood(
+            champion_kill_events=[self.first_champion_kill_event] if self.first_champion_kill_event else []
+        )
 
-        participant_stats_data = get_game_participant_data(
-            participants_data=participants_data, get_stats_info=True, time_stamp=str(time_stamp)
+        #### Get stats updates
+        # They are always in order of participantID 1-5, 5-10, then repeats
+        # team data is always in order of 100, then 200.
+
+        #### Game stats
+        game_status_update_data = get_game_status_update_event_data(
+            timed_stats_update_events={
+                nearest_stats_update.target_time: nearest_stats_update.get_event(self.num_stats_update_events)
+                for nearest_stats_update in self.nearest_stats_updates
+            },
+            end_game_stats=self.last_stats_update_event,
         )
-        team_stats_data = get_game_team_data(teams_data=teams_data, time_stamp=str(time_stamp))
-        game_status_data.update(participant_stats_data)
-        game_status_data.update(team_stats_data)
+
+        game_event_data = dict(
+            game_info_event_data,
+            **team_side_data,
+            **participant_data,
+            **epic_monsters_killed_data,
+            **game_status_update_data,
+        )
+
+        if self.timeline_step and self.timeline_candidates:
+            if self.timeline_candidates[-1][1] is not self.last_stats_update_event:
+                self.timeline_candidates.append((self.last_stats_update_time, self.last_stats_update_event))
+            game_event_data.update(get_game_timeline_data(self.timeline_candidates, self.timeline_step))
+        return game_event_data
+
+
+def get_game_status_update_event_data(
+    timed_stats_update_events: Dict[int, Dict[str, Any]], end_game_stats: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Get the stats at every `ExperienceTimers` time stamp (nearest `stats_update` event) and the
+    end game stats from the last `stats_update` event.
+    """
+    game_status_data = {}
+
+    for time_stamp, event in timed_stats_update_events.items():
+        game_status_data.update(get_stats_snapshot_data(event, str(time_stamp)))
 
     # last stat update
-    end_game_stats = stats_update_events[-1]
-    participants_data = end_game_stats["participants"]
-    teams_data = end_game_stats["teams"]
+    game_status_data.update(get_stats_snapshot_data(end_game_stats, "game_end"))
+    return game_status_data
+
+
+def get_timeline_stats(event: Dict[str, Any]) -> List[List[int]]:
+    """`TIMELINE_GENERAL_STATS` then `TIMELINE_GAME_STATS` of every participant of a `stats_update` event."""
+    timeline_stats = []
+    for player_info in event["participants"]:
+        player_stats = {stat["name"]: stat["value"] for stat in player_info["stats"]}
+        timeline_stats.append(
+            [int(player_info.get(general_stat, 0)) for general_stat in TIMELINE_GENERAL_STATS]
+            + [int(player_stats.get(game_stat, 0)) for game_stat in TIMELINE_GAME_STATS]
+        )
+    return timeline_stats
+
+
+def get_game_timeline_data(timed_stats_update_events: List[Tuple[int, Dict[str, Any]]], step: int) -> Dict[str, Any]:
+    """Gold, XP and KDA of every participant sampled every `step` seconds, from the `stats_update` event nearest each
+    sample time (the earlier one on a tie), as one list per participant and stat, e.g. `1_100_top_totalGold_timeline`.
+
+    Args:
+        timed_stats_update_events (list): (game time in seconds, event) in game time order, at least the events
+            either side of every sample time (see `GameEventCollector.add_timeline_candidate`).
+    """
+    game_times = np.array([game_time for game_time, _ in timed_stats_update_events])
+    sample_times = np.arange(step, game_times[-1] + 1, step)
+
+    # every sample time is resolved in one search, then the closer of the events either side of it is kept
+    after = np.minimum(np.searchsorted(game_times, sample_times, side="left"), game_times.shape[0] - 1)
+    before = np.maximum(after - 1, 0)
+    nearest = np.where(
+        np.abs(game_times[after] - sample_times) < np.abs(game_times[before] - sample_times), after, before
+    )
 
-    # participant stats collection
-    participant_stats_data = get_game_participant_data(
-        participants_data=participants_data, get_stats_info=True, time_stamp="game_end"
+    participants_data = timed_stats_update_events[0][1]["participants"]
+    event_stats = {
+        index: get_timeline_stats(timed_stats_update_events[index][1]) for index in np.unique(nearest).tolist()
+    }
+    # (sample, participant, stat). A game shorter than one step has no samples, and empty lists
+    timeline_stats = np.array([event_stats[index] for index in nearest.tolist()], dtype=np.int64).reshape(
+        sample_times.shape[0], len(participants_data), len(TIMELINE_GENERAL_STATS) + len(TIMELINE_GAME_STATS)
     )
-    # team stats collection
-    team_stats_data = get_game_team_data(teams_data=teams_data, time_stamp="game_end")
-    end_game_info = dict(participant_stats_data, **team_stats_data)
-    return dict(game_status_data, **end_game_info)
+
+    timeline_data = {"timeline_game_time": sample_times.tolist()}
+    for participant_index, (player_info, role) in enumerate(zip(participants_data, ROLES)):
+        base_key = f"{player_info['participantID']}_{player_info['teamID']}_{role}"
+        for stat_index, stat in enumerate(TIMELINE_GENERAL_STATS + TIMELINE_GAME_STATS):
+            timeline_data[f"{base_key}_{stat}_timeline"] = timeline_stats[:, participant_index, stat_index].tolist()
+    return timeline_data
 
 
 def get_team_first_turret_destroyed(turret_destroyed_events) -> int:
@@ -588,152 +897,266 @@ def get_team_names(red_team_id: str, blue_team_id: str):
 
 
 def get_league_tournaments(league_id: str) -> List[str]:
-    with open(f"{LOL_ESPORTS_DATA_DIR}/leagues.json", "r") as f:
-        leagues_data = json.load(f)
-        for league in leagues_data:
-            if league["id"] == league_id:
-                return [tournament["id"] for tournament in league["tournaments"]]
-
-
-def aggregate_game_data(year: Optional[str] = None, by_tournament_id: Optional[str] = None) -> Tuple[str, str]:
-    with open(f"{LOL_ESPORTS_DATA_DIR}/tournaments.json", "r") as json_file:
-        tournaments_data = json.load(json_file)
-        if by_tournament_id:
-            tournaments_data = [
-                tournament
-                for tournament in tournaments_data
-                if tournament["id"] == by_tournament_id and str(tournament["startDate"]).startswith(year)
-            ]
+    return get_metadata_catalog().get_league_tournament_ids(league_id)
+
+
+def get_tournament_game_work_items(
+    tournament: dict, metadata_catalog: MetadataCatalog
+) -> List[Tuple[str, dict, dict]]:
+    """(platform game id, game mapping, base game info) of every completed game of a tournament, in
+    stage -> section -> match -> game order. This is the unit of work `extract_game_data` handles."""
+    tournament_slug = tournament.get("slug", "")
+    league_id = tournament.get("leagueId", "")
+    tournament_id = tournament.get("id", "")
+    tournament_name = tournament.get("name", "")
+    tournament_start_date = pd.to_datetime(tournament.get("startDate", ""))
+    tournament_end_date = pd.to_datetime(tournament.get("endDate", ""))
+    work_items = []
+
+    # only completed games of completed matches are in the catalog, "unstarted" matches and "unneeded"
+    # games are left out (see `metadata_catalog.get_tournament_tables`)
+    for game in metadata_catalog.get_tournament_games(tournament_id):
+        game_id = game["game_id"]
+        game_data_from_mapping = metadata_catalog.get_game_mapping(game_id)
+        platform_game_id = game_data_from_mapping["platformGameId"] if game_data_from_mapping else None
+        if platform_game_id is None or game["game_number"] is None:
+            print(f"No platform game id for game {game_id}")
+            continue
+
+        base_game_info = {
+            "league_id": league_id,
+            "tournament_id": tournament_id,
+            "tournament_name": tournament_name,
+            "tournament_slug": tournament_slug,
+            "tournament_start_date": tournament_start_date,
+            "tournament_end_date": tournament_end_date,
+            "platform_game_id": platform_game_id,
+            "game_id": game_id,
+            "game_number": game["game_number"],
+            "stage_name": game["stage_name"],
+            "stage_slug": game["stage_slug"],
+            "section_name": game["section_name"],
+        }
+        work_items.append((platform_game_id, game_data_from_mapping, base_game_info))
+
+    return work_items
+
+
+def init_game_extraction_worker():
+    """Process pool initializer, workers need the team mapping `get_team_names` reads. Their game cache leaves
+    eviction and the index to the parent (see `game_cache.GameCache`)."""
+    global team_id_to_info
+    team_id_to_info = get_team_id_to_info_mapping()
+    init_worker_game_cache()
+
+
+def get_extractor_version(timeline_step: Optional[int] = None) -> str:
+    """Extraction cache version of the games extracted with these options."""
+    if timeline_step:
+        return f"{GAME_EXTRACTOR_VERSION}-timeline-{timeline_step}"
+    return str(GAME_EXTRACTOR_VERSION)
+
+
+def extract_game_data(
+    work_item: Tuple[str, dict, dict], timeline_step: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """Downloads (or reads) and extracts one game, None if its data is not available."""
+    platform_game_id, game_data_from_mapping, base_game_info = work_item
+    game_description = (
+        f"tournament: {base_game_info['tournament_name']}, stage: {base_game_info['stage_name']}, "
+        f"game: {base_game_info['game_id']}"
+    )
+    print(f"Processing {game_description}")
+    game_event_data = get_streamed_game_event_data(platform_game_id, game_data_from_mapping, timeline_step)
+
+    if not game_event_data:
+        return None
+
+    print(f"Processing {game_description} - ✅", end="\n\n")
+    return dict(base_game_info, **game_event_data)
+
+
+def get_stored_game_ids(league_id: str, tournament_slug: str) -> set:
+    """game_id of every game already stored for a tournament, empty if it has none yet."""
+    if not has_mapped_games(league_id, tournament_slug):
+        return set()
+    return set(read_mapped_games(league_id, tournament_slug, columns=["game_id"])["game_id"])
 
-    with open(f"{LOL_ESPORTS_DATA_DIR}/mapping_data.json", "r") as json_file:
-        mappings_data = json.load(json_file)
-        mappings = {esports_game["esportsGameId"]: esports_game for esports_game in mappings_data}
+
+def upsert_tournament_games(
+    league_id: str, tournament_slug: str, games_df: pd.DataFrame, export_csv: bool = True
+) -> None:
+    """Adds games to a stored tournament, replacing any stored row with the same game_id, so the same games can
+    be upserted any number of times. The tournament is rewritten atomically (see `mapped_games.write_mapped_games`)
+    so an interrupted run never leaves a partial table behind."""
+    if games_df.empty:
+        return
+    if has_mapped_games(league_id, tournament_slug):
+        stored_df = read_mapped_games(league_id, tournament_slug)
+        games_df = pd.concat([stored_df[~stored_df["game_id"].isin(games_df["game_id"])], games_df], ignore_index=True)
+    games_df.sort_values(by=["game_date", "game_number"], kind="stable", inplace=True, ignore_index=True)
+    write_mapped_games(games_df, league_id, tournament_slug, export_csv)
+
+
+def aggregate_game_data(
+    year: Optional[str] = None,
+    by_tournament_id: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    prefetch: bool = False,
+    fetcher: Optional[GameFetcher] = None,
+    overwrite: bool = False,
+    extraction_cache: Optional[ExtractionCache] = None,
+    incremental: bool = False,
+    checkpoint_every: int = 50,
+    timeline_step: Optional[int] = None,
+    export_csv: bool = True,
+    metadata_catalog: Optional[MetadataCatalog] = None,
+) -> Tuple[str, str]:
+    """Extracts every completed game of a tournament into the mapped games dataset (see `mapped_games.py`).
+
+    Args:
+        max_workers (int, optional): extract games across this many processes. Games are still written in
+            the serial order, so the CSV is the same either way. None or 1 extracts them one at a time.
+        prefetch (bool): download the tournament's missing games into the game cache concurrently (see
+            `game_fetcher.GamePrefetcher`) while earlier games are being extracted.
+        fetcher (GameFetcher, optional): downloader used to prefetch, defaults to the S3 bucket.
+        overwrite (bool): rebuild the tournament even if it is already stored.
+        extraction_cache (ExtractionCache, optional): where extracted games are kept between runs, defaults to
+            `EXTRACTED_GAMES_DIR`. Only games missing from it (or extracted by an older `GAME_EXTRACTOR_VERSION`)
+            are downloaded and extracted again.
+        incremental (bool): when the tournament is stored, only extract the completed games missing from it and
+            upsert them by game_id (see `upsert_tournament_games`), e.g. to pick up games played since the last run.
+        checkpoint_every (int): save the games extracted since the last checkpoint every this many games (see
+            `mapped_games.write_checkpoint_games`), so an interrupted run keeps its progress. The tournament itself
+            is only written once all of its games are extracted, together with those an interrupted run saved.
+        timeline_step (int, optional): also sample each participant's gold, XP and KDA every this many seconds,
+            as list columns (see `get_game_timeline_data`).
+        export_csv (bool): also write the tournament to `mapped-games/<league_id>/<tournament_slug>.csv`.
+        metadata_catalog (MetadataCatalog, optional): tournaments and game mappings, defaults to the process wide
+            catalog so aggregating many tournaments only loads them once.
+    """
+    if metadata_catalog is None:
+        metadata_catalog = get_metadata_catalog()
+    if by_tournament_id:
+        tournament = metadata_catalog.get_tournament(by_tournament_id)
+        tournaments_data = [tournament] if tournament and str(tournament["startDate"]).startswith(year) else []
+    else:
+        tournaments_data = list(metadata_catalog.tournaments.values())
 
     if not tournaments_data:
         print(f"No tournament data for tournament ID: {by_tournament_id}")
         return "", ""
 
+    if extraction_cache is None:
+        extraction_cache = ExtractionCache(version=get_extractor_version(timeline_step))
     for tournament in tournaments_data:
         tournament_slug = tournament.get("slug", "")
         league_id = tournament.get("leagueId", "")
-        if os.path.isfile(f"{CREATED_DATA_DIR}/mapped-games/{league_id}/{tournament_slug}.csv"):
+        is_stored = has_mapped_games(league_id, tournament_slug)
+        is_incremental = incremental and not overwrite and is_stored
+        if not (overwrite or is_incremental) and is_stored:
             return league_id, tournament_slug
-        tournament_id = tournament.get("id", "")
-        tournament_name = tournament.get("name", "")
-        start_date = tournament.get("startDate", "")
-        end_date = tournament.get("endDate", "")
-        tournament_games_df_list = []
-
-        for stage in tournament.get("stages", []):
-            # there are 19 unique stage names
-            stage_name = stage["name"]
-            stage_slug = stage["slug"]
-
-            for section in stage.get("sections", []):
-                # there are 20 unique section names
-                section_name = section["name"]
-
-                for match in section.get("matches", []):
-                    # exclude "unstarted" matches
-                    if match.get("state") == "completed":
-                        # mode is always "classic"
-                        # there are matches with "unstarted" state and so are the games within it
-                        # there are 1327 unstarted matches overall
-                        for game in match.get("games", []):
-                            # some games are "unneeded"
-                            if game.get("state") == "completed":
-                                try:
-                                    game_id = game["id"]
-                                    game_data_from_mapping = mappings[game_id]
-                                    platform_game_id = game_data_from_mapping["platformGameId"]
-                                    game_number = int(game["number"])
-                                except KeyError:
-                                    print(f"No platform game id for game {game_id}")
-                                    continue
-
-                                print(
-                                    f"Processing tournament: {tournament['name']}, stage: {stage_name}, game: {game_id}"
-                                )
-                                retrieved_game_data = get_direct_game_data(platform_game_id)
-
-                                if not retrieved_game_data:
-                                    continue
-
-                                base_game_info = {
-                                    "league_id": league_id,
-                                    "tournament_id": tournament_id,
-                                    "tournament_name": tournament_name,
-                                    "tournament_slug": tournament_slug,
-                                    "tournament_start_date": pd.to_datetime(start_date),
-                                    "tournament_end_date": pd.to_datetime(end_date),
-                                    "platform_game_id": platform_game_id,
-                                    "game_id": game_id,
-                                    "game_number": game_number,
-                                    "stage_name": stage_name,
-                                    "stage_slug": stage_slug,
-                                    "section_name": section_name,
-                                }
-
-                                game_event_data = get_game_event_data(retrieved_game_data, game_data_from_mapping)
-                                all_game_info_data = dict(base_game_info, **game_event_data)
-                                game_df = pd.DataFrame([all_game_info_data])
-                                tournament_games_df_list.append(game_df)
-                                print(
-                                    f"Processing tournament: {tournament['name']}, stage: {stage_name}, game: {game_id} - ✅",
-                                    end="\n\n",
-                                )
-
-        if not os.path.exists(f"{CREATED_DATA_DIR}/mapped-games/{league_id}"):
-            os.makedirs(f"{CREATED_DATA_DIR}/mapped-games/{league_id}")
-        tournament_df = pd.concat(tournament_games_df_list, ignore_index=True)
+
+        tournament_work_items = get_tournament_game_work_items(tournament, metadata_catalog)
+        if is_incremental:
+            stored_game_ids = get_stored_game_ids(league_id, tournament_slug)
+            tournament_work_items = [
+                work_item for work_item in tournament_work_items if work_item[2]["game_id"] not in stored_game_ids
+            ]
+            print(f"{len(stored_game_ids)} games already stored, {len(tournament_work_items)} completed games missing")
+            if not tournament_work_items:
+                return league_id, tournament_slug
+
+        games_data_by_id = {}
+        for platform_game_id, _, base_game_info in tournament_work_items:
+            cached_game_data = extraction_cache.load(platform_game_id)
+            if cached_game_data is not None:
+                # the base game info is cheap to rebuild, so it always reflects the current tournaments.json
+                games_data_by_id[platform_game_id] = dict(cached_game_data, **base_game_info)
+        # games an interrupted run checkpointed, most are in the extraction cache too
+        checkpoint_df = read_checkpoint_games(league_id, tournament_slug, extraction_cache.version)
+        if checkpoint_df is not None:
+            checkpoint_df = checkpoint_df[~checkpoint_df["platform_game_id"].isin(games_data_by_id)]
+        checkpointed_ids = set() if checkpoint_df is None else set(checkpoint_df["platform_game_id"])
+        work_items = [
+            work_item
+            for work_item in tournament_work_items
+            if work_item[0] not in games_data_by_id and work_item[0] not in checkpointed_ids
+        ]
+        num_extracted = len(games_data_by_id) + len(checkpointed_ids)
+        print(f"{num_extracted} games already extracted, extracting {len(work_items)} games")
+
+        with GamePrefetcher(fetcher) as prefetcher:
+            if prefetch:
+                prefetcher.start(platform_game_id for platform_game_id, _, _ in work_items)
+
+            def iter_ready_work_items():
+                # games are handed out in order, each as soon as its download is done
+                for work_item in work_items:
+                    if prefetch:
+                        prefetcher.wait(work_item[0])
+                    yield work_item
+
+            def iter_extracted_games_data():
+                if max_workers and max_workers > 1:
+                    # spawned workers don't inherit the prefetch thread, futures are collected in submission order.
+                    # Only this process evicts from the game cache, never a game the workers are yet to read
+                    game_cache = get_game_cache()
+                    with game_cache.pinned(work_item[0] for work_item in work_items), ProcessPoolExecutor(
+                        max_workers=max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=init_game_extraction_worker,
+                    ) as executor:
+                        futures = [
+                            executor.submit(extract_game_data, work_item, timeline_step)
+                            for work_item in iter_ready_work_items()
+                        ]
+                        for work_item, future in zip(work_items, futures):
+                            game_data = future.result()
+                            game_cache.touch(work_item[0])
+                            yield work_item[0], game_data
+                    # games the workers downloaded themselves count towards the budget from here
+                    game_cache.evict()
+                else:
+                    for work_item in iter_ready_work_items():
+                        yield work_item[0], extract_game_data(work_item, timeline_step)
+
+            new_games_data = []
+            for platform_game_id, game_data in iter_extracted_games_data():
+                if game_data:
+                    extraction_cache.put(platform_game_id, game_data)
+                    games_data_by_id[platform_game_id] = game_data
+                    new_games_data.append(game_data)
+                    if len(new_games_data) == checkpoint_every:
+                        write_checkpoint_games(
+                            GameTableBuilder().extend(new_games_data).to_frame(),
+                            league_id,
+                            tournament_slug,
+                            extraction_cache.version,
+                        )
+                        new_games_data = []
+
+        game_table_builder = GameTableBuilder(capacity=max(len(games_data_by_id), 1))
+        for platform_game_id, _, _ in tournament_work_items:
+            if platform_game_id in games_data_by_id:
+                game_table_builder.append(games_data_by_id[platform_game_id])
+        tournament_df = game_table_builder.to_frame()
+        if checkpointed_ids:
+            tournament_df = pd.concat([tournament_df, checkpoint_df], ignore_index=True)
+
+        if is_incremental:
+            upsert_tournament_games(league_id, tournament_slug, tournament_df, export_csv)
+            clear_checkpoint_games(league_id, tournament_slug)
+            print(f"Added {len(tournament_df)} games to league: {league_id} tournament: {tournament_slug} ✅")
+            return league_id, tournament_slug
+
         tournament_df.sort_values(by=["game_date", "game_number"], inplace=True)
-        tournament_df.to_csv(f"{CREATED_DATA_DIR}/mapped-games/{league_id}/{tournament_slug}.csv", index=False)
+        write_mapped_games(tournament_df, league_id, tournament_slug, export_csv)
+        clear_checkpoint_games(league_id, tournament_slug)
         print(f"Completed processing league: {league_id} tournament: {tournament_slug} ✅", end="\n------------\n\n")
         return league_id, tournament_slug
 
 
-def calculate_champion_stats_for_role(data, col, side):
-    role_stats = {}
-    for _, row in data.iterrows():
-        champ = row[col]
-        winner = row["game_winner"]
-        if champ not in role_stats:
-            role_stats[champ] = {"games_played": 0, "games_won": 0}
-        role_stats[champ]["games_played"] += 1
-        if winner == side:
-            role_stats[champ]["games_won"] += 1
-
-    role_data = []
-    for champ, stats in role_stats.items():
-        frequency = stats["games_played"]
-        win_rate = (stats["games_won"] / stats["games_played"]) * 100
-        role_data.append({champ: frequency, "winRate": win_rate})
-
-    # sort by frequency
-    role_data = sorted(role_data, key=lambda x: list(x.values())[0], reverse=True)
-    return role_data
-
-
-def get_champion_occurrences_from_aggregate_tournament(league_id: str, tournament_slug: str) -> None:
-    # f"{CREATED_DATA_DIR}/mapped-games/109518549825754242/nacl_qualifiers_2_summer_2023.csv"
-    # if os.path.exists(f"{CREATED_DATA_DIR}/mapped-games/{league_id}/{tournament_slug}_champion_mapping.json"):
-    #     return
-
-    tournament_df = pd.read_csv(f"{CREATED_DATA_DIR}/mapped-games/{league_id}/{tournament_slug}.csv")
-    champion_mapping = {"100": {}, "200": {}}
-
-    for blue_col in BLUE_CHAMPION_COLUMNS:
-        role = blue_col.split("_")[2]
-        champion_mapping["100"][role] = calculate_champion_stats_for_role(tournament_df, blue_col, 100)
-    for red_col in RED_CHAMPION_COLUMNS:
-        role = red_col.split("_")[2]
-        champion_mapping["200"][role] = calculate_champion_stats_for_role(tournament_df, red_col, 200)
-
-    # Save the champion mapping dictionary as a JSON file
-    with open(f"{CREATED_DATA_DIR}/mapped-games/{league_id}/{tournament_slug}_champion_mapping.json", "w") as file:
-        json.dump(champion_mapping, file)
-
-
 def concatenate_csv_files(directory_path, output_file) -> None:
     """
     Concatenate all .csv files in a directory with games from 2023 into a single CSV file.
@@ -774,24 +1197,78 @@ def concatenate_csv_files(directory_path, output_file) -> None:
     print(f"All CSV files concatenated and saved to {output_file}")
 
 
-def get_num_rows_to_swap(tournament_df: pd.DataFrame):
-    rows_to_swap = set()
-    for index, row in tournament_df.iterrows():
-        blue_team_code = get_team_code_from_id(str(row["team_100_blue_id"]))
-        red_team_code = get_team_code_from_id(str(row["team_200_red_id"]))
+def get_team_codes(team_ids: pd.Series, team_id_to_info: Dict[str, dict]) -> pd.Series:
+    """Team code of each team id, "Unknown" for teams missing from `team_id_to_info` (see
+    `get_team_id_to_info_mapping`)."""
+    team_codes = pd.Series(
+        {team_id: team_info.get("team_code", "Unknown") for team_id, team_info in team_id_to_info.items()}, dtype=object
+    )
+    return team_ids.astype(str).map(team_codes).fillna("Unknown")
+
+
+def starts_with_codes(names: pd.Series, codes: pd.Series) -> pd.Series:
+    """Whether each name starts with the code on the same row, compared one code length at a time. Missing names
+    never match."""
+    is_match = pd.Series(False, index=names.index)
+    code_lengths = codes.str.len()
+    for code_length in code_lengths.unique():
+        rows = code_lengths == code_length
+        is_match[rows] = (names[rows].str.slice(0, code_length) == codes[rows]).to_numpy()
+    return is_match
 
-        # Check if player summoner names start with the respective team codes
-        if not (
-            row["1_100_top_summonerName"].startswith(blue_team_code)
-            and row["2_100_jng_summonerName"].startswith(blue_team_code)
-        ):
-            rows_to_swap.add(index)
-        elif not (
-            row["6_200_top_summonerName"].startswith(red_team_code)
-            and row["7_200_jng_summonerName"].startswith(red_team_code)
-        ):
-            rows_to_swap.add(index)
-    return rows_to_swap
+
+def get_side_check(tournament_df: pd.DataFrame, team_id_to_info: Dict[str, dict]) -> Tuple[pd.Series, pd.Series]:
+    """(is_inconsistent, is_swapped) of every game.
+
+    A game is inconsistent when the summoner names of a side do not start with the code of that side's team. Most
+    of those are teams whose players kept an old tag, only games whose blue players carry the red team's code and
+    red players the blue team's are swapped: the mapping data put the teams on the wrong sides.
+    """
+    blue_codes = get_team_codes(tournament_df[BLUE_TEAM_COLUMNS[0]], team_id_to_info)
+    red_codes = get_team_codes(tournament_df[RED_TEAM_COLUMNS[0]], team_id_to_info)
+
+    def is_side_of(columns: List[str], codes: pd.Series) -> pd.Series:
+        is_match = pd.Series(True, index=tournament_df.index)
+        for column in columns:
+            is_match &= starts_with_codes(tournament_df[column], codes)
+        return is_match
+
+    is_inconsistent = ~(is_side_of(BLUE_SIDE_CHECK_COLUMNS, blue_codes) & is_side_of(RED_SIDE_CHECK_COLUMNS, red_codes))
+    is_swapped = is_side_of(BLUE_SIDE_CHECK_COLUMNS, red_codes) & is_side_of(RED_SIDE_CHECK_COLUMNS, blue_codes)
+    return is_inconsistent, is_inconsistent & is_swapped
+
+
+def swap_sides(tournament_df: pd.DataFrame, rows: pd.Series) -> None:
+    """Swaps the blue and red teams of the given rows in place, all columns at once."""
+    side_columns = BLUE_TEAM_COLUMNS + RED_TEAM_COLUMNS
+    tournament_df.loc[rows, side_columns] = tournament_df.loc[rows, RED_TEAM_COLUMNS + BLUE_TEAM_COLUMNS].to_numpy()
+
+
+def correct_swapped_sides(export_csv: bool = True) -> int:
+    """Ingest stage swapping back the teams of every game the mapping data put on the wrong sides (see
+    `get_side_check`). The check runs once over the few columns it needs from every stored tournament, and only
+    tournaments with swapped games are rewritten. Returns the number of games corrected."""
+    check_columns = ["game_id"] + BLUE_TEAM_COLUMNS[:1] + RED_TEAM_COLUMNS[:1]
+    check_columns += BLUE_SIDE_CHECK_COLUMNS + RED_SIDE_CHECK_COLUMNS
+    tournament_dfs = {
+        (league_id, tournament_slug): read_mapped_games(league_id, tournament_slug, columns=check_columns)
+        for league_id, tournament_slug in get_stored_tournaments()
+        # LPL games have no summoner names to check
+        if set(check_columns) <= set(get_mapped_games_columns(league_id, tournament_slug))
+    }
+    if not tournament_dfs:
+        return 0
+    games_df = pd.concat(tournament_dfs, names=["league_id", "tournament_slug", None])
+    is_inconsistent, is_swapped = get_side_check(games_df, get_team_id_to_info_mapping())
+    print(f"{is_inconsistent.sum()} of {games_df.shape[0]} games have players not matching their team's code")
+
+    swapped_games_df = games_df[is_swapped].reset_index(level=[0, 1])
+    for (league_id, tournament_slug), swapped_game_ids in swapped_games_df.groupby(["league_id", "tournament_slug"]):
+        tournament_df = read_mapped_games(league_id, tournament_slug)
+        swap_sides(tournament_df, tournament_df["game_id"].isin(swapped_game_ids["game_id"]))
+        write_mapped_games(tournament_df, league_id, tournament_slug, export_csv)
+        print(f"Swapped the sides of {swapped_game_ids.shape[0]} games in {league_id}/{tournament_slug}")
+    return swapped_games_df.shape[0]
 
 
 def delete_games_directory(games_dir: str):
@@ -802,10 +1279,6 @@ def delete_games_directory(games_dir: str):
         print(f"Error: {e}")
 
 
-def get_team_code_from_id(team_id):
-    return team_id_to_info.get(str(team_id), {}).get("team_code", "Unknown")
-
-
 if __name__ == "__main__":
     #### Setup base https://www.youtube.com/watch?v=gapSIdUT8Us
     tournament_to_slug_mapping = get_tournament_to_stage_slug_mapping()
@@ -871,14 +1344,19 @@ if __name__ == "__main__":
     for league_id in specific_leagues:
         league_tournaments = get_league_tournaments(league_id=league_id)
         print(f"Total tournaments: {len(league_tournaments)}")
-        count = 0
+        aggregated_tournaments = []
         for tournament_id in league_tournaments:
+            # opt in with max_workers=os.cpu_count(), prefetch=True and incremental=True
             league_id, tournament_slug = aggregate_game_data(by_tournament_id=tournament_id, year="2023")
             if league_id and tournament_slug:
-                count += 1
-                get_champion_occurrences_from_aggregate_tournament(league_id=league_id, tournament_slug=tournament_slug)
+                aggregated_tournaments.append((league_id, tournament_slug))
             # delete_games_directory(GAMES_DIR)
-        print(f"Total tournaments processed: {count}/{len(league_tournaments)}")
+        print(f"Total tournaments processed: {len(aggregated_tournaments)}/{len(league_tournaments)}")
+        if aggregated_tournaments:
+            update_champion_stats(aggregated_tournaments)
+
+    #### Swap back the teams the mapping data put on the wrong sides
+    correct_swapped_sides()
 
     #### Concatenate all CSV files
     # concatenate_csv_files(
@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
+
+from constants import ROLES, TIMELINE_GAME_STATS, TIMELINE_GENERAL_STATS  # noqa: E402
+from utils import get_game_timeline_data  # noqa: E402
+
+
+def get_stats_update_event(total_gold: int) -> dict:
+    return {
+        "participants": [
+            {
+                "participantID": participant_id,
+                "teamID": 100 if participant_id <= 5 else 200,
+                **{stat: total_gold for stat in TIMELINE_GENERAL_STATS},
+                "stats": [{"name": stat, "value": 1} for stat in TIMELINE_GAME_STATS],
+            }
+            for participant_id in range(1, 11)
+        ]
+    }
+
+
+def test_game_shorter_than_one_step_has_empty_timelines():
+    timeline_data = get_game_timeline_data([(30, get_stats_update_event(500)), (45, get_stats_update_event(600))], 60)
+
+    assert timeline_data["timeline_game_time"] == []
+    assert len(timeline_data) == 1 + len(ROLES) * len(TIMELINE_GENERAL_STATS + TIMELINE_GAME_STATS)
+    assert all(values == [] for values in timeline_data.values())
+
+
+def test_samples_take_the_nearest_stats_update():
+    timeline_data = get_game_timeline_data([(55, get_stats_update_event(500)), (70, get_stats_update_event(600))], 60)
+
+    assert timeline_data["timeline_game_time"] == [60]
+    assert timeline_data[f"1_100_top_{TIMELINE_GENERAL_STATS[0]}_timeline"] == [500]
@@ -1,39 +1,112 @@
 import asyncio
 import csv
-import gzip
 import json
 import os
-import shutil
+import sys
 import time
-from io import BytesIO
-from typing import Optional
+import zlib
+from typing import Dict, Optional
 
 import aiohttp
 
-S3_BUCKET_URL = "https://power-rankings-dataset-gprhack.s3.us-west-2.amazonaws.com"
-
-
-async def download_gzip_and_write_to_json(session, remote_file_name: str, local_file_name: Optional[str] = None):
-    # If file already exists locally do not re-download game
-    if os.path.isfile(f"{local_file_name}.json"):
-        return
-
-    async with session.get(f"{S3_BUCKET_URL}/{remote_file_name}.json.gz") as response:
-        print(response)
-        if response.status == 200:
-            try:
-                gzip_bytes = BytesIO(await response.read())
-                with gzip.GzipFile(fileobj=gzip_bytes, mode="rb") as gzipped_file:
-                    with open(f"{local_file_name}.json", "wb") as output_file:
-                        shutil.copyfileobj(gzipped_file, output_file)
-                print(f"{local_file_name}.json written")
-            except Exception as e:
-                print("Error:", e)
-        else:
-            print(f"Failed to download {remote_file_name}")
-
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from game_cache import GameCache  # noqa: E402
+from game_fetcher import RETRY_STATUSES, GameFetcher  # noqa: E402
 
-async def download_esports_files(session):
+S3_BUCKET_URL = "https://power-rankings-dataset-gprhack.s3.us-west-2.amazonaws.com"
+MANIFEST_FILE = "download-manifest.json"
+
+
+class DownloadManifest:
+    """Completed and failed downloads of a directory, kept in a JSON file so an interrupted run can resume
+    and a finished one can be checked. `completed` maps each file to its size on disk, `failed` to the reason
+    it could not be downloaded. Failed files are tried again on the next run."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.completed: Dict[str, int] = {}
+        self.failed: Dict[str, str] = {}
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                manifest = json.load(f)
+            self.completed, self.failed = manifest["completed"], manifest["failed"]
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self.completed.values())
+
+    def set_completed(self, name: str, num_bytes: int) -> None:
+        self.completed[name] = num_bytes
+        self.failed.pop(name, None)
+
+    def set_failed(self, name: str, reason: str) -> None:
+        self.failed[name] = reason
+        self.completed.pop(name, None)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump({"completed": self.completed, "failed": self.failed, "total_bytes": self.total_bytes}, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+async def download_gzip_and_write_to_json(
+    session: aiohttp.ClientSession,
+    remote_file_name: str,
+    local_file_name: str,
+    manifest: Optional[DownloadManifest] = None,
+    max_retries: int = 3,
+    backoff_seconds: float = 0.5,
+    chunk_size: int = 1 << 16,
+) -> bool:
+    """Downloads `<remote_file_name>.json.gz` to `<local_file_name>.json`, decompressing chunk by chunk as the
+    response arrives. The file only appears once it is complete. Returns whether the file is available locally."""
+    local_path = f"{local_file_name}.json"
+    # If file already exists locally do not re-download it
+    if os.path.isfile(local_path):
+        return True
+
+    reason = "not attempted"
+    for attempt in range(max_retries + 1):
+        if attempt:
+            await asyncio.sleep(backoff_seconds * 2 ** (attempt - 1))
+        try:
+            async with session.get(f"{S3_BUCKET_URL}/{remote_file_name}.json.gz") as response:
+                if response.status in RETRY_STATUSES:
+                    reason = f"HTTP {response.status}"
+                    print(f"{remote_file_name} - {reason}, attempt {attempt + 1}")
+                    continue
+                if response.status != 200:
+                    reason = f"HTTP {response.status}"
+                    break
+
+                # 16 + MAX_WBITS: expect a gzip header
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                with open(f"{local_path}.tmp", "wb") as output_file:
+                    async for chunk in response.content.iter_chunked(chunk_size):
+                        output_file.write(decompressor.decompress(chunk))
+                    output_file.write(decompressor.flush())
+                if not decompressor.eof:
+                    raise zlib.error("truncated gzip stream")
+            os.replace(f"{local_path}.tmp", local_path)
+            if manifest is not None:
+                manifest.set_completed(remote_file_name, os.path.getsize(local_path))
+            print(f"{local_path} written")
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError, zlib.error) as e:
+            reason = repr(e)
+            print(f"{remote_file_name} - download failed, attempt {attempt + 1}: {reason}")
+        finally:
+            if os.path.exists(f"{local_path}.tmp"):
+                os.remove(f"{local_path}.tmp")
+
+    print(f"Failed to download {remote_file_name}: {reason}")
+    if manifest is not None:
+        manifest.set_failed(remote_file_name, reason)
+    return False
+
+
+async def download_esports_files(session: aiohttp.ClientSession):
     local_directory = "lol-esports-data"
     remote_directory = "esports-data"
     if not os.path.exists(local_directory):
@@ -49,25 +122,24 @@ async def download_esports_files(session):
         "unfiltered_players",
         "unfiltered_teams",
     ]
+    manifest = DownloadManifest(f"{local_directory}/{MANIFEST_FILE}")
     tasks = [
-        download_gzip_and_write_to_json(session, f"{remote_directory}/{file_name}", f"{local_directory}/{file_name}")
+        download_gzip_and_write_to_json(
+            session, f"{remote_directory}/{file_name}", f"{local_directory}/{file_name}", manifest
+        )
         for file_name in esports_data_files
     ]
     await asyncio.gather(*tasks)
+    manifest.save()
 
 
-async def download_games(session, year: int, num_games: Optional[int] = None):
-    start_time = time.time()
-
-    directory = "games"
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
+def get_game_download_plan(year: int, num_games: Optional[int] = None) -> list:
+    """Platform ids of the completed games of a year, in mapping file order."""
     # use games that have completed and have an actual winner
     # filter by year, for 2023, len = 7855
     with open("esports-data/tournament-game-data.csv", "r") as csv_file:
         reader = csv.DictReader(csv_file)
-        completed_game_ids = [row["game_id"] for row in reader if row.get("startDate", "").startswith(str(year))]
+        completed_game_ids = {row["game_id"] for row in reader if row.get("startDate", "").startswith(str(year))}
 
     print(f"Completed Game IDs: {len(completed_game_ids)}")
     mappings = {}
@@ -80,41 +152,66 @@ async def download_games(session, year: int, num_games: Optional[int] = None):
             if row["esportsGameId"] in completed_game_ids:
                 mappings[row["esportsGameId"]] = row["platformGameId"]
 
+    return list(dict.fromkeys(mappings.values()))[:num_games]
+
+
+async def download_games(year: int, num_games: Optional[int] = None, max_concurrency: int = 32):
+    """Downloads the completed games of a year into the game cache. Up to `max_concurrency` downloads run at
+    once, each streamed to disk (see app/game_fetcher.py), and `games/download-manifest.json` records which
+    games completed or failed and their size. An interrupted run resumes with the games still missing."""
+    start_time = time.time()
+
+    # games are kept gzipped in the size bounded game cache, see app/game_cache.py
+    game_cache = GameCache("games")
+    manifest = DownloadManifest(f"games/{MANIFEST_FILE}")
+
+    platform_ids = get_game_download_plan(year, num_games)
+    # games already in the cache are not downloaded again
+    missing_platform_ids = []
+    for platform_id in platform_ids:
+        if platform_id in game_cache:
+            manifest.set_completed(platform_id, os.path.getsize(game_cache.get_path(platform_id)))
+        else:
+            missing_platform_ids.append(platform_id)
+    print(
+        f"{len(platform_ids) - len(missing_platform_ids)} games already downloaded, "
+        f"{len(missing_platform_ids)} to download ({len(manifest.failed)} failed last run)"
+    )
+    total_games = len(missing_platform_ids)
     game_counter = 0
-    total_games = len(mappings)
-    tasks = []
 
-    for platform_id in mappings.values():
-        tasks.append(
-            download_gzip_and_write_to_json(session, f"{directory}/{platform_id}", f"{directory}/{platform_id}")
-        )
+    def on_done(platform_id: str, is_cached: bool):
+        nonlocal game_counter
         game_counter += 1
-
-        if game_counter % 10 == 0:
-            await asyncio.gather(*tasks)
-            tasks = []  # Resetting tasks list after awaiting
-            print(
-                f"----- Processed {game_counter} games/{total_games}, current run time: \
-                {round((time.time() - start_time)/60, 2)} minutes"
-            )
-        if game_counter == num_games:
+        if is_cached:
+            manifest.set_completed(platform_id, os.path.getsize(game_cache.get_path(platform_id)))
+        else:
+            manifest.set_failed(platform_id, "download failed")
+        if game_counter % 100 == 0:
+            manifest.save()
             print(
-                f"----- Processed {game_counter} games, total run time: \
-            {round((time.time() - start_time)/60, 2)} minutes"
+                f"----- Processed {game_counter} games/{total_games}, {manifest.total_bytes / 1024 ** 2:.1f} MB, "
+                f"current run time: {round((time.time() - start_time)/60, 2)} minutes"
             )
-            print("----- Downloading completed")
-            print("----- Exiting...")
-            return
 
-    if tasks:
-        await asyncio.gather(*tasks)
+    fetcher = GameFetcher(base_url=f"{S3_BUCKET_URL}/games", game_cache=game_cache, max_concurrency=max_concurrency)
+    try:
+        await fetcher.download_games(missing_platform_ids, on_done)
+    finally:
+        manifest.save()
+    print(
+        f"----- Processed {game_counter} games, {len(manifest.failed)} failed, total run time: "
+        f"{round((time.time() - start_time)/60, 2)} minutes"
+    )
+    print("----- Downloading completed")
 
 
 async def main():
     connector = aiohttp.TCPConnector(limit=5)
-    async with aiohttp.ClientSession(connector=connector) as session:
+    # the .gz files are decompressed while they are written, the session must not undo a gzip encoding itself
+    async with aiohttp.ClientSession(connector=connector, auto_decompress=False) as session:
         await download_esports_files(session)
-        # await download_games(session, 2023)
+    # await download_games(2023)
 
 
 if __name__ == "__main__":
@@ -1,26 +1,25 @@
 import asyncio
-import concurrent.futures
 import gzip
 import json
 import os
+import sys
 from io import StringIO
 
 import aiofiles
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from event_store import convert_games  # noqa: E402
+
 # Games manipulator
 GAMES_DIR = "games"
-TARGET_DIR = "games-parquet"
 ESPORTS_DIR = "esports-data/lol-esports-data"
 
 
-def convert_game_files_to_parquet():
-    json_files = [f for f in os.listdir(GAMES_DIR) if f.endswith(".json")]
-    for file in json_files:
-        df = pd.read_json(file)
-        target_file = os.path.join(TARGET_DIR, os.path.splitext(file)[0] + ".parquet")
-        df.to_parquet(target_file, engine="pyarrow")
-        print(f"Converted {file} to Parquet.")
+def convert_game_files_to_parquet(max_workers: int = os.cpu_count(), overwrite: bool = False):
+    """Flattens every game on disk into the event level tables of app/event_store.py, across a process pool, and
+    compacts them into one file per table. Games already converted are skipped unless `overwrite`."""
+    convert_games(max_workers=max_workers, overwrite=overwrite)
 
 
 def convert_data_files_to_parquet():
@@ -71,13 +70,8 @@ async def convert_csv_to_parquet(csv_file, parquet_file):
 
 
 def main():
-    gzip_to_json("games/ESPORTSTMNT03 3195276.json.gz", "games/ESPORTSTMNT03:3195276.json")
-    # Get list of JSON files
-    # json_files = [f for f in os.listdir(GAMES_DIR) if f.endswith('.json')]
-
-    # # Convert files concurrently
-    # with concurrent.futures.ProcessPoolExecutor(max_workers=8) as executor:
-    #     executor.map(convert_to_parquet, json_files)
+    # gzip_to_json("games/ESPORTSTMNT03 3195276.json.gz", "games/ESPORTSTMNT03:3195276.json")
+    convert_game_files_to_parquet()
 
 
 # async def main():